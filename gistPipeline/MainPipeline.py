@@ -9,6 +9,8 @@
 
 import os
 
+# Worker processes use a single thread each. The serial parts of the modules
+# raise the number of threads with _auxiliary.serialThreads.
 os.environ["MKL_NUM_THREADS"] = "1"
 os.environ["NUMEXPR_NUM_THREADS"] = "1"
 os.environ["OMP_NUM_THREADS"] = "1"
@@ -33,7 +35,7 @@ matplotlib.use("pdf")
 from printStatus import printStatus
 
 from gistPipeline._version import __version__
-from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.auxiliary import _auxiliary, _prefetch
 from gistPipeline.emissionLines import _emissionLines
 from gistPipeline.initialise import _initialise
 from gistPipeline.lineStrengths import _lineStrengths
@@ -83,6 +85,11 @@ def runGIST(dirPath, galindex):
     # Setup logfile
     _initialise.setupLogfile(config)
     sys.excepthook = _initialise.handleUncaughtException
+    logging.info(
+        "Using "
+        + str(config["GENERAL"].get("NTHREADS", config["GENERAL"]["NCPU"]))
+        + " threads in the serial parts of the modules"
+    )
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     # - - - - - - - -  P R E P A R A T I O N   M O D U L E S  - - - - - - - - - - -
@@ -90,28 +97,32 @@ def runGIST(dirPath, galindex):
 
     # - - - - - READ_DATA MODULE - - - - -
 
-    cube = _readData.readData_Module(config)
+    with _auxiliary.serialThreads(config):
+        cube = _readData.readData_Module(config)
     if cube == "SKIP":
         skipGalaxy(config)
         return None
 
     # - - - - - SPATIAL MASKING MODULE - - - - -
 
-    _ = _spatialMasking.spatialMasking_Module(config, cube)
+    with _auxiliary.serialThreads(config):
+        _ = _spatialMasking.spatialMasking_Module(config, cube)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
 
     # - - - - - SPATIAL BINNING MODULE - - - - -
 
-    _ = _spatialBinning.spatialBinning_Module(config, cube)
+    with _auxiliary.serialThreads(config):
+        _ = _spatialBinning.spatialBinning_Module(config, cube)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
 
     # - - - - - PREPARE SPECTRA MODULE - - - - -
 
-    _ = _prepareSpectra.prepareSpectra_Module(config, cube)
+    with _auxiliary.serialThreads(config):
+        _ = _prepareSpectra.prepareSpectra_Module(config, cube)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
@@ -122,35 +133,45 @@ def runGIST(dirPath, galindex):
 
     # - - - - - STELLAR KINEMATICS MODULE - - - - -
 
-    _ = _stellarKinematics.stellarKinematics_Module(config)
+    _prefetch.startModule(config, "KIN")
+    with _auxiliary.serialThreads(config):
+        _ = _stellarKinematics.stellarKinematics_Module(config)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
 
     # - - - - - CONTINUUM CUBE MODULE - - - - -
 
-    _ = _continuumCube.continuumCube_Module(config)
+    _prefetch.startModule(config, "CONT")
+    with _auxiliary.serialThreads(config):
+        _ = _continuumCube.continuumCube_Module(config)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
 
     # - - - - - EMISSION LINES MODULE - - - - -
 
-    _ = _emissionLines.emissionLines_Module(config)
+    _prefetch.startModule(config, "GAS")
+    with _auxiliary.serialThreads(config):
+        _ = _emissionLines.emissionLines_Module(config)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
 
     # - - - - - STAR FORMATION HISTORIES MODULE - - - - -
 
-    _ = _starFormationHistories.starFormationHistories_Module(config)
+    _prefetch.startModule(config, "SFH")
+    with _auxiliary.serialThreads(config):
+        _ = _starFormationHistories.starFormationHistories_Module(config)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
 
     # - - - - - LINE STRENGTHS MODULE - - - - -
 
-    _ = _lineStrengths.lineStrengths_Module(config)
+    _prefetch.startModule(config, "LS")
+    with _auxiliary.serialThreads(config):
+        _ = _lineStrengths.lineStrengths_Module(config)
     if _ == "SKIP":
         skipGalaxy(config)
         return None
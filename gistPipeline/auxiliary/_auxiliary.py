@@ -1,10 +1,12 @@
 import glob
+import hashlib
 import os
 import sys
 
 import numpy as np
 from astropy.io import fits
 from scipy.interpolate import interp1d
+from threadpoolctl import threadpool_limits
 
 from gistPipeline._version import __version__
 
@@ -175,6 +177,32 @@ def addGISTHeaderComment(config):
     return None
 
 
+def inputHash(*items):
+    """
+    Returns a checksum of the given arrays and values. This is saved to the
+    header of the outputs of a module, in order to recognise reruns with
+    identical input.
+    """
+    checksum = hashlib.sha1()
+    for item in items:
+        if isinstance(item, np.ndarray):
+            checksum.update(str((item.dtype.str, item.shape)).encode())
+            checksum.update(np.ascontiguousarray(item).data)
+        else:
+            checksum.update(repr(item).encode())
+    return checksum.hexdigest()
+
+
+def readHash(file, keyword):
+    """
+    Returns the checksum saved as keyword in the primary header of file, or
+    None if the file or keyword does not exist.
+    """
+    if os.path.isfile(file) == False:
+        return None
+    return fits.getheader(file, ext=0).get(keyword)
+
+
 def saveConfigToHeader(hdu, config):
     """
     Save the used section of the MasterConfig file to the header of the output data.
@@ -182,3 +210,24 @@ def saveConfigToHeader(hdu, config):
     for i in config.keys():
         hdu.header[i] = config[i]
     return hdu
+
+
+def serialThreads(config):
+    """
+    Sets the number of threads of the BLAS and OpenMP libraries for the serial
+    parts of a module (e.g. the fit of the combined spectrum, the preparation
+    of the templates, or the computation of maps) to GENERAL|NTHREADS, by
+    default the number of cores NCPU. Use as a context manager around a module.
+    """
+    nthreads = config["GENERAL"].get("NTHREADS", config["GENERAL"]["NCPU"])
+    return threadpool_limits(limits=int(nthreads))
+
+
+def workerThreads():
+    """
+    Sets the number of threads of the BLAS and OpenMP libraries to one. Worker
+    processes inherit this setting if they are started within this context
+    manager, so that the parallelised parts of a module use one process per
+    core, with a single thread each.
+    """
+    return threadpool_limits(limits=1)
@@ -0,0 +1,277 @@
+import logging
+import os
+import threading
+
+from astropy.io import fits
+
+"""
+PURPOSE:
+  Prefetching of the inputs of the analysis modules. While a module is running,
+  the input files of the next enabled module are read into memory and its
+  spectral templates are prepared in a background thread. The next module then
+  takes over the ready arrays instead of reading and preparing them itself.
+  Prefetched files are only handed over if they have not been modified since
+  they were read. Inputs which are not taken over by the module they were
+  prefetched for are discarded when the next module starts.
+
+  Prefetching is switched on with GENERAL|PREFETCH. It keeps a second copy of
+  the prefetched files (e.g. _BinSpectra.fits) and of the templates in memory
+  until they are taken over.
+"""
+
+# Analysis modules in the order in which they are run
+MODULES = ["KIN", "CONT", "GAS", "SFH", "LS"]
+
+# Prefixes of the output files of the analysis modules. These files are never
+# prefetched while the module is running.
+OUTPUTS = {
+    "KIN": ["_kin"],
+    "CONT": ["_kin", "_CONTcube", "_ORIGcube", "_LINEcube"],
+    "GAS": ["_gas"],
+    "SFH": ["_sfh"],
+    "LS": ["_ls"],
+}
+
+THREAD_NAME = "gistPrefetch"
+
+_lock = threading.Lock()
+_cache = {}
+_active = None
+
+
+class PrefetchedInput:
+    """
+    An input which is prefetched in the background. value is None until the
+    input is ready, or if prefetching it failed.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.stat = None
+        self.value = None
+        self.ready = threading.Event()
+
+
+def fileStat(filename):
+    stat = os.stat(filename)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def outputFile(config, suffix):
+    return (
+        os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"]) + suffix
+    )
+
+
+def nextModule(config, module):
+    """
+    Returns the first enabled analysis module which is run after module.
+    """
+    for following in MODULES[MODULES.index(module) + 1 :]:
+        if following in config and config[following]["METHOD"] != False:
+            return following
+    return None
+
+
+def inputFiles(config, module):
+    """
+    Returns the suffixes of the files which are read by module. The
+    _AllSpectra.fits file is never prefetched, as it is as large as the cube.
+    """
+    if module == "CONT":
+        return ["_BinSpectra.fits"]
+    if module == "GAS":
+        files = ["_kin.fits", "_table.fits"]
+        if config["GAS"]["LEVEL"] in ["BIN", "BOTH"]:
+            files.insert(0, "_BinSpectra.fits")
+        if config["GAS"]["LEVEL"] in ["SPAXEL", "BOTH"]:
+            files.append("_mask.fits")
+        return files
+    if module == "SFH":
+        cleaned = "_gas-cleaned_" + config["GAS"]["LEVEL"] + ".fits"
+        if os.path.isfile(outputFile(config, cleaned)) or config["GAS"]["METHOD"] != False:
+            files = [cleaned]
+        else:
+            files = ["_BinSpectra.fits"]
+        if config["SFH"]["FIXED"] == True:
+            files.append("_kin.fits")
+        return files
+    if module == "LS":
+        files = ["_BinSpectra.fits", "_kin.fits"]
+        if os.path.isfile(outputFile(config, "_ls-cleaned_linear.fits")):
+            files = ["_ls-cleaned_linear.fits", "_kin.fits"]
+        elif os.path.isfile(outputFile(config, "_gas-cleaned_BIN.fits")) or (
+            config["GAS"]["METHOD"] != False and config["GAS"]["LEVEL"] in ["BIN", "BOTH"]
+        ):
+            files.insert(0, "_gas-cleaned_BIN.fits")
+        return files
+    return []
+
+
+def templateArguments(config, module):
+    """
+    Returns the arguments lmin, lmax, velscale and sortInGrid with which module
+    prepares its spectral templates, or None if module does not use the
+    template library.
+    """
+    if module not in ["CONT", "GAS", "SFH"]:
+        return None
+    velscale = fits.getheader(outputFile(config, "_BinSpectra.fits"))["VELSCALE"]
+    return (
+        config[module]["LMIN"],
+        config[module]["LMAX"],
+        velscale / 2,
+        module == "SFH",
+    )
+
+
+def readFits(filename):
+    """
+    Reads all HDUs of filename into memory.
+    """
+    hdul = fits.open(filename, memmap=False, lazy_load_hdus=False)
+    for hdu in hdul:
+        hdu.data
+    hdul.close()
+    return hdul
+
+
+def prefetch(config, module, files, templates):
+    """
+    Reads the files and prepares the templates of module. Runs in the
+    background thread.
+    """
+    from gistPipeline.auxiliary import _auxiliary
+    from gistPipeline.prepareTemplates import _prepareTemplates
+
+    for entry in files:
+        try:
+            entry.stat = fileStat(entry.filename)
+            entry.value = readFits(entry.filename)
+        except BaseException as e:
+            logging.info("Prefetching " + entry.filename + " failed: " + str(e))
+        entry.ready.set()
+
+    if templates is not None:
+        key, entry = templates
+        try:
+            LSF_Data, LSF_Templates = _auxiliary.getLSF(config, module)
+            lmin, lmax, velscale, sortInGrid = key[1:]
+            result = _prepareTemplates.prepareTemplates_Module(
+                config,
+                lmin,
+                lmax,
+                velscale,
+                LSF_Data,
+                LSF_Templates,
+                module,
+                sortInGrid=sortInGrid,
+                quiet=True,
+            )
+            if not isinstance(result, str):
+                entry.value = result
+        except BaseException as e:
+            logging.info("Prefetching the templates of " + module + " failed: " + str(e))
+        entry.ready.set()
+
+    logging.info("Prefetched the inputs of the " + module + " module")
+
+
+def startModule(config, module):
+    """
+    Called by the stage runner before module is run. Discards the prefetched
+    inputs which have not been taken over by the previous module and starts
+    prefetching the inputs of the next enabled module in the background.
+    """
+    global _active
+
+    with _lock:
+        for key in [key for key in _cache if key[0] != module]:
+            del _cache[key]
+        _active = module
+
+    following = nextModule(config, module)
+    if following is None or config["GENERAL"].get("PREFETCH", False) == False:
+        return None
+
+    # Do not prefetch the files which module is about to write
+    files = []
+    with _lock:
+        for suffix in inputFiles(config, following):
+            filename = outputFile(config, suffix)
+            if any(suffix.startswith(prefix) for prefix in OUTPUTS[module]):
+                continue
+            if not os.path.isfile(filename) or (following, filename) in _cache:
+                continue
+            entry = PrefetchedInput(filename)
+            _cache[(following, filename)] = entry
+            files.append(entry)
+
+    templates = None
+    try:
+        arguments = templateArguments(config, following)
+    except Exception:
+        arguments = None
+    if arguments is not None:
+        key = (following,) + arguments
+        entry = PrefetchedInput()
+        with _lock:
+            _cache[key] = entry
+        templates = (key, entry)
+
+    if len(files) == 0 and templates is None:
+        return None
+
+    logging.info("Prefetching the inputs of the " + following + " module")
+    thread = threading.Thread(
+        target=prefetch,
+        args=(config, following, files, templates),
+        name=THREAD_NAME,
+        daemon=True,
+    )
+    thread.start()
+    return None
+
+
+def take(key):
+    """
+    Removes the prefetched input key of the running module from the cache
+    and returns it once it is ready. Returns None if the input has not been
+    prefetched.
+    """
+    if threading.current_thread().name == THREAD_NAME:
+        return None
+    with _lock:
+        entry = _cache.pop((_active,) + key, None)
+    if entry is None:
+        return None
+    entry.ready.wait()
+    return entry
+
+
+def openFits(filename):
+    """
+    Returns the HDUList of filename. If the file has been prefetched for the
+    running module and has not been modified since, the HDUList in memory is
+    handed over. Otherwise the file is opened with fits.open.
+    """
+    entry = take((filename,))
+    if entry is not None and entry.value is not None:
+        if os.path.isfile(filename) and fileStat(filename) == entry.stat:
+            logging.info("Using prefetched " + filename)
+            return entry.value
+        logging.info("Discarding prefetched " + filename + " as it has been modified")
+    return fits.open(filename)
+
+
+def takeTemplates(module, lmin, lmax, velscale, sortInGrid):
+    """
+    Returns the spectral templates prepared in the background for module with
+    the given arguments, or None if they have not been prefetched.
+    """
+    if module != _active:
+        return None
+    entry = take((lmin, lmax, velscale, sortInGrid))
+    if entry is None:
+        return None
+    return entry.value
@@ -0,0 +1,122 @@
+import logging
+import time
+
+import numpy as np
+from printStatus import printStatus
+
+"""
+PURPOSE:
+  Progress reporting of the fits of the analysis modules. The results of the
+  worker processes arrive in the parent process, which counts them with a
+  Progress instance. The progress bar in the terminal shows the throughput, the
+  estimated remaining time and the number of failed fits, and is updated at
+  most every PRINT_INTERVAL seconds. Every LOG_INTERVAL seconds, a record of
+  the progress is written to the LOGFILE, so that the throughput of a running
+  analysis can also be monitored there.
+"""
+
+# Minimum time between two updates of the progress bar [s]
+PRINT_INTERVAL = 0.5
+
+# Time between two progress records in the LOGFILE [s]
+LOG_INTERVAL = 60.0
+
+
+def failedFit(value, flag=np.nan):
+    """
+    Returns True if value is the scalar flag (np.nan by default), which the
+    run-functions of the modules return instead of their results if the fit
+    failed.
+    """
+    if not np.isscalar(value):
+        return False
+    if np.isnan(flag):
+        return bool(np.isnan(value))
+    return value == flag
+
+
+def formatTime(seconds):
+    if not np.isfinite(seconds):
+        return "--:--:--"
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def formatRate(rate, unit):
+    """
+    Formats the throughput as e.g. "12.3 bins/s", or as "33.3 s/bin" for slow
+    fits which take more than a second each.
+    """
+    if rate >= 1 or rate <= 0:
+        return "%.1f %s/s" % (rate, unit)
+    return "%.1f s/%s" % (1 / rate, unit[:-1] if unit.endswith("s") else unit)
+
+
+class Progress:
+    """
+    Progress of the fit of total bins (or spaxels) in the routine label. Call
+    update() for every result that arrives, and close() when all results have
+    been received.
+    """
+
+    def __init__(self, label, total, unit="bins"):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.failed = 0
+        self.start = time.time()
+        self.lastPrint = -np.inf
+        self.lastLog = self.start
+
+    def status(self):
+        elapsed = time.time() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else np.inf
+        return "%s, ETA %s, %d failed" % (
+            formatRate(rate, self.unit),
+            formatTime(eta),
+            self.failed,
+        )
+
+    def update(self, n=1, failed=0):
+        """
+        Adds n received results, failed of which are failed fits.
+        """
+        self.done += n
+        self.failed += failed
+        now = time.time()
+        if now - self.lastPrint >= PRINT_INTERVAL or self.done >= self.total:
+            printStatus.progressBar(
+                self.done, self.total, suffix=self.status(), barLength=50
+            )
+            self.lastPrint = now
+        if now - self.lastLog >= LOG_INTERVAL:
+            logging.info(
+                self.label
+                + ": "
+                + str(self.done)
+                + "/"
+                + str(self.total)
+                + " "
+                + self.unit
+                + " done, "
+                + self.status()
+            )
+            self.lastLog = now
+
+    def close(self):
+        elapsed = time.time() - self.start
+        logging.info(
+            self.label
+            + ": "
+            + str(self.done)
+            + " "
+            + self.unit
+            + " done in %.2fs (%s), %d failed"
+            % (
+                elapsed,
+                formatRate(self.done / elapsed if elapsed > 0 else 0.0, self.unit),
+                self.failed,
+            )
+        )
@@ -10,7 +10,7 @@ from multiprocess import Process, Queue
 from ppxf.ppxf import ppxf
 from printStatus import printStatus
 
-from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.auxiliary import _auxiliary, _prefetch, _progress
 from gistPipeline.prepareTemplates import _prepareTemplates
 
 # PHYSICAL CONSTANTS
@@ -139,8 +139,6 @@ def run_ppxf(
     ui.adsabs.harvard.edu/?#abs/2017MNRAS.466..798C), in order to determine the
     stellar kinematics.
     """
-    printStatus.progressBar(i, nbins, barLength=50)
-
     try:
         # Call PPXF for first time to get optimal template
         if len(optimal_template_in) == 1:
@@ -560,7 +558,7 @@ def createContinuumCube(config):
     saves the outputs following the GIST conventions.
     """
     # Read data from file
-    hdu = fits.open(
+    hdu = _prefetch.openFits(
         os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
         + "_BinSpectra.fits"
     )
@@ -699,6 +697,7 @@ def createContinuumCube(config):
     # ====================
     # Run PPXF
     start_time = time.time()
+    progress = _progress.Progress("Running PPXF", nbins)
     if config["GENERAL"]["PARALLEL"] == True:
         printStatus.running("Running PPXF in parallel mode")
         logging.info("Running PPXF in parallel mode")
@@ -713,9 +712,10 @@ def createContinuumCube(config):
             for _ in range(config["GENERAL"]["NCPU"])
         ]
 
-        # Start worker processes
-        for p in ps:
-            p.start()
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
 
         # Fill the queue
         for i in range(nbins):
@@ -742,7 +742,10 @@ def createContinuumCube(config):
             )
 
         # now get the results with indices
-        ppxf_tmp = [outQueue.get() for _ in range(nbins)]
+        ppxf_tmp = []
+        for _ in range(nbins):
+            ppxf_tmp.append(outQueue.get())
+            progress.update(failed=_progress.failedFit(ppxf_tmp[-1][1]))
 
         # send stop signal to stop iteration
         for _ in range(config["GENERAL"]["NCPU"]):
@@ -808,7 +811,9 @@ def createContinuumCube(config):
                 i,
                 optimal_template_comb,
             )
+            progress.update(failed=_progress.failedFit(ppxf_result[i, 0]))
         printStatus.updateDone("Running PPXF in serial mode", progressbar=True)
+    progress.close()
 
     print(
         "             Running PPXF on %s spectra took %.2fs using %i cores"
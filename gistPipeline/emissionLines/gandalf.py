@@ -8,9 +8,10 @@ from astropy.table import Table
 from multiprocess import Process, Queue
 from printStatus import printStatus
 
-from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.auxiliary import _auxiliary, _prefetch, _progress
 from gistPipeline.emissionLines.pyGandalf import gandalf_util as gandalf
 from gistPipeline.prepareTemplates import _prepareTemplates
+from gistPipeline.writeFITS import stream_fits
 
 # PHYSICAL CONSTANTS
 C = np.float64(299792.458)  # km/s
@@ -38,8 +39,8 @@ def workerGANDALF(inQueue, outQueue):
         templates,
         logLam_galaxy,
         logLam_template,
-        emi_file,
-        redshift,
+        goodpixels,
+        emission_setup,
         velscale,
         int_disp,
         reddening,
@@ -50,8 +51,8 @@ def workerGANDALF(inQueue, outQueue):
         i,
         nbins,
         npix,
-        config,
         maskedSpaxel,
+        fitOptions,
     ) in iter(inQueue.get, "STOP"):
         weights, emission_templates, bestfit, sol, esol = run_gandalf(
             spectra,
@@ -60,8 +61,8 @@ def workerGANDALF(inQueue, outQueue):
             templates,
             logLam_galaxy,
             logLam_template,
-            emi_file,
-            redshift,
+            goodpixels,
+            emission_setup,
             velscale,
             int_disp,
             reddening,
@@ -72,8 +73,8 @@ def workerGANDALF(inQueue, outQueue):
             i,
             nbins,
             npix,
-            config,
             maskedSpaxel,
+            fitOptions,
         )
 
         outQueue.put((i, weights, emission_templates, bestfit, sol, esol))
@@ -86,8 +87,8 @@ def run_gandalf(
     templates,
     logLam_galaxy,
     logLam_template,
-    emi_file,
-    redshift,
+    goodpixels,
+    emission_setup,
     velscale,
     int_disp,
     reddening,
@@ -98,15 +99,16 @@ def run_gandalf(
     i,
     nbins,
     npix,
-    config,
     maskedSpaxel,
+    fitOptions,
 ):
     """
     Calls the pyGandALF routine (ui.adsabs.harvard.edu/?#abs/2006MNRAS.366.1151S;
     ui.adsabs.harvard.edu/abs/2006MNRAS.369..529F; ui.adsabs.harvard.edu/abs/2019arXiv190604746B)
+    with the options of the selected flavour of the fit (fitOptions). The
+    goodpixels and the emission-line setup (see compactEmissionSetup) are
+    prepared once for all bins.
     """
-    printStatus.progressBar(i, nbins, barLength=50)
-
     # Leave this hardcoded here!
     plot = False
     degree = -1
@@ -115,14 +117,8 @@ def run_gandalf(
 
     if maskedSpaxel == False:
         try:
-            # Get goodpixels and emission_setup
-            goodpixels, emission_setup = getGoodpixelsEmissionSetup(
-                config, redshift, velscale, logLam_galaxy, logLam_template, npix
-            )
-
             # Initial guess on velocity: Use value relative to stellar kinematics
-            for itm in np.arange(len(emission_setup)):
-                emission_setup[itm].v = emission_setup[itm].v + stellar_kin[0]
+            emission_setup = expandEmissionSetup(emission_setup, stellar_kin[0])
 
             # Run GANDALF
             weights, emission_templates, bestfit, sol, esol = gandalf.gandalf(
@@ -146,6 +142,7 @@ def run_gandalf(
                 for_errors,
                 velscale_ratio,
                 offset,
+                **fitOptions,
             )
 
             return [weights, emission_templates, bestfit, sol, esol]
@@ -539,16 +536,17 @@ def getGoodpixelsEmissionSetup(
     """
     # Read in emission-line setup file
     eml_file = os.path.join(config["GENERAL"]["CONFIG_DIR"], config["GAS"]["EMI_FILE"])
-    eml_i = np.genfromtxt(eml_file, dtype="int", usecols=(0), comments="#")
-    eml_name = np.genfromtxt(eml_file, dtype="str", usecols=(1), comments="#")
-    eml_lambda = np.genfromtxt(eml_file, dtype="float", usecols=(2), comments="#")
-    eml_action = np.genfromtxt(eml_file, dtype="str", usecols=(3), comments="#")
-    eml_kind = np.genfromtxt(eml_file, dtype="str", usecols=(4), comments="#")
-    eml_a = np.genfromtxt(eml_file, dtype="float", usecols=(5), comments="#")
-    eml_v = np.genfromtxt(eml_file, dtype="int", usecols=(6), comments="#")
-    eml_s = np.genfromtxt(eml_file, dtype="int", usecols=(7), comments="#")
-    eml_fit = np.genfromtxt(eml_file, dtype="str", usecols=(8), comments="#")
-    eml_aon = np.genfromtxt(eml_file, dtype="int", usecols=(9), comments="#")
+    eml = np.genfromtxt(eml_file, dtype="str", usecols=range(10), comments="#", ndmin=2)
+    eml_i = eml[:, 0].astype("int")
+    eml_name = eml[:, 1]
+    eml_lambda = eml[:, 2].astype("float")
+    eml_action = eml[:, 3]
+    eml_kind = eml[:, 4]
+    eml_a = eml[:, 5].astype("float")
+    eml_v = eml[:, 6].astype("int")
+    eml_s = eml[:, 7].astype("int")
+    eml_fit = eml[:, 8]
+    eml_aon = eml[:, 9].astype("int")
 
     emission_setup = gandalf.load_emission_setup_new(
         np.vstack(
@@ -593,13 +591,412 @@ def getGoodpixelsEmissionSetup(
     return (goodpixels, emission_setup)
 
 
-def performEmissionLineAnalysis(config):
+def compactEmissionSetup(emission_setup):
+    """
+    Returns the emission_setup structure as a tuple of tuples. This is
+    immutable and cheap to send to the worker processes, which create their
+    own EmissionSetup instances from it with expandEmissionSetup.
+    """
+    return tuple(
+        (line.i, line.name, line._lambda, line.action, line.kind, line.a, line.v, line.s, line.fit, line.aon)
+        for line in emission_setup
+    )
+
+
+def expandEmissionSetup(emission_setup, velocity):
+    """
+    Creates the emission_setup structure of one bin from its compact form,
+    with the initial guess on the velocity relative to the stellar velocity.
+    """
+    emission_setup = [gandalf.EmissionSetup(*line) for line in emission_setup]
+    for line in emission_setup:
+        line.v = line.v + velocity
+    return emission_setup
+
+
+def readSpaxelSpectra(allSpectra, block, idx_lam, magpi):
+    """
+    Reads the spectra of the spaxels in block from the table HDU allSpectra of
+    _AllSpectra.fits, restricted to the spectral pixels idx_lam. For MAGPI, the
+    errors are read as well, otherwise None is returned as error.
+    """
+    rows = stream_fits.readRows(allSpectra, block)
+    spectra = np.array(rows["SPEC"].T)[idx_lam, :]
+    error = None
+    if magpi:
+        error = np.sqrt(np.array(rows["ESPEC"].T))[idx_lam, :]
+    return spectra, error
+
+
+def fitSpaxelBlock(
+    block,
+    spectra,
+    error,
+    stellar_kin,
+    templates,
+    n_templates,
+    fitArgs,
+    nbins,
+    npix,
+    maskedSpaxel,
+    fitOptions,
+    progress,
+    inQueue=None,
+    outQueue=None,
+):
+    """
+    Runs pyGandALF on the spaxels of block, using the worker processes
+    attached to inQueue and outQueue if these are given. fitArgs are the
+    arguments of run_gandalf which are the same for all spaxels. If n_templates
+    is 1, templates contains the optimal template of every spaxel of the block.
+    Every result that arrives is counted in progress. Returns the output of
+    run_gandalf for every spaxel.
+    """
+    nblock = spectra.shape[1]
+    items = [
+        (
+            spectra[:, k],
+            error[:, k],
+            stellar_kin[k, :],
+            templates if n_templates > 1 else templates[[k], :].T,
+            *fitArgs,
+            block.start + k,
+            nbins,
+            npix,
+            maskedSpaxel[k],
+            fitOptions,
+        )
+        for k in range(nblock)
+    ]
+
+    if inQueue is None:
+        results = []
+        for item in items:
+            results.append(run_gandalf(*item))
+            progress.update(failed=_progress.failedFit(results[-1][0], flag=-1))
+        return results
+
+    for item in items:
+        inQueue.put(item)
+    results = [None] * nblock
+    for _ in range(nblock):
+        i, *result = outQueue.get()
+        results[i - block.start] = result
+        progress.update(failed=_progress.failedFit(result[0], flag=-1))
+    return results
+
+
+def streamSpaxelLevel(
+    config,
+    allSpectra,
+    idx_lam,
+    magpi,
+    dereddening_attenuation,
+    maskedSpaxel,
+    stellar_kin,
+    binIndex,
+    templates,
+    n_templates,
+    fitArgs,
+    fitOptions,
+    npix,
+    nlines,
+    emission_setup,
+    logLam_galaxy,
+    goodpixels,
+    reddening,
+    reddening_length_sol,
+    reddening_length_esol,
+    for_errors,
+):
+    """
+    Runs the emission-line analysis on SPAXEL level in blocks of GAS|BLOCKSIZE
+    spaxels, so that the required memory does not depend on the size of the
+    cube. Each block is read from _AllSpectra.fits and fitted, and its rows of
+    the output files are written before the next block is read. The solutions
+    are buffered on disk, as the columns of _gas_SPAXEL.fits depend on all
+    spaxels. The output files are the same as those of save_gandalf.
+    """
+    blocksize = config["GAS"]["BLOCKSIZE"]
+    nbins = allSpectra.header["NAXIS2"]
+    outputPrefix = os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
+    saveWeights = config["GAS"]["LEVEL"] == "SPAXEL"
+
+    def saveConfig(hdu):
+        return _auxiliary.saveConfigToHeader(hdu, config["GAS"])
+
+    # Get AoN thresholds from emission_setup
+    AoN_thresholds = np.zeros(nlines)
+    o = 0
+    for itm in np.arange(len(emission_setup)):
+        if emission_setup[itm].action == "f" and emission_setup[itm].kind == "l":
+            AoN_thresholds[o] = emission_setup[itm].aon
+            o = o + 1
+    idx_l = gandalf.where_eq(emission_setup, "kind", "l")
+
+    # Create the output files, the rows of which are written block by block
+    cols = [fits.Column(name="LOGLAM", format="D", array=logLam_galaxy)]
+    logLamHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
+    logLamHDU.name = "LOGLAM"
+    cols = [fits.Column(name="GOODPIX", format="J", array=goodpixels)]
+    goodpixHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
+    goodpixHDU.name = "GOODPIX"
+
+    outputs = {
+        "_gas-bestfit_SPAXEL.fits": [
+            stream_fits.StreamedTable([("BESTFIT", str(npix) + "D")], nbins, "BESTFIT"),
+            logLamHDU,
+            goodpixHDU,
+        ],
+        "_gas-emission_SPAXEL.fits": [
+            stream_fits.StreamedTable([("EMISSION", str(npix) + "D")], nbins, "EMISSION")
+        ],
+        "_gas-cleaned_SPAXEL.fits": [
+            stream_fits.StreamedTable(
+                [("SPEC", str(npix) + "D")], nbins, "CLEANED_SPECTRA"
+            ),
+            logLamHDU,
+        ],
+    }
+    if saveWeights:
+        outputs["_gas-weights_SPAXEL.fits"] = [
+            stream_fits.StreamedTable(
+                [("NWEIGHTS", str(n_templates) + "D")], nbins, "NWEIGHTS"
+            ),
+            stream_fits.StreamedTable([("EWEIGHTS", str(nlines) + "D")], nbins, "EWEIGHTS"),
+        ]
+    tables = {}
+    for filename, hdus in outputs.items():
+        hdus = [saveConfig(hdu) for hdu in [fits.PrimaryHDU()] + hdus]
+        for table in stream_fits.createFits(outputPrefix + filename, hdus):
+            tables[table.columns[0][0]] = table
+
+    # Buffer of the solutions
+    bufferFile = outputPrefix + "_gas-buffer_SPAXEL.fits"
+    (buffer,) = stream_fits.createFits(
+        bufferFile,
+        [
+            fits.PrimaryHDU(),
+            stream_fits.StreamedTable(
+                [
+                    ("SOL", str(nlines * 4 + reddening_length_sol) + "D"),
+                    ("ESOL", str(nlines * 4 + reddening_length_esol) + "D"),
+                    ("AON", str(nlines) + "D"),
+                ],
+                nbins,
+            ),
+        ],
+    )
+
+    # ========================
+    # Run GANDALF
+    start_time = time.time()
+    progress = _progress.Progress("Running GANDALF", nbins, unit="spaxels")
+    inQueue = outQueue = None
+    if config["GENERAL"]["PARALLEL"] == True:
+        printStatus.running("Running GANDALF in parallel mode")
+        logging.info(
+            "Running GANDALF in parallel mode in blocks of %i spaxels" % blocksize
+        )
+
+        # Create Queues
+        inQueue = Queue()
+        outQueue = Queue()
+
+        # Create worker processes, which are used for all blocks
+        ps = [
+            Process(target=workerGANDALF, args=(inQueue, outQueue))
+            for _ in range(config["GENERAL"]["NCPU"])
+        ]
+
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
+    else:
+        printStatus.running("Running GANDALF in serial mode")
+        logging.info("Running GANDALF in serial mode in blocks of %i spaxels" % blocksize)
+
+    idx_error = []
+    anyAoN = np.zeros(nlines, dtype=bool)
+    for start in range(0, nbins, blocksize):
+        block = slice(start, min(start + blocksize, nbins))
+        nblock = block.stop - block.start
+
+        # Read and deredden the spectra of the block
+        spectra, error = readSpaxelSpectra(allSpectra, block, idx_lam, magpi)
+        if not magpi:
+            error = np.ones((npix, nblock))
+        if dereddening_attenuation is not None:
+            spectra = spectra * dereddening_attenuation[:, np.newaxis]
+
+        # Run GANDALF on the block
+        results = fitSpaxelBlock(
+            block,
+            spectra,
+            error,
+            stellar_kin[binIndex[block], :],
+            templates[:, binIndex[block]].T if n_templates == 1 else templates,
+            n_templates,
+            fitArgs,
+            nbins,
+            npix,
+            maskedSpaxel[block],
+            fitOptions,
+            progress,
+            inQueue,
+            outQueue,
+        )
+        weights = np.zeros((nblock, n_templates + nlines))
+        emission_templates = np.zeros((nblock, nlines, npix))
+        bestfit = np.zeros((nblock, npix))
+        sol = np.zeros((nblock, nlines * 4 + reddening_length_sol))
+        esol = np.zeros((nblock, nlines * 4 + reddening_length_esol))
+        for k, result in enumerate(results):
+            (
+                weights[k, :],
+                emission_templates[k, :, :],
+                bestfit[k, :],
+                sol[k, :],
+                esol[k, :],
+            ) = result
+        idx_error.extend(start + np.where(bestfit[:, 0] == -1)[0])
+
+        # Calculate emission-subtracted spectra using a AoN threshold
+        emission_templates = np.transpose(emission_templates, (0, 2, 1))
+        sol_gas_AoN = np.zeros((nblock, nlines))
+        cleaned_spectrum = np.zeros((nblock, npix))
+        for k in range(nblock):
+            sol_gas_A = sol[k, np.arange(len(idx_l)) * 4 + 1]
+            sol_gas_AoN[k, :], cleaned_spectrum[k, :] = gandalf.remouve_detected_emission(
+                spectra[:, k],
+                bestfit[k, :],
+                emission_templates[k, :, :],
+                sol_gas_A,
+                AoN_thresholds,
+                None,
+            )
+        anyAoN |= np.any(sol_gas_AoN, axis=0)
+
+        # Write the rows of the block
+        tables["BESTFIT"].write(block, BESTFIT=bestfit)
+        tables["EMISSION"].write(block, EMISSION=np.sum(emission_templates, axis=2))
+        tables["SPEC"].write(block, SPEC=cleaned_spectrum)
+        if saveWeights:
+            nweights = np.zeros((nblock, n_templates))
+            for k in range(nblock):
+                nweights[k, :] = weights[k, :n_templates] / np.sum(weights[k, :n_templates])
+            tables["NWEIGHTS"].write(block, NWEIGHTS=nweights)
+            tables["EWEIGHTS"].write(block, EWEIGHTS=weights[:, n_templates:])
+        buffer.write(block, SOL=sol, ESOL=esol, AON=sol_gas_AoN)
+
+    if config["GENERAL"]["PARALLEL"] == True:
+        # send stop signal to stop iteration
+        for _ in range(config["GENERAL"]["NCPU"]):
+            inQueue.put("STOP")
+
+        # stop processes
+        for p in ps:
+            p.join()
+
+        printStatus.updateDone("Running GANDALF in parallel mode", progressbar=True)
+    else:
+        printStatus.updateDone("Running GANDALF in serial mode", progressbar=True)
+    progress.close()
+
+    print(
+        "             Running GANDALF on %s spectra took %.2fs using %i cores"
+        % (nbins, time.time() - start_time, config["GENERAL"]["NCPU"])
+    )
+    logging.info(
+        "Running GANDALF on %s spectra took %.2fs using %i cores"
+        % (nbins, time.time() - start_time, config["GENERAL"]["NCPU"])
+    )
+    for filename in outputs:
+        logging.info("Wrote: " + outputPrefix + filename)
+
+    # Check for exceptions which occurred during the analysis
+    idx_error = np.array(idx_error, dtype=int)
+    if len(idx_error) != 0:
+        printStatus.warning(
+            "There was a problem in the analysis of the spectra with the following BINID's: "
+        )
+        print("             " + str(idx_error))
+        logging.warning(
+            "There was a problem in the analysis of the spectra with the following BINID's: "
+            + str(idx_error)
+        )
+    else:
+        print("             " + "There were no problems in the analysis.")
+        logging.info("There were no problems in the analysis.")
+    print("")
+
+    # ========================
+    # SAVE RESULTS
+    outfits = outputPrefix + "_gas_SPAXEL.fits"
+    printStatus.running("Writing: " + config["GENERAL"]["RUN_ID"] + "_gas_SPAXEL.fits")
+
+    # Columns of the data and error HDUs, with the buffered solution they are copied from
+    dataColumns = []
+    errorColumns = []
+    for i in range(len(idx_l)):
+        if anyAoN[i]:
+            name = str(emission_setup[idx_l[i]].name) + "_" + str(emission_setup[idx_l[i]]._lambda)
+            dataColumns += [
+                (name + "_F", "SOL", i * 4 + 0),
+                (name + "_A", "SOL", i * 4 + 1),
+                (name + "_V", "SOL", i * 4 + 2),
+                (name + "_S", "SOL", i * 4 + 3),
+                (name + "_AON", "AON", i),
+            ]
+            if for_errors:
+                errorColumns += [
+                    (name + "_FERR", "ESOL", i * 4 + 0),
+                    (name + "_AERR", "ESOL", i * 4 + 1),
+                    (name + "_VERR", "ESOL", i * 4 + 2),
+                    (name + "_SERR", "ESOL", i * 4 + 3),
+                ]
+    if reddening != None:
+        dataColumns += [("EBmV_0", "SOL", len(idx_l) * 4), ("EBmV_1", "SOL", len(idx_l) * 4 + 1)]
+        if for_errors:
+            errorColumns += [
+                ("EBmVERR_0", "ESOL", len(idx_l) * 4),
+                ("EBmVERR_1", "ESOL", len(idx_l) * 4 + 1),
+            ]
+    hduColumns = [dataColumns, errorColumns] if for_errors else [dataColumns]
+
+    hdus = [fits.PrimaryHDU()] + [
+        stream_fits.StreamedTable([(name, "D") for name, _, _ in columns], nbins)
+        for columns in hduColumns
+    ]
+    resultTables = stream_fits.createFits(outfits, [saveConfig(hdu) for hdu in hdus])
+    with fits.open(bufferFile) as hdu:
+        for start in range(0, nbins, blocksize):
+            block = slice(start, start + blocksize)
+            solutions = stream_fits.readRows(hdu[1], block)
+            for columns, table in zip(hduColumns, resultTables):
+                if len(columns) > 0:
+                    table.write(
+                        block,
+                        **{name: solutions[sol][:, col] for name, sol, col in columns},
+                    )
+    os.remove(bufferFile)
+
+    printStatus.updateDone("Writing: " + config["GENERAL"]["RUN_ID"] + "_gas_SPAXEL.fits")
+    logging.info("Wrote: " + outfits)
+
+
+def performEmissionLineAnalysis(config, magpi=False):
     """
     Starts the emission-line analysis. Input data is read from file on either
     bin or spaxel level. The LSF is loaded and spectra can be de-reddened for
     Galactic extinction in the direction of the target. Spectral pixels and
     emission-lines considered in the fit are determined. After the pyGandALF
     fit, emission-subtracted spectral are calculated. Results are saved to disk.
+
+    If magpi is set, the MAGPI flavour of the fit is used: the spectra are
+    weighted by their errors, no uncertainties are derived on bin level and
+    the options of pyGandALF are set to gandalf.MAGPI_OPTIONS.
     """
 
     #    # Check if the error estimation in pyGandalf is turned off
@@ -639,20 +1036,36 @@ def performEmissionLineAnalysis(config):
     ):
         currentLevel = "SPAXEL"
 
+    # On SPAXEL level, the spectra can be analysed in blocks of BLOCKSIZE spaxels
+    streaming = currentLevel == "SPAXEL" and config["GAS"].get("BLOCKSIZE", 0) > 0
+
     # Oversample the templates by a factor of two
     velscale_ratio = 2
 
+    # Options of the pyGandALF fit
+    fitOptions = dict(gandalf.MAGPI_OPTIONS) if magpi else {}
+    fitOptions["linear_solver"] = config["GAS"].get("LINEAR_SOLVER", "nnls")
+    if fitOptions["linear_solver"] not in gandalf.LINEAR_SOLVERS:
+        message = "Configuration parameter GAS|LINEAR_SOLVER has to be one of {}.".format(
+            ", ".join("'" + solver + "'" for solver in gandalf.LINEAR_SOLVERS)
+        )
+        printStatus.failed(message)
+        logging.error(message)
+        raise Exception(message)
+
     # Read LSF information
     LSF_Data, LSF_Templates = _auxiliary.getLSF(config, "GAS")
 
     # Read data if we run on BIN level
     if currentLevel == "BIN":
         # Read spectra from file
-        hdu = fits.open(
+        hdu = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_BinSpectra.fits"
         )
         spectra = np.array(hdu[1].data.SPEC.T)
+        if magpi:
+            error = np.array(hdu[1].data.ESPEC.T)
         logLam_galaxy = np.array(hdu[2].data.LOGLAM)
         idx_lam = np.where(
             np.logical_and(
@@ -661,6 +1074,8 @@ def performEmissionLineAnalysis(config):
             )
         )[0]
         spectra = spectra[idx_lam, :]
+        if magpi:
+            error = error[idx_lam, :]
         logLam_galaxy = logLam_galaxy[idx_lam]
         npix = spectra.shape[0]
         nbins = spectra.shape[1]
@@ -691,10 +1106,11 @@ def performEmissionLineAnalysis(config):
         templates = templates.reshape((templates.shape[0], n_templates))
 
         offset = (logLam_template[0] - logLam_galaxy[0]) * C  # km/s
-        error = np.ones((npix, nbins))
+        if not magpi:
+            error = np.ones((npix, nbins))
 
         # Read stellar kinematics from file
-        ppxf = fits.open(
+        ppxf = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_kin.fits"
         )[1].data
@@ -704,8 +1120,9 @@ def performEmissionLineAnalysis(config):
         stellar_kin[:, 2] = np.array(ppxf.H3)
         stellar_kin[:, 3] = np.array(ppxf.H4)
 
-        # Rename to keep the code clean
-        for_errors = config["GAS"]["ERRORS"]
+        # Rename to keep the code clean. MAGPI does not derive uncertainties on
+        # bin level.
+        for_errors = 0 if magpi else config["GAS"]["ERRORS"]
 
     # Read data if we run on SPAXEL level
     elif currentLevel == "SPAXEL":
@@ -714,7 +1131,7 @@ def performEmissionLineAnalysis(config):
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_AllSpectra.fits"
         )
-        spectra = np.array(hdu[1].data.SPEC.T)
+        allSpectra = hdu[1]
         logLam_galaxy = np.array(hdu[2].data.LOGLAM)
         idx_lam = np.where(
             np.logical_and(
@@ -722,14 +1139,15 @@ def performEmissionLineAnalysis(config):
                 np.exp(logLam_galaxy) < config["GAS"]["LMAX"],
             )
         )[0]
-        spectra = spectra[idx_lam, :]
+        if not streaming:
+            spectra, error = readSpaxelSpectra(allSpectra, slice(None), idx_lam, magpi)
         logLam_galaxy = logLam_galaxy[idx_lam]
-        npix = spectra.shape[0]
-        nbins = spectra.shape[1]
+        npix = len(idx_lam)
+        nbins = allSpectra.header["NAXIS2"]
         velscale = hdu[0].header["VELSCALE"]
 
         # Construct mask for defunct spaxels
-        mask = fits.open(
+        mask = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_mask.fits"
         )[1].data.MASK_DEFUNCT
@@ -768,10 +1186,11 @@ def performEmissionLineAnalysis(config):
             n_templates = 1
             printStatus.done("Preparing the stellar population templates")
         offset = (logLam_template[0] - logLam_galaxy[0]) * C  # km/s
-        error = np.ones((npix, nbins))
+        if not magpi and not streaming:
+            error = np.ones((npix, nbins))
 
         # Read stellar kinematics from file
-        ppxf = fits.open(
+        ppxf = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_kin.fits"
         )[1].data
@@ -782,25 +1201,19 @@ def performEmissionLineAnalysis(config):
         stellar_kin[:, 3] = np.array(ppxf.H4)
 
         # Read bintable
-        bintable = fits.open(
+        bintable = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_table.fits"
         )[1].data
         binNum_long = np.array(bintable.BIN_ID)
-        ubins = np.unique(np.abs(binNum_long))
-
-        # Convert stellar kinematics to long version
-        stellar_kin_long = np.zeros((len(binNum_long), stellar_kin.shape[1]))
-        if n_templates == 1:
-            templates_long = np.zeros((len(binNum_long), templates.shape[0]))
-        for i in range(0, len(ubins)):
-            idx = np.where(ubins[i] == np.abs(binNum_long))[0]
-            stellar_kin_long[idx, :] = stellar_kin[i, :]
+        binIndex = np.unique(np.abs(binNum_long), return_inverse=True)[1]
+
+        # Convert stellar kinematics to long version. When streaming, this is
+        # done for each block of spaxels.
+        if not streaming:
+            stellar_kin = stellar_kin[binIndex, :]
             if n_templates == 1:
-                templates_long[idx, :] = templates[:, i]
-        stellar_kin = stellar_kin_long
-        if n_templates == 1:
-            templates = templates_long
+                templates = templates[:, binIndex].T
 
         # Rename to keep the code clean
         for_errors = config["GAS"]["ERRORS"]
@@ -813,6 +1226,7 @@ def performEmissionLineAnalysis(config):
     )
 
     # Deredden the spectra for the Galactic extinction in the direction of the target
+    dereddening_attenuation = None
     if config["GAS"]["EBmV"] != None:
         dereddening_attenuation = gandalf.dust_calzetti(
             logLam_galaxy[0],
@@ -822,13 +1236,16 @@ def performEmissionLineAnalysis(config):
             0.0,
             0,
         )
-        for i in range(spectra.shape[1]):
-            spectra[:, i] = spectra[:, i] * dereddening_attenuation
+        if not streaming:
+            for i in range(spectra.shape[1]):
+                spectra[:, i] = spectra[:, i] * dereddening_attenuation
 
-    # Get goodpixels and emission_setup
+    # Get goodpixels and emission_setup, which are the same for all bins
     goodpixels, emission_setup = getGoodpixelsEmissionSetup(
         config, 0.0, velscale, logLam_galaxy, logLam_template, npix
     )
+    goodpixels.flags.writeable = False
+    emissionSetup = compactEmissionSetup(emission_setup)
 
     # Setup output arrays
     nlines = 0
@@ -850,6 +1267,45 @@ def performEmissionLineAnalysis(config):
         reddening_length_sol = 2
         reddening_length_esol = 2
 
+    if streaming:
+        fitArgs = (
+            logLam_galaxy,
+            logLam_template,
+            goodpixels,
+            emissionSetup,
+            velscale,
+            int_disp,
+            reddening,
+            mdegree,
+            for_errors,
+            offset,
+            velscale_ratio,
+        )
+        streamSpaxelLevel(
+            config,
+            allSpectra,
+            idx_lam,
+            magpi,
+            dereddening_attenuation,
+            maskedSpaxel,
+            stellar_kin,
+            binIndex,
+            templates,
+            n_templates,
+            fitArgs,
+            fitOptions,
+            npix,
+            nlines,
+            emission_setup,
+            logLam_galaxy,
+            goodpixels,
+            reddening,
+            reddening_length_sol,
+            reddening_length_esol,
+            for_errors,
+        )
+        return None
+
     weights = np.zeros((nbins, n_templates + nlines))
     emission_templates = np.zeros((nbins, nlines, npix))
     bestfit = np.zeros((nbins, npix))
@@ -864,6 +1320,9 @@ def performEmissionLineAnalysis(config):
     # ========================
     # Run GANDALF
     start_time = time.time()
+    progress = _progress.Progress(
+        "Running GANDALF", nbins, unit="spaxels" if currentLevel == "SPAXEL" else "bins"
+    )
 
     if config["GENERAL"]["PARALLEL"] == True:
         printStatus.running("Running GANDALF in parallel mode")
@@ -879,9 +1338,10 @@ def performEmissionLineAnalysis(config):
             for _ in range(config["GENERAL"]["NCPU"])
         ]
 
-        # Start worker processes
-        for p in ps:
-            p.start()
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
 
         # Fill the queue
         if n_templates > 1:
@@ -894,8 +1354,8 @@ def performEmissionLineAnalysis(config):
                         templates,
                         logLam_galaxy,
                         logLam_template,
-                        config["GAS"]["EMI_FILE"],
-                        0.0,
+                        goodpixels,
+                        emissionSetup,
                         velscale,
                         int_disp,
                         reddening,
@@ -906,8 +1366,8 @@ def performEmissionLineAnalysis(config):
                         i,
                         nbins,
                         npix,
-                        config,
                         maskedSpaxel[i],
+                        fitOptions,
                     )
                 )
         elif n_templates == 1:
@@ -920,8 +1380,8 @@ def performEmissionLineAnalysis(config):
                         templates[[i], :].T,
                         logLam_galaxy,
                         logLam_template,
-                        config["GAS"]["EMI_FILE"],
-                        0.0,
+                        goodpixels,
+                        emissionSetup,
                         velscale,
                         int_disp,
                         reddening,
@@ -932,13 +1392,16 @@ def performEmissionLineAnalysis(config):
                         i,
                         nbins,
                         npix,
-                        config,
                         maskedSpaxel[i],
+                        fitOptions,
                     )
                 )
 
         # now get the results with indices
-        gandalf_tmp = [outQueue.get() for _ in range(nbins)]
+        gandalf_tmp = []
+        for _ in range(nbins):
+            gandalf_tmp.append(outQueue.get())
+            progress.update(failed=_progress.failedFit(gandalf_tmp[-1][1], flag=-1))
 
         # send stop signal to stop iteration
         for _ in range(config["GENERAL"]["NCPU"]):
@@ -985,8 +1448,8 @@ def performEmissionLineAnalysis(config):
                     templates,
                     logLam_galaxy,
                     logLam_template,
-                    config["GAS"]["EMI_FILE"],
-                    0.0,
+                    goodpixels,
+                    emissionSetup,
                     velscale,
                     int_disp,
                     reddening,
@@ -997,9 +1460,10 @@ def performEmissionLineAnalysis(config):
                     i,
                     nbins,
                     npix,
-                    config,
                     maskedSpaxel[i],
+                    fitOptions,
                 )
+                progress.update(failed=bestfit[i, 0] == -1)
         elif n_templates == 1:
             for i in range(0, nbins):
                 (
@@ -1015,8 +1479,8 @@ def performEmissionLineAnalysis(config):
                     templates[[i], :].T,
                     logLam_galaxy,
                     logLam_template,
-                    config["GAS"]["EMI_FILE"],
-                    0.0,
+                    goodpixels,
+                    emissionSetup,
                     velscale,
                     int_disp,
                     reddening,
@@ -1027,11 +1491,13 @@ def performEmissionLineAnalysis(config):
                     i,
                     nbins,
                     npix,
-                    config,
                     maskedSpaxel[i],
+                    fitOptions,
                 )
+                progress.update(failed=bestfit[i, 0] == -1)
 
         printStatus.updateDone("Running GANDALF in serial mode", progressbar=True)
+    progress.close()
 
     print(
         "             Running GANDALF on %s spectra took %.2fs using %i cores"
@@ -12,7 +12,7 @@ import logging
 from printStatus import printStatus
 
 from gistPipeline.prepareTemplates import _prepareTemplates, prepare_gas_templates
-from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.auxiliary import _auxiliary, _prefetch, _progress
 
 # Then use system installed version instead
 from ppxf.ppxf      import ppxf
@@ -52,8 +52,6 @@ def run_ppxf(templates, galaxy_i, noise_i, velscale, start, goodPixels, tpl_comp
     ui.adsabs.harvard.edu/?#abs/2017MNRAS.466..798C), in order to determine the
     non-parametric star-formation histories.
     """
-    printStatus.progressBar(i, np.max(ubins)+1, barLength = 50)
-
     try:
 
 
@@ -390,7 +388,7 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
     # Read data if we run on BIN level
     if currentLevel == "BIN":
         # Read spectra from file
-        hdu = fits.open(
+        hdu = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_BinSpectra.fits"
         )
@@ -415,7 +413,7 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
         LamRange = (np.exp(logLam_galaxy[0]), np.exp(logLam_galaxy[-1]))
 
         #Determining the number of spaxels per bin
-        hdu2 = fits.open(os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])+ "_table.fits")
+        hdu2 = _prefetch.openFits(os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])+ "_table.fits")
         bin_id = hdu2['TABLE'].data['BIN_ID']
         n_spaxels_per_bin = np.zeros(nbins)
         if bin_id is None:
@@ -477,7 +475,7 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
         LamRange = (np.exp(logLam_galaxy[0]), np.exp(logLam_galaxy[-1]))
 
         #Determining the number of spaxels per bin
-        hdu2 = fits.open(os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])+ "_table.fits")
+        hdu2 = _prefetch.openFits(os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])+ "_table.fits")
         bin_id = hdu2['TABLE'].data['BIN_ID']
         n_spaxels_per_bin = np.zeros(nbins)
         bin_id = ubins
@@ -578,12 +576,12 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
         fixed = [True]*config['KIN']['MOM']
 
         # Read PPXF results, add not just stellar, but 3x gas guesses
-        ppxf_data = fits.open(os.path.join(config['GENERAL']['OUTPUT'],config['GENERAL']['RUN_ID'])+'_kin.fits')[1].data
+        ppxf_data = _prefetch.openFits(os.path.join(config['GENERAL']['OUTPUT'],config['GENERAL']['RUN_ID'])+'_kin.fits')[1].data
         #if config['GAS']['LEVEL'] == 'BIN':
         # No need to do anything!
 
         if currentLevel == 'SPAXEL':
-            binNum_long = np.array(fits.open(os.path.join(config['GENERAL']['OUTPUT'],config['GENERAL']['RUN_ID'])+'_table.fits')[1].data.BIN_ID)
+            binNum_long = np.array(_prefetch.openFits(os.path.join(config['GENERAL']['OUTPUT'],config['GENERAL']['RUN_ID'])+'_table.fits')[1].data.BIN_ID)
             ppxf_data_spaxels = np.zeros( (len(ubins), len(ppxf_data[0])))
             nbins = np.max(binNum_long) +1
             for i in range(int(nbins)):
@@ -636,6 +634,7 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
     # ====================
     # Run PPXF
     start_time = time.time()
+    progress = _progress.Progress("Running PPXF for emission lines analysis", np.max(ubins)+1)
 
     if config['GENERAL']['PARALLEL'] == True:
         printStatus.running("Running PPXF for emission lines analysis in parallel mode")
@@ -649,9 +648,10 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
         ps = [Process(target=workerPPXF, args=(inQueue, outQueue))
                 for _ in range(config['GENERAL']['NCPU'])]
 
-        # Start worker processes
-        for p in ps:
-            p.start()
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
 
         # Fill the queue
         for i in range(np.max(bin_id)+1): # AMELIA changed this from nbins for emline testing
@@ -663,7 +663,10 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
                 tied, gas_comp,gas_names, nbins, ubins ) )
 
         # now get the results with indices
-        ppxf_tmp = [outQueue.get() for _ in range(np.max(bin_id)+1)] #Changes from nbins
+        ppxf_tmp = []
+        for _ in range(np.max(bin_id)+1): #Changes from nbins
+            ppxf_tmp.append(outQueue.get())
+            progress.update(failed=_progress.failedFit(ppxf_tmp[-1][1]))
 
         # send stop signal to stop iteration
         for _ in range(config['GENERAL']['NCPU']):
@@ -720,9 +723,11 @@ def performEmissionLineAnalysis(config): #This is your main emission line fittin
                 run_ppxf(templates, spectra[:,i], error[:,i], velscale, \
                 start[i], goodPixels_gas, tpl_comp, moments, offset, emi_mpol_deg, \
                 fixed[i], velscale_ratio, tied, gas_comp, gas_names, i, nbins, ubins)
+            progress.update(failed=_progress.failedFit(chi2[i]))
 
 
         printStatus.updateDone("Running PPXF in serial mode", progressbar=True)
+    progress.close()
 
     print("             Running PPXF on %s spectra took %.2fs" % (nbins, time.time() - start_time))
     #print("")
@@ -1608,9 +1608,10 @@ class mpfit:
             mperr = 0
             fjac = numpy.zeros(nall)
             fjac[ifree] = 1.0  # Specify which parameters need derivatives
-            [status, fp] = self.call(fcn, xall, functkw, fjac=fjac)
+            [status, fp, pderiv] = self.call(fcn, xall, functkw, fjac=fjac)
+            fjac = numpy.array(pderiv, dtype=float)
 
-            if len(fjac) != m * nall:
+            if fjac.size != m * nall:
                 print("ERROR: Derivative matrix was not computed properly.")
                 return None
 
@@ -1623,7 +1624,7 @@ class mpfit:
             if len(ifree) < nall:
                 fjac = fjac[:, ifree]
                 fjac.shape = [m, n]
-                return fjac
+            return fjac
 
         fjac = numpy.zeros([m, n])
 
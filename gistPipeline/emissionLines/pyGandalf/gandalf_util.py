@@ -20,7 +20,7 @@ from ppxf.ppxf import robust_sigma
 from scipy import fftpack, linalg, ndimage, optimize
 from scipy.interpolate import interp1d
 
-from gistPipeline.emissionLines.magpiGandalf.cap_mpfit import mpfit
+from gistPipeline.emissionLines.pyGandalf.cap_mpfit import mpfit
 
 # ---------------------------------------------------------------------------- #
 # This version has been modified from the original to compute uncertainties on the
@@ -52,7 +52,7 @@ def nnls_flags(A, b, npoly):
     return x[:n]
 
 
-def _bvls_solve(A, b, npoly):
+def _bvls_solve(A, b, npoly, solver="nnls"):
     # No need to enforce positivity constraints if fitting one single template:
     # use faster linear least-squares solution instead of NNLS.
     m, n = A.shape
@@ -60,6 +60,10 @@ def _bvls_solve(A, b, npoly):
         soluz = A.dot(b) / A.dot(A)
     elif n == npoly + 1:  # Fitting a single template
         soluz = linalg.lstsq(A, b)[0]
+    elif solver == "bvls":  # Fitting multiple templates with BVLS
+        lower = np.zeros(n)
+        lower[:npoly] = -np.inf
+        soluz = optimize.lsq_linear(A, b, bounds=(lower, np.inf), method="bvls").x
     else:  # Fitting multiple templates
         soluz = nnls_flags(A, b, npoly)
     return soluz
@@ -105,6 +109,87 @@ class EmissionSetup:
         )
 
 
+#################################################################
+# Class to store the parts of the FITFUNC_GAS design matrix that do not
+# change between the MPFIT evaluations for one spectrum
+class FitContext:
+    def __init__(self, cstar, noise, degree, mdegree, goodpixels, nlines, reddening):
+        npix = len(noise)
+        cstar = np.reshape(cstar, (len(cstar), -1))[0:npix, :]
+        self.ntemp = cstar.shape[1]
+        self.nlines = nlines
+        self.degree = degree
+        self.mdegree = mdegree
+        self.goodpixels = np.asarray(goodpixels)
+        self.components = None
+        # Free parameter each parameter is tied to, see set_constraints
+        self.tie_target = np.arange(2 * nlines + mdegree)
+        # Solver of the linear problem, see BVLSN_Solve_pxf
+        self.solver = "nnls"
+        self._qr_fixed = None
+        self.noise_good = noise[self.goodpixels]
+        self.cstar = cstar
+
+        # Legendre polynomials for the additive and multiplicative terms.
+        # X needs to be within [-1,1] for Legendre Polynomials
+        x = np.linspace(-1.0, 1.0, num=npix)
+        self.legendre = np.zeros((npix, max(degree, mdegree) + 1))
+        for j in range(max(degree, mdegree) + 1):
+            self.legendre[:, j] = sp_s.legendre(j)(x)
+
+        # Design matrix (ccc) and its noise-weighted goodpixel rows (aaa). The
+        # columns are: Legendre polynomials of order 'degree', convolved SSP
+        # models and emission lines.
+        self.i_star = degree + 1
+        self.i_gas = degree + self.ntemp + 1
+        self.ccc = np.zeros((npix, degree + nlines + self.ntemp + 1))
+        self.aaa = np.zeros((len(self.goodpixels), degree + nlines + self.ntemp + 1))
+        self.ccc[:, 0 : degree + 1] = self.legendre[:, 0 : degree + 1]
+
+        # The stellar columns only change if they are multiplied by a polynomial
+        # or reddened
+        self.fixed_stars = mdegree < 1 and reddening is None
+        if self.fixed_stars:
+            self.ccc[:, self.i_star : self.i_gas] = cstar
+        self._weight_columns(0, self.i_gas)
+
+    def _weight_columns(self, start, end):
+        # Weight the goodpixel rows of the given columns with errors
+        self.aaa[:, start:end] = (
+            self.ccc[self.goodpixels, start:end] / self.noise_good[:, None]
+        )
+
+    def reduced_system(self, bb):
+        # Returns the upper triangular R and Q^T bb, with aaa = Q R. If the
+        # stellar columns are fixed, their QR decomposition is computed only
+        # once and the emission-line columns are orthogonalised against it.
+        if not self.fixed_stars:
+            q, r = np.linalg.qr(self.aaa)
+            return r, np.dot(q.T, bb)
+        if self._qr_fixed is None:
+            self._qr_fixed = np.linalg.qr(self.aaa[:, 0 : self.i_gas])
+        q1, r11 = self._qr_fixed
+        gas = self.aaa[:, self.i_gas :]
+        # Orthogonalise twice for numerical stability
+        r12 = np.dot(q1.T, gas)
+        gas = gas - np.dot(q1, r12)
+        r12_2 = np.dot(q1.T, gas)
+        gas -= np.dot(q1, r12_2)
+        r12 += r12_2
+        q2, r22 = np.linalg.qr(gas)
+        r = np.block([[r11, r12], [np.zeros((r22.shape[0], r11.shape[1])), r22]])
+        return r, np.concatenate([np.dot(q1.T, bb), np.dot(q2.T, bb)])
+
+    def update(self, stars, gaus):
+        # Update the stellar (if needed) and emission-line columns
+        if not self.fixed_stars:
+            self.ccc[:, self.i_star : self.i_gas] = stars
+        for j in range(self.nlines):
+            self.ccc[:, self.i_gas + j] = gaus[j]
+        start = self.i_gas if self.fixed_stars else self.i_star
+        self._weight_columns(start, self.i_gas + self.nlines)
+
+
 #################################################################
 def fullprint(*args, **kwargs):
     # Print the FULL content of an array in a "pretty" way
@@ -480,6 +565,8 @@ def set_constraints(
     log10,
     reddening,
     l0_templ,
+    mdegree_step=1e-3,
+    linear_solver="nnls",
 ):
     # This subroutine sets up the constraints and boundaries for the
     # variables to be fitted, preparing and returning the PARINFO and
@@ -545,7 +632,7 @@ def set_constraints(
     if mdegree >= 1:
         for iindx in range(n_pars - mdegree, len(parinfo)):
             parinfo[iindx]["limits"] = [-1.0, 1.0]
-            parinfo[iindx]["step"] = 1e-3
+            parinfo[iindx]["step"] = mdegree_step
     # iii) and for the reddening parameters (if needed). These will follow the
     # emission-line parameters in the parameter array.
     if reddening is not None:
@@ -706,7 +793,20 @@ def set_constraints(
         "log10": log10,
         "reddening": reddening,
         "l0_templ": l0_templ,
+        "context": FitContext(
+            cstar, noise, degree, mdegree, goodpixels, nlines, reddening
+        ),
     }
+    # Index of the free parameter each parameter is tied to, needed for the
+    # analytic derivatives. All ties are of the form p[k] +/- const.
+    tie_target = np.arange(n_pars)
+    for i in range(n_pars):
+        k = i
+        while parinfo[k]["tied"].strip() != "":
+            k = int(parinfo[k]["tied"].split("[")[1].split("]")[0])
+        tie_target[i] = k
+    functargs["context"].tie_target = tie_target
+    functargs["context"].solver = linear_solver
     return parinfo, functargs
 
 
@@ -738,7 +838,77 @@ def rebin(x, factor):
 
 
 ###############################################################################
-def create_templates(emission_setup, pars, npix, lstep_gal, int_disp_pix, log10):
+def emission_line_components(emission_setup, lstep_gal, log10):
+    # Describe all Gaussian components of the emission-line templates, i.e.
+    # the single lines (like Hb), the main lines of each multiplet (like
+    # [OIII]5007) and their satellite lines (like [OIII]4959). This only
+    # depends on the emission-line setup, so it needs to be done once per fit.
+    #
+    # For each component we store the index of the template it is added to
+    # (which is also the index of its V_gas and S_gas in the pars array), its
+    # offset (in pix) from the main line, the amplitude, and the indices in
+    # the int_disp array of the component and of its main line.
+    i_lines = where_eq(emission_setup, "kind", "l")
+    row, shift, amp, disp, disp_main = [], [], [], [], []
+    # a) single lines or main lines of multiplets. Use the amplitude from the
+    # emission-line setup. If that is set to unity, than the NNLS weight
+    # assigned to each template will actually correspond to the emission-line
+    # amplitude. Negative input values will produce absorption lines.
+    for i in range(len(i_lines)):
+        row.append(i)
+        shift.append(0.0)
+        amp.append(np.float64(emission_setup[i_lines[i]].a))
+        disp.append(i_lines[i])
+        disp_main.append(i_lines[i])
+    # b) satellite lines belonging to multiplets. The "kind" tag points to the
+    # main line in the present multiplet (e.g. d17 for [OIII]4959)
+    for j, em in enumerate(emission_setup):
+        if em.kind[0] != "d":
+            continue
+        k_mline = int(em.kind[1:])
+        j_mline = where_eq(emission_setup, "i", k_mline)[0]
+        # offset (in pix) that we need to apply in order to correctly place
+        # the satellite line, to deal with log10-lambda rebinned data,
+        # instead of ln-lambda
+        l_sline = em._lambda
+        l_mline = emission_setup[j_mline]._lambda
+        if log10:
+            offset = mt.log10(l_mline / l_sline) / lstep_gal
+        else:
+            offset = mt.log(l_mline / l_sline) / lstep_gal
+        # Use the amplitudes given in the emission setup structure and the
+        # wavelength the lines to compute the amplitude that the satellite
+        # lines must have to obtain to the desired relative strength, in terms
+        # of total flux, of the satellite line w.r.t to that of their main
+        # line (e.g.  F_Hb = 0.35 F_Ha without reddening). The ratio of the
+        # observed widths is applied in create_templates.
+        row.append(where_eq([emission_setup[x] for x in i_lines], "i", k_mline)[0])
+        shift.append(offset)
+        amp.append(em.a * emission_setup[j_mline].a * (l_mline / l_sline))
+        disp.append(j)
+        disp_main.append(j_mline)
+    return {
+        "nlines": len(i_lines),
+        "row": np.array(row, dtype=int),
+        "shift": np.array(shift, dtype=np.float64),
+        "amp": np.array(amp, dtype=np.float64),
+        "disp": np.array(disp, dtype=int),
+        "disp_main": np.array(disp_main, dtype=int),
+    }
+
+
+###############################################################################
+def create_templates(
+    emission_setup,
+    pars,
+    npix,
+    lstep_gal,
+    int_disp_pix,
+    log10,
+    components=None,
+    nsigma=10.0,
+    deriv=False,
+):
     # Take the emission-setup structure and the input pars parameter array
     # to make emission-line single or multi-Gaussian templates.
     #
@@ -746,118 +916,87 @@ def create_templates(emission_setup, pars, npix, lstep_gal, int_disp_pix, log10)
     # that we are actually fitting, such as Hb or [OIII]5007, containing
     # only the V_gas and S_gas parameters, like [V_Hb, S_Hb, V_OIII5007, S_OIII5007, ...]
     #
-    # On the other hand if we wish to fit also the amplitudes with MPFIT,
-    # then the pars array should be [A_Hb, V_Hb, S_Hb, A_OIII5007, ...]
-    # This happens when we are evaluating the errors in the Gaussian
-    # parameters around the best solution.
-    i_lines = where_eq(emission_setup, "kind", "l")
-    nlines = len(i_lines)
-    n_pars = 2 * nlines
-    if n_pars != len(pars):
+    # All lines and the satellite lines of multiplets are evaluated at once,
+    # and only within +/- nsigma times their observed width around the line
+    # centre. The components can be passed from emission_line_components to
+    # avoid re-parsing the emission setup at every call. If deriv is set, the
+    # derivatives of the templates with respect to V_gas and S_gas are
+    # returned as well.
+    if components is None:
+        components = emission_line_components(emission_setup, lstep_gal, log10)
+    nlines = components["nlines"]
+    if 2 * nlines != len(pars):
         print("Hey, this is not the right emission-line parameter array")
-    # array that will contain the emission-line templates, including multiplets
-    gaus = []
-    # a) First create the emission-line templates corresponding to each
-    # single line (like Hb) or to each main line of a multiplet (like
-    # [OIII]5007)
-    for i in range(nlines):
-        # Create the emission-line templates.
-        # Use the amplitude from the emission-line setup. If that is
-        # set to unity, than the NNLS weight assigned to each template
-        # will actually correspond to the emission-line
-        # amplitude. Negative input values will produce absorption
-        # lines.
-        ampl_i = np.float64(emission_setup[i_lines[i]].a)
-        gaus.append(
-            create_gaussn(
-                np.arange(npix, dtype=np.float64),
-                np.append(ampl_i, pars[2 * i : 2 * i + 2]),
-                int_disp_pix[i_lines[i]],
-            )
+    row = components["row"]
+    pars = np.asarray(pars, dtype=np.float64)
+    int_disp_pix = np.asarray(int_disp_pix, dtype=np.float64)
+
+    # Position and observed width (in pix) of all components. The
+    # instrumental resolution is supposed to be in sigma and in pixels.
+    vel = pars[2 * row] - components["shift"]
+    sig2 = pars[2 * row + 1] ** 2
+    sigma = np.sqrt(sig2 + int_disp_pix[components["disp"]] ** 2)
+    ampl = components["amp"] * np.sqrt(
+        sig2 + int_disp_pix[components["disp_main"]] ** 2
+    ) / sigma
+
+    # Evaluate the Gaussians in windows around the line centres
+    lo = np.clip(np.floor(vel - nsigma * sigma), 0, npix).astype(int)
+    hi = np.clip(np.ceil(vel + nsigma * sigma) + 1, 0, npix).astype(int)
+    pix = lo[:, None] + np.arange(np.max(hi - lo, initial=0))
+    inside = pix < hi[:, None]
+    w = (pix - vel[:, None]) / sigma[:, None]
+    y = ampl[:, None] * np.exp(-(w**2) / 2.0)
+
+    # Add up the satellite lines and their main line
+    idx = (row[:, None] * npix + pix)[inside]
+    gaus = np.bincount(idx, weights=y[inside], minlength=nlines * npix)
+    gaus = gaus.reshape(nlines, npix)
+    if not deriv:
+        return gaus
+
+    # Analytic derivatives with respect to V_gas and S_gas of the main line.
+    # Both the observed width and the amplitude of satellite lines depend on
+    # S_gas.
+    dy_dv = y * w / sigma[:, None]
+    dy_ds = y * (
+        pars[2 * row + 1]
+        * (
+            1.0 / (sig2 + int_disp_pix[components["disp_main"]] ** 2)
+            - 1.0 / sigma**2
         )
-    #  gaus = np.copy(gaus)
-
-    # b) Then find all the satellite lines belonging to multiplets
-    # (like [OIII]4959), and add them to the main emission-line template
-    # we just created in a)
-    i_slines = []
-    for i, em in enumerate(emission_setup):
-        if em.kind[0] == "d":
-            i_slines.append(i)
-    n_slines = len(i_slines)
-    if n_slines > 0:
-        # loop over the satellite lines
-        for i in range(n_slines):
-            j = i_slines[i]
-            # Current index in the emission-line setup structure for
-            # the current satellite line (e.g. 1 for [OIII]4959)
-            # Find the reference line index, as given in the "kind" tag of the
-            # emission setup structure, which points to the main line in the
-            # present multiplet (e.g. 2 for [OIII]5007 if kind was d2 for [OIII]4959)
-            k_mline = int(emission_setup[j].kind[1:])
-            # which correspond to the following position in the emission setup
-            # structure that was passed to this function (e.g. still 2, if
-            # the indices of the lines in the emission setup start at 0 and
-            # increase by 1)
-            j_mline = where_eq(emission_setup, "i", k_mline)[0]
-            # Get the wavelengths of both satellite and main lines
-            # and compute the offset (in pix) that we need to apply in order
-            # to correctly place the satellite line.
-            l_sline = emission_setup[j]._lambda
-            l_mline = emission_setup[j_mline]._lambda
-            # to deal with log10-lambda rebinned data, instead of ln-lambda
-            if log10:
-                offset = mt.log10(l_mline / l_sline) / lstep_gal
-            else:
-                offset = mt.log(l_mline / l_sline) / lstep_gal
-            # Get the index in the array of the lines to fit, corresponding
-            # to the main line of the present multiplet, so that we can add the
-            # satellite emission-line template in the right place in the
-            # gaussian templates array
-            i_mline = where_eq([emission_setup[x] for x in i_lines], "i", k_mline)[0]
-            # Finally, create the satellite template, and add it to that of
-            # the corresponding main line of this multiplet.
-
-            # Use the amplitudes given in the emission setup structure
-            # and the wavelength the lines to compute the amplitude
-            # that the satellite lines must have to obtain to the
-            # desired relative strength, in terms of total flux, of
-            # the satellite line w.r.t to that of their main line
-            # (e.g.  F_Hb = 0.35 F_Ha without reddening).
-            f_sat_to_main_ratio = emission_setup[j].a * emission_setup[j_mline].a
-            lambda_main_to_sat_ratio = (
-                emission_setup[j_mline]._lambda / emission_setup[j]._lambda
-            )
-            obs_sigma_pix_main_to_sat_ratio = np.sqrt(
-                pars[i_mline * 2 + 1] ** 2 + int_disp_pix[j_mline] ** 2
-            ) / np.sqrt(pars[i_mline * 2 + 1] ** 2 + int_disp_pix[j] ** 2)
-            a_sline = (
-                f_sat_to_main_ratio
-                * lambda_main_to_sat_ratio
-                * obs_sigma_pix_main_to_sat_ratio
-            )
-
-            gaus_sline = create_gaussn(
-                np.arange(npix, dtype="float64"),
-                [a_sline, pars[i_mline * 2] - offset, pars[i_mline * 2 + 1]],
-                int_disp_pix[j],
-            )
-            gaus[i_mline] += gaus_sline
-    return gaus
+    )[:, None] + y * w**2 * (pars[2 * row + 1] / sigma**2)[:, None]
+    dgaus_dv = np.bincount(idx, weights=dy_dv[inside], minlength=nlines * npix)
+    dgaus_ds = np.bincount(idx, weights=dy_ds[inside], minlength=nlines * npix)
+    return gaus, dgaus_dv.reshape(nlines, npix), dgaus_ds.reshape(nlines, npix)
 
 
 ###############################################################################
-def BVLSN_Solve_pxf(AA, bb, degree, nlines):
+def BVLSN_Solve_pxf(AA, bb, degree, nlines, solver="nnls", context=None):
     # No need to enforce positivity constraints if fitting one
     # single template: use faster SVD solution instead of BVLS.
     #
+    # The solver is one of LINEAR_SOLVERS. With 'nnls_qr' the problem is
+    # first reduced to the equivalent square system R x = Q^T bb, with
+    # AA = Q R, which is cheaper to solve with NNLS if AA has many columns.
     AA = np.array(AA, dtype=np.float64)
     bb = np.array(bb, dtype=np.float64)
 
-    soluz = _bvls_solve(AA, bb, 0)
+    if solver == "nnls_qr":
+        if context is not None:
+            AA, bb = context.reduced_system(bb)
+        else:
+            q, AA = np.linalg.qr(AA)
+            bb = np.dot(q.T, bb)
+        solver = "nnls"
+    soluz = _bvls_solve(AA, bb, 0, solver)
     return soluz
 
 
+# Available solvers for the bounded linear least-squares problem of the fit
+LINEAR_SOLVERS = ["nnls", "nnls_qr", "bvls"]
+
+
 ###############################################################################
 def create_gaussn(x, xpars, int_disp_pix_line):
     # def create_gaussn(x, xpars, int_disp_pix2): !OLD version
@@ -933,6 +1072,31 @@ def _losvd_rfft_old(pars, nspec, moments, nl, ncomp, vsyst, factor, sigma_diff):
     return np.conj(losvd_rfft)
 
 
+###############################################################################
+# The stellar templates are the same for all spectra of a run, so their
+# Fourier transforms are computed only once and kept here. A few entries are
+# retained, as the padding of convolve_templates depends on the LOSVD.
+_templates_rfft_cache = []
+_TEMPLATES_RFFT_CACHE_SIZE = 4
+
+
+def templates_rfft(templates, npad):
+    # Returns the rfft of the templates [npix_temp, ntemp] along the first
+    # axis, zero-padded to npad pixels. Cached templates are compared by value,
+    # as a new copy of the templates is passed with every spectrum.
+    for cached, cached_npad, cached_rfft in _templates_rfft_cache:
+        if (
+            cached_npad == npad
+            and cached.shape == templates.shape
+            and np.array_equal(cached, templates)
+        ):
+            return cached_rfft
+    rfft = np.fft.rfft(templates, npad, axis=0)
+    _templates_rfft_cache.insert(0, (np.array(templates), npad, rfft))
+    del _templates_rfft_cache[_TEMPLATES_RFFT_CACHE_SIZE:]
+    return rfft
+
+
 ###############################################################################
 def convolve_templates(templates, kinstars, velscale, npix_gal):  # , velscale_ratio)
     # <<<< NO CONVOLUTION ANALOGOUS TO IDL SO DO AS IN PPXF-ish IN FOURIER SPACE >>>>
@@ -982,9 +1146,6 @@ def convolve_templates(templates, kinstars, velscale, npix_gal):  # , velscale_r
                 w2 * (w2 * (8 * w2 - 60) + 90) - 15
             )  # H6
         losvd *= poly
-    s = np.shape(templates)
-    ctemplates = np.zeros_like(templates, dtype=np.float64)
-    ctemplates = np.transpose(ctemplates)
     # MEET HALFWAY LOSVD NOT FOURIER TRANSFORMED BEFORE AND TEMPLATES HANDLED WITH PADDING
     # TAKEN FROM IDL VERSION OF PPXF-ish ...
     #
@@ -992,17 +1153,14 @@ def convolve_templates(templates, kinstars, velscale, npix_gal):  # , velscale_r
     #  ppxf_convol_fft(star[*,j],losvd[*,component[j],k])
     nf = np.shape(templates)[1]
     nk = len(losvd)
-    nn = long(2 ** (mt.ceil(np.log(nf + nk / 2) / np.log(2))))
-    for j in np.arange(np.shape(templates)[0]):  # Loop over templates
-        f1 = np.zeros(nn, dtype=np.float64)
-        k1 = np.zeros(nn, dtype=np.float64)
-        f1[0:nf] = templates[j, :]
-        k1[0:nk] = np.flip(losvd, 0)
-        k1 = np.roll(k1, int(-(nk - 1) / 2))
-        A = np.fft.fft(f1)
-        B = np.fft.fft(k1)
-        con = np.real((np.fft.ifft(A * B)))[0:nf]
-        ctemplates[:, j] = con
+    nn = int(2 ** (mt.ceil(np.log(nf + nk / 2) / np.log(2))))
+    k1 = np.zeros(nn, dtype=np.float64)
+    k1[0:nk] = np.flip(losvd, 0)
+    k1 = np.roll(k1, int(-(nk - 1) / 2))
+    # All templates are convolved at once with the same LOSVD
+    A = templates_rfft(np.transpose(templates), nn)
+    B = np.fft.rfft(k1)
+    ctemplates = np.fft.irfft(A * B[:, None], nn, axis=0)[0:nf, :]
     return np.array(ctemplates)
 
 
@@ -1016,7 +1174,7 @@ def convolve_templates_new(
     npix_temp = len(templates[0, :])
     templates = templates.T
     npad = 2 ** int(np.ceil(np.log2(templates.shape[0])))
-    templates_rfft = np.fft.rfft(templates, npad, axis=0)
+    templates_fft = templates_rfft(templates, npad)
     #
     pars = kinstars
     #
@@ -1024,7 +1182,7 @@ def convolve_templates_new(
     #
     nspec = 1  # not 2 sided by default
     moments = [len(kinstars)]  # fix to 1 comp for now
-    nl = templates_rfft.shape[0]
+    nl = templates_fft.shape[0]
     ncomp = 1  # Add 2 comp !
     factor = velscale_ratio
     sigma_diff = 0.0  # already broadened & convolved !
@@ -1033,16 +1191,12 @@ def convolve_templates_new(
         pars, nspec, moments, nl, ncomp, vsyst / velscale, factor, sigma_diff
     )
     #
-    pp = []
-    tmp = np.empty((1, npix_temp))
+    # Convolve all templates at once
+    pr = templates_fft * losvd_rfft[:, 0, 0][:, None]
+    tt = np.fft.irfft(pr, npad, axis=0)
+    pp = rebin(tt[: npix_temp * factor, :], factor)
     #
-    for k in np.arange((np.shape(templates)[1])):
-        template_rfft = templates_rfft[:, k]
-        pr = template_rfft * losvd_rfft[:, 0, 0]
-        tt = np.fft.irfft(pr, npad)
-        pp.append(rebin(tt[: npix_temp * factor], factor)[:npix_gal].ravel())
-    #
-    return np.transpose(np.array(pp))
+    return np.reshape(pp, (len(pp), -1))[:npix_gal, :]
 
 
 ###############################################################################
@@ -1084,7 +1238,7 @@ def dust_calzetti(l0_gal, lstep_gal, npix, ebv, vstar, log10):
 
 
 ###############################################################################
-def fitfunc_gas(pars, **kwargs):
+def fitfunc_gas(pars, fjac=None, **kwargs):
     cstar = kwargs["cstar"]
     galaxy = kwargs["galaxy"]
     noise = kwargs["noise"]
@@ -1101,10 +1255,14 @@ def fitfunc_gas(pars, **kwargs):
     l0_templ = kwargs["l0_templ"]
     emission_setup = kwargs["emission_setup"]
     npix = len(galaxy)
-    x = np.linspace(
-        -1.0, 1.0, num=npix
-    )  # X needs to be within [-1,1] for Legendre Polynomials
     nlines = len(where_eq(emission_setup, "kind", "l"))
+    # Quantities that do not change between the MPFIT evaluations are
+    # prepared only once per spectrum, see set_constraints
+    context = kwargs.get("context")
+    if context is None:
+        context = FitContext(
+            cstar, noise, degree, mdegree, goodpixels, nlines, reddening
+        )
 
     npars = nlines * 2
     # append the reddening parameters if needed
@@ -1113,42 +1271,42 @@ def fitfunc_gas(pars, **kwargs):
     # The zero order multiplicative term is already included in the
     # linear fit of the templates. The polinomial below has mean of 1.
     mpoly = 1.0  # The loop below can be null if mdegree < 1
-    for j in range(1, mdegree + 1):
-        mpoly += sp_s.legendre(j)(x) * pars[npars + j - 1]
+    if mdegree >= 1:
+        mpoly = 1.0 + np.dot(
+            context.legendre[:, 1 : mdegree + 1], pars[npars : npars + mdegree]
+        )
     # Emission Lines as given by the values in pars
     # passing only the emission-line parameters
-    s = cstar.ndim
-    # passing only the emission-line parameters
     eml_pars = pars[0 : nlines * 2]  # np.copy(pars[0:nlines*2])
     int_disp_pix = int_disp / velscale
+    if context.components is None:
+        context.components = emission_line_components(
+            emission_setup, lstep_gal, log10
+        )
+    # Derivatives are requested by MPFIT if called with autoderivative=0
+    deriv = fjac is not None
     gaus = create_templates(
-        emission_setup, eml_pars, npix, lstep_gal, int_disp_pix, log10
+        emission_setup,
+        eml_pars,
+        npix,
+        lstep_gal,
+        int_disp_pix,
+        log10,
+        components=context.components,
+        deriv=deriv,
     )
+    if deriv:
+        gaus, dgaus_dv, dgaus_ds = gaus
     # Stacking all the inputs together:
     #   1.- Legendre polinomials of order 'degree'
     #   2.- Convolved SSP models (pre-convolved by the best LOSVD in set_constraints)
     #       adjusted by a multiplicative polinomials - or by reddening
     #   3.- Emission Lines, also reddened
-    if cstar.ndim == 2:  # Number of template spectra
-        ntemp = cstar.shape[1]
-    else:
-        ntemp = 1
-    ccc = np.zeros(
-        shape=(npix, (degree + nlines + ntemp + 1))
-    )  # This array is used for estimating predictions
-    aaa = ccc  # This array is used for the actual solution of the system)
-    for j in range(degree + 1):
-        ccc[:, j] = sp_s.legendre(j)(x)
+    ntemp = context.ntemp
     if reddening == None:
-        # for j in range(ntemp-1):
-        for j in range(ntemp):
-            ccc[:, degree + 1 + j] = (
-                mpoly * cstar[0:npix, j]
-            )  # Convolved templates x mult. polinomials
-        for j in range(nlines):
-            ccc[:, degree + ntemp + 1 + j] = gaus[
-                j
-            ]  # np.copy(gaus[j])           # Emission lines
+        # Convolved templates x mult. polinomials and emission lines
+        stars = None if context.fixed_stars else mpoly[:, None] * context.cstar
+        context.update(stars, gaus)
     else:
         # redden both stellar and emission-line templates
         ebv = pars[nlines * 2]
@@ -1168,17 +1326,21 @@ def fitfunc_gas(pars, **kwargs):
             )
         else:
             int_reddening_attenuation = np.float64(1.0)
-        for j in range(ntemp):
-            ccc[:, degree + 1 + j] = cstar[0:npix, j] * reddening_attenuation
-        for j in range(nlines):
-            ccc[:, degree + ntemp + 1 + j] = (
+        context.update(
+            context.cstar * reddening_attenuation[:, None],
+            [
                 gaus[j] * reddening_attenuation * int_reddening_attenuation
-            )
-    KK = np.copy(ccc)
-    for j in range(degree + ntemp + nlines + 1):
-        aaa[:, j] = ccc[:, j] / noise  # Weight all columns with errors
+                for j in range(nlines)
+            ],
+        )
+    KK = context.ccc
     solll = BVLSN_Solve_pxf(
-        aaa[goodpixels, :], galaxy[goodpixels] / noise[goodpixels], degree, nlines
+        context.aaa,
+        galaxy[goodpixels] / noise[goodpixels],
+        degree,
+        nlines,
+        solver=context.solver,
+        context=context,
     )
     bestfit = np.matmul(KK, solll)  # IDL: c # sol
     err = (galaxy[goodpixels] - bestfit[goodpixels]) / noise[goodpixels]
@@ -1207,9 +1369,49 @@ def fitfunc_gas(pars, **kwargs):
         return_arg(kwargs["bestfit"], bestfit)
     if "emission_templates" in kwargs:
         return_arg(kwargs["emission_templates"], emission_templates)
+    if deriv:
+        pderiv = jacobian_gas(
+            context, solll, pars, npars, dgaus_dv, dgaus_ds, noise[goodpixels]
+        )
+        return [0, err, pderiv]
     return [0, err]
 
 
+###############################################################################
+def jacobian_gas(context, solll, pars, npars, dgaus_dv, dgaus_ds, noise_good):
+    # Analytic derivatives of the noise-weighted model with respect to the
+    # MPFIT parameters (V_gas and S_gas of each line, and the coefficients of
+    # the mult. polynomials). The linear weights are obtained by BVLS at each
+    # call; their dependence on the parameters is accounted for by projecting
+    # the derivatives on the orthogonal complement of the columns with
+    # non-zero weights (variable projection, Kaufman 1975).
+    # Only the model without reddening is supported.
+    nlines = context.nlines
+    goodpixels = context.goodpixels
+    pderiv = np.zeros((len(goodpixels), len(pars)))
+    sol_gas = solll[context.i_gas : context.i_gas + nlines]
+    for l in range(nlines):
+        pderiv[:, context.tie_target[2 * l]] += (
+            dgaus_dv[l, goodpixels] * sol_gas[l] / noise_good
+        )
+        pderiv[:, context.tie_target[2 * l + 1]] += (
+            dgaus_ds[l, goodpixels] * sol_gas[l] / noise_good
+        )
+    if context.mdegree >= 1:
+        stars = np.dot(
+            context.cstar[goodpixels, :], solll[context.i_star : context.i_gas]
+        )
+        for j in range(1, context.mdegree + 1):
+            pderiv[:, npars + j - 1] += (
+                context.legendre[goodpixels, j] * stars / noise_good
+            )
+    active = solll != 0
+    if np.any(active):
+        q = np.linalg.qr(context.aaa[:, active])[0]
+        pderiv -= np.dot(q, np.dot(q.T, pderiv))
+    return pderiv
+
+
 ###############################################################################
 def rearrange_results(
     res,
@@ -1338,6 +1540,13 @@ def gandalf(
     for_errors,
     velscale_ratio,
     vsyst,
+    analytic_jacobian=True,
+    restart_steps=None,
+    mdegree_step=1e-3,
+    fnorm_chi2=False,
+    tolerate_failures=False,
+    reddened_amplitudes=False,
+    linear_solver="nnls",
 ):  #:, lsf_matrix):
     templates = np.transpose(templates)
     len_red = 0 if not reddening else len(reddening)
@@ -1371,6 +1580,9 @@ def gandalf(
             err_msg_exit("Sorry, can only deal with two dust components...")
         elif len(reddening) == 0:
             reddening = None
+    # MPFIT uses the analytic derivatives of fitfunc_gas, unless the fit
+    # includes reddening, for which derivatives are computed numerically
+    autoderivative = 0 if (analytic_jacobian and reddening is None) else 1
     #
     # @@@@@@@@@@@@@@@@@@@@@@@  Check if lstep can be taken from templates @@@@@@@@@@@@@@@@@@@@@ !New
     #
@@ -1487,7 +1699,9 @@ def gandalf(
     # arguments to be passed to MPFIT
 
     # step over starting guesses to stabilise output
-    steps = [0.0, -3 * velscale, 3 * velscale]
+    steps = restart_steps
+    if steps is None:
+        steps = [0.0, -3 * velscale, 3 * velscale]
     store_min_res = np.zeros(len(steps))
     store_pars = []
     for ii, step in enumerate(steps):
@@ -1517,6 +1731,8 @@ def gandalf(
             log10,
             reddening,
             l0_templ,
+            mdegree_step=mdegree_step,
+            linear_solver=linear_solver,
         )
         # ------------------------------------
         # This is where the GANDALF fit is actually performed. Call MPFIT to
@@ -1530,14 +1746,23 @@ def gandalf(
         # Note that we evalutate also the errors on the best parameters, but
         # as regards the position and width of the lines these should only be
         # considered as lower estimates for the real uncertainties.
-        mpfit_out = mpfit(
-            fitfunc_gas,
-            xall=istart_pars,
-            functkw=functargs_2,
-            parinfo=parinfo_2,
-            ftol=1e-5,
-            quiet=1,
-        )
+        try:
+            mpfit_out = mpfit(
+                fitfunc_gas,
+                xall=istart_pars,
+                functkw=functargs_2,
+                parinfo=parinfo_2,
+                ftol=1e-5,
+                quiet=1,
+                autoderivative=autoderivative,
+            )
+        except Exception:
+            # Skip this starting guess if failures are tolerated
+            if not tolerate_failures:
+                raise
+            store_pars.append(None)
+            store_min_res[ii] = np.inf
+            continue
         status = mpfit_out.status
         ncalls = mpfit_out.nfev
         errors = mpfit_out.perror
@@ -1563,6 +1788,7 @@ def gandalf(
             degree=degree,
             mdegree=mdegree,
             goodpixels=goodpixels,
+            context=functargs_2["context"],
             bestfit=bestfit,
             weights=weights,
             emission_setup=emission_setup,
@@ -1583,6 +1809,11 @@ def gandalf(
             # compute Chi^2/DOF and use this instead of bestnorm/dof to rescale the formal uncertainties
             chi2 = robust_sigma(resid, zero=True) ** 2
             errors = errors * np.sqrt(chi2)
+        elif fnorm_chi2:
+            # Otherwise use the Chi^2 of the fit to select the best starting
+            # guess and to rescale the formal uncertainties
+            chi2 = copy.deepcopy(mpfit_out.fnorm)
+            errors = errors * np.sqrt(chi2 / (len(galaxy) - len(best_pars)))
         # ------------------------------------
         # Add up the best-fitting emission templates to get the emission spectrum
         if len(emission_templates) == 1:
@@ -1605,7 +1836,12 @@ def gandalf(
             )
         )
         store_min_res[ii] = chi2
-    best_res = np.argmin(store_min_res)
+    if tolerate_failures:
+        if np.all(~np.isfinite(store_min_res)):
+            raise ValueError("MPFIT failed for all starting guesses")
+        best_res = np.nanargmin(store_min_res)
+    else:
+        best_res = np.argmin(store_min_res)
 
     (
         status,
@@ -1737,11 +1973,19 @@ def gandalf(
             log10,
             reddening,
             l0_templ,
+            mdegree_step=mdegree_step,
+            linear_solver=linear_solver,
         )
 
         # for each MC iteration, generate a new galaxy spectrum based on the bestfit and shuffled residuals
         base_resid = copy.deepcopy(resid)  # NB: these residuals are error normalised!
-        for mc_iter in range(nmc):
+        # If failures are tolerated, failed realisations are repeated, but
+        # the number of possible runs is capped to avoid getting stuck
+        max_iter = 2 * nmc if tolerate_failures else nmc
+        mc_iter = 0
+        niter = 0
+        while mc_iter < nmc and niter < max_iter:
+            niter += 1
             np.random.shuffle(base_resid)  # shuffle the residuals!
 
             # generate a mock galaxy with residual properties matching the observed ata
@@ -1761,14 +2005,20 @@ def gandalf(
             # FOR_ERRORS keyword to specify that we solve non-linearly also for
             # the amplitudes, and not only for the line position and width.
 
-            mpfit_out = mpfit(
-                fitfunc_gas,
-                xall=start_pars,
-                functkw=ifunctargs,
-                parinfo=iparinfo,
-                ftol=1e-5,
-                quiet=1,
-            )
+            try:
+                mpfit_out = mpfit(
+                    fitfunc_gas,
+                    xall=start_pars,
+                    functkw=ifunctargs,
+                    parinfo=iparinfo,
+                    ftol=1e-5,
+                    quiet=1,
+                    autoderivative=autoderivative,
+                )
+            except Exception:
+                if not tolerate_failures:
+                    raise
+                continue
             status_2 = mpfit_out.status
             ncalls_2 = mpfit_out.nfev
             errors_2 = mpfit_out.perror
@@ -1793,6 +2043,7 @@ def gandalf(
                 degree=degree,
                 mdegree=mdegree,
                 goodpixels=goodpixels,
+                context=ifunctargs["context"],
                 bestfit=bestfit_2,
                 weights=weights_2,
                 emission_setup=emission_setup,
@@ -1826,7 +2077,11 @@ def gandalf(
                 errors_2,
             )
             eout_all[mc_iter, :] = sol_2
+            mc_iter += 1
 
+        # in case this runs up against the iteration limit, crop out empty
+        # entries
+        eout_all = eout_all[:mc_iter, :]
         esol_2 = np.nanstd(eout_all, axis=0)
 
         # -----------------
@@ -1949,4 +2204,19 @@ def gandalf(
     # Restore the input emission-line setup structure
     emission_setup = emission_setup_in  # dummy
     int_disp = int_disp_in
+    # Return the emission-line amplitudes as observed, i.e. reddened, if
+    # requested
+    if reddened_amplitudes:
+        sol_safe = sol
     return weights, emission_templates, bestfit, sol_safe, esol
+
+
+###############################################################################
+# Options of gandalf() that define the MAGPI flavour of the emission-line fit
+MAGPI_OPTIONS = {
+    "restart_steps": [0.0, -3.0, 3.0],
+    "mdegree_step": 0,
+    "fnorm_chi2": True,
+    "tolerate_failures": True,
+    "reddened_amplitudes": True,
+}
@@ -4,14 +4,11 @@ import time
 
 import numpy as np
 from astropy.io import ascii, fits
+from scipy import sparse
 from multiprocess import Process, Queue
-# Then use system installed version instead
-# import ppxf
-# print(ppxf.__version__)
-from ppxf.ppxf_util import gaussian_filter1d
 from printStatus import printStatus
 
-from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.auxiliary import _auxiliary, _prefetch, _progress
 from gistPipeline.lineStrengths import lsindex_spec as lsindex
 from gistPipeline.lineStrengths import ssppop_fitting as ssppop
 
@@ -119,7 +116,6 @@ def run_ls(
     (ui.adsabs.harvard.edu/#abs/2018MNRAS.475.3700M) to determine SSP
     properties.
     """
-    printStatus.progressBar(i, nbins, barLength=50)
     nindex = len(index_names)
 
     try:
@@ -145,11 +141,8 @@ def run_ls(
 
         if MCMC == True:
             # Run the conversion of LS indices to SSP properties
-            vals = np.zeros(len(labels) * 3 + 2)
-            chains = np.zeros(
-                (int(config["LS"]["NWALKER"] * config["LS"]["NCHAIN"] / 2), len(labels))
-            )
-            vals[:], chains[:, :] = ssppop.ssppop_fitting(
+            # In adaptive mode the length of the chain differs from bin to bin
+            vals, chains = ssppop.ssppop_fitting(
                 data,
                 error,
                 model_indices,
@@ -163,6 +156,10 @@ def run_ls(
                 i,
                 nbins,
                 "",
+                adaptive=config["LS"].get("ADAPTIVE", False),
+                ntau=config["LS"].get("NTAU", 50),
+                tau_tol=config["LS"].get("TAU_TOL", 0.01),
+                tau_step=config["LS"].get("TAU_STEP", 100),
             )
 
             percentiles = np.percentile(chains, np.arange(101), axis=0)
@@ -222,8 +219,20 @@ def save_ls(
             cols.append(
                 fits.Column(name=labels[i], format="D", array=percentile[:, 50, i])
             )
-        cols.append(fits.Column(name="lnP", format="D", array=vals[:, -2]))
-        cols.append(fits.Column(name="Flag", format="D", array=vals[:, -1]))
+        cols.append(fits.Column(name="lnP", format="D", array=vals[:, 3 * nparam]))
+        cols.append(fits.Column(name="Flag", format="D", array=vals[:, 3 * nparam + 1]))
+
+        # MCMC convergence diagnostics
+        cols.append(
+            fits.Column(name="NSTEPS", format="D", array=vals[:, 3 * nparam + 2])
+        )
+        cols.append(fits.Column(name="TAU", format="D", array=vals[:, 3 * nparam + 3]))
+        cols.append(
+            fits.Column(name="ACCEPT_FRAC", format="D", array=vals[:, 3 * nparam + 4])
+        )
+        cols.append(
+            fits.Column(name="CONVERGED", format="D", array=vals[:, 3 * nparam + 5])
+        )
 
     ndim = len(names)
     for i in range(ndim):
@@ -308,15 +317,13 @@ def saveCleanedLinearSpectra(spec, espec, wave, npix, config):
     logging.info("Wrote: " + outfits)
 
 
-def log_unbinning(lamRange, spec, oversample=1, flux=True):
+def log_unbinning_matrix(lamRange, n, oversample=1, flux=True):
     """
-    This function transforms logarithmically binned spectra back to linear
-    binning. It is a Python translation of Michele Cappellari's
-    "log_rebin_invert" function. Thanks to Michele Cappellari for his permission
-    to include this function in the pipeline.
+    Constructs the linear operator of the log-unbinning as a sparse matrix of
+    shape (n * oversample, n). As all spectra share the same logarithmic
+    wavelength grid, the matrix only needs to be computed once and can then be
+    applied to all spectra in a single product.
     """
-    # Length of arrays
-    n = len(spec)
     m = n * oversample
 
     # Log space
@@ -332,29 +339,135 @@ def log_unbinning(lamRange, spec, oversample=1, flux=True):
     # Translate indices of arrays so that newBorders[j] corresponds to borders[k[j]]
     k = np.floor((newBorders - lim[0]) / dLam).astype("int")
 
-    # Construct new spectrum
-    specNew = np.zeros(m)
-    for j in range(0, m - 1):
-        a = (newBorders[j] - borders[k[j]]) / dLam
-        b = (borders[k[j + 1]] - newBorders[j + 1]) / dLam
-
-        specNew[j] = np.sum(spec[k[j] : k[j + 1]]) - a * spec[k[j]] - b * spec[k[j + 1]]
+    # New pixel j is the sum of old pixels k[j] to k[j+1]-1, minus the fractions
+    # a and b of the old pixels at its borders. The last new pixel stays empty.
+    j = np.arange(m - 1)
+    a = (newBorders[j] - borders[k[j]]) / dLam
+    b = (borders[k[j + 1]] - newBorders[j + 1]) / dLam
+    counts = k[j + 1] - k[j]
+    rows_sum = np.repeat(j, counts)
+    cols_sum = np.arange(np.sum(counts)) - np.repeat(
+        np.cumsum(counts) - counts - k[j], counts
+    )
+    rows = np.concatenate([rows_sum, j, j])
+    cols = np.concatenate([cols_sum, k[j], k[j + 1]])
+    vals = np.concatenate([np.ones(len(rows_sum)), -a, -b])
 
     # Rescale flux
     if flux == True:
-        specNew = (
-            specNew
-            / (newBorders[1:] - newBorders[:-1])
-            * np.mean(newBorders[1:] - newBorders[:-1])
-            * oversample
-        )
+        dBorders = newBorders[1:] - newBorders[:-1]
+        vals = vals / dBorders[rows] * np.mean(dBorders) * oversample
+
+    # Duplicate entries are summed on conversion to CSR
+    matrix = sparse.coo_matrix((vals, (rows, cols)), shape=(m, n)).tocsr()
 
     # Shift back the wavelength arrays
     lamNew = lamNew[:-1] + 0.5 * (lamNew[1] - lamNew[0])
 
+    return (matrix, lamNew)
+
+
+def log_unbinning(lamRange, spec, oversample=1, flux=True):
+    """
+    This function transforms logarithmically binned spectra back to linear
+    binning. It is a Python translation of Michele Cappellari's
+    "log_rebin_invert" function. Thanks to Michele Cappellari for his permission
+    to include this function in the pipeline.
+
+    spec can either be a single spectrum or an array of spectra with the shape
+    (nspec, npix).
+    """
+    matrix, lamNew = log_unbinning_matrix(lamRange, spec.shape[-1], oversample, flux)
+    specNew = (matrix @ np.atleast_2d(spec).T).T
+    if spec.ndim == 1:
+        specNew = specNew[0, :]
+
     return (specNew, lamNew)
 
 
+def gaussianKernel(sig):
+    """
+    Returns the kernel that convolves a spectrum with a Gaussian of different
+    sigma (in pixels) for every pixel, as used in ppxf_util.gaussian_filter1d.
+    The kernel has the shape (2*p+1, npix) and can be reused for any number of
+    spectra with the same broadening, see applyGaussianKernel().
+    """
+    sig = sig.clip(0.01)  # forces zero sigmas to have 0.01 pixels
+    p = int(1 + 4 * np.max(sig))
+    x2 = np.linspace(-p, p, 2 * p + 1) ** 2
+
+    gau = np.exp(-x2[:, None] / (2 * sig**2))
+    gau /= gau.sum(0)  # Normalize kernel
+
+    return gau
+
+
+def applyGaussianKernel(spec, gau):
+    """
+    Convolves a block of spectra with the shape (nspec, npix) with a kernel
+    from gaussianKernel(). Pixels outside of the spectrum are treated as zero.
+    """
+    nspec, n = spec.shape
+    p = (gau.shape[0] - 1) // 2
+
+    padded = np.zeros((nspec, n + 2 * p))
+    padded[:, p : p + n] = spec
+
+    conv_spectrum = np.zeros((nspec, n))
+    for j in range(2 * p + 1):  # Loop over the small size of the kernel
+        conv_spectrum += padded[:, j : j + n] * gau[j, :]
+
+    return conv_spectrum
+
+
+def broadenSpectra(spec, espec, wave, veldisp_kin, lsf, conv_cor, velscale, sigma_step):
+    """
+    Broadens all spectra to the LIS measurement resolution, taking into account
+    the measured velocity dispersion. Bins are grouped by their velocity
+    dispersion, rounded to sigma_step (in km/s; set 0 to only group identical
+    values), and the same convolution kernel is applied to each group of
+    spectra and error spectra at once.
+    """
+    spec = spec.copy()
+    espec = espec.copy()
+
+    # Flag spectra for which the total intrinsic dispersion is larger than the LIS measurement resolution
+    veldisp_kin_Angst = veldisp_kin[:, None] * wave / cvel * 2.355
+    total_dispersion = np.sqrt(lsf**2 + veldisp_kin_Angst**2)
+    totalFWHM_flag = np.any(~(total_dispersion <= conv_cor), axis=1).astype(float)
+
+    # Group bins with similar velocity dispersion
+    if sigma_step > 0:
+        veldisp_group = np.round(veldisp_kin / sigma_step) * sigma_step
+    else:
+        veldisp_group = veldisp_kin
+    groups, idxGroup = np.unique(veldisp_group, return_inverse=True)
+
+    for g in range(len(groups)):
+        printStatus.progressBar(g, len(groups), barLength=50)
+
+        # Convert velocity dispersion of galaxy (from PPXF) to Angstrom
+        veldisp_kin_Angst = groups[g] * wave / cvel * 2.355
+
+        # Total dispersion for this group
+        total_dispersion = np.sqrt(lsf**2 + veldisp_kin_Angst**2)
+
+        # Difference between total dispersion and LIS measurement resolution
+        FWHM_dif = np.sqrt(conv_cor**2 - total_dispersion**2)
+
+        # Convert resolution difference from Angstrom to pixel
+        sigma = (FWHM_dif / wave) * cvel / 2.355 / velscale
+        sigma[np.isnan(sigma)] = 0.0
+
+        # Convolve all spectra of this group pixel-wise
+        idx = np.where(idxGroup == g)[0]
+        gau = gaussianKernel(sigma)
+        spec[idx, :] = applyGaussianKernel(spec[idx, :], gau)
+        espec[idx, :] = applyGaussianKernel(espec[idx, :], gau)
+
+    return spec, espec, totalFWHM_flag
+
+
 def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
     """
     Starts the line strength analysis. Data is read in, emission-subtracted
@@ -394,7 +507,7 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
                 + "_gas-cleaned_BIN.fits"
             )
             printStatus.done("Using emission-subtracted spectra")
-            hdu_spec = fits.open(
+            hdu_spec = _prefetch.openFits(
                 os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
                 + "_gas-cleaned_BIN.fits"
             )
@@ -405,11 +518,11 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
                 + "_BinSpectra.fits"
             )
             printStatus.done("Using regular spectra without any emission-correction")
-            hdu_spec = fits.open(
+            hdu_spec = _prefetch.openFits(
                 os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
                 + "_BinSpectra.fits"
             )
-        hdu_espec = fits.open(
+        hdu_espec = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_BinSpectra.fits"
         )
@@ -417,7 +530,7 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
         idx_lamMax = np.where(hdu_spec[2].data.LOGLAM[-1] == hdu_espec[2].data.LOGLAM)[
             0
         ]
-        idx_lam = np.arange(idx_lamMin, idx_lamMax + 1)
+        idx_lam = np.arange(idx_lamMin[0], idx_lamMax[0] + 1)
         oldspec = np.array(hdu_spec[1].data.SPEC)
         oldespec = np.sqrt(np.array(hdu_espec[1].data.ESPEC)[:, idx_lam])
         wave = np.array(hdu_spec[2].data.LOGLAM)
@@ -425,27 +538,15 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
         nbins = oldspec.shape[0]
         npix = oldspec.shape[1]
         lamRange = np.array([wave[0], wave[-1]])
-        spec = np.zeros(oldspec.shape)
-        espec = np.zeros(oldespec.shape)
 
-        # Rebin the cleaned spectra from log to lin
+        # Rebin the cleaned spectra and the error spectra from log to lin. All
+        # spectra share the same wavelength grid, thus the linear operator is
+        # constructed only once.
         printStatus.running("Rebinning the spectra from log to lin")
-        for i in range(nbins):
-            printStatus.progressBar(i, nbins, barLength=50)
-            spec[i, :], wave = log_unbinning(lamRange, oldspec[i, :])
-        printStatus.updateDone(
-            "Rebinning the spectra from log to lin", progressbar=True
-        )
-
-        # Rebin the error spectra from log to lin
-        printStatus.running("Rebinning the error spectra from log to lin")
-
-        for i in range(nbins):
-            printStatus.progressBar(i, nbins, barLength=50)
-            espec[i, :], _ = log_unbinning(lamRange, oldespec[i, :])
-        printStatus.updateDone(
-            "Rebinning the error spectra from log to lin", progressbar=True
-        )
+        unbinMatrix, wave = log_unbinning_matrix(lamRange, npix)
+        spec = (unbinMatrix @ oldspec.T).T
+        espec = (unbinMatrix @ oldespec.T).T
+        printStatus.updateDone("Rebinning the spectra from log to lin")
 
         # Save cleaned, linear spectra
         saveCleanedLinearSpectra(spec, espec, wave, npix, config)
@@ -457,7 +558,7 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
             + os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_ls-cleaned_linear.fits"
         )
-        hdu = fits.open(
+        hdu = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_ls-cleaned_linear.fits"
         )
@@ -467,7 +568,7 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
         nbins = spec.shape[0]
 
     # Read PPXF results
-    ppxf_data = fits.open(
+    ppxf_data = _prefetch.openFits(
         os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
         + "_kin.fits"
     )[1].data
@@ -491,31 +592,16 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_BinSpectra.fits"
         )[0].header["VELSCALE"]
-        # Iterate over all bins
-        for i in range(0, spec.shape[0]):
-            printStatus.progressBar(i, nbins, barLength=50)
-
-            # Convert velocity dispersion of galaxy (from PPXF) to Angstrom
-            veldisp_kin_Angst = veldisp_kin[i] * wave / cvel * 2.355
-
-            # Total dispersion for this bin
-            total_dispersion = np.sqrt(LSF_Data(wave) ** 2 + veldisp_kin_Angst**2)
-
-            # Difference between total dispersion and LIS measurement resolution
-            FWHM_dif = np.sqrt(config["LS"]["CONV_COR"] ** 2 - total_dispersion**2)
-
-            # Convert resolution difference from Angstrom to pixel
-            sigma = (FWHM_dif / wave) * cvel / 2.355 / velscale
-
-            # Flag spectrum if the total intrinsic dispersion is larger than the LIS measurement resolution
-            idx = np.where(np.isnan(sigma) == True)[0]
-            if len(idx) > 0:
-                sigma[idx] = 0.0
-                totalFWHM_flag[i] = 1
-
-            # Convolve spectra pixel-wise
-            spec[i, :] = gaussian_filter1d(spec[i, :], sigma)
-            espec[i, :] = gaussian_filter1d(espec[i, :], sigma)
+        spec, espec, totalFWHM_flag = broadenSpectra(
+            spec,
+            espec,
+            wave,
+            veldisp_kin,
+            LSF_Data(wave),
+            config["LS"]["CONV_COR"],
+            velscale,
+            config["LS"].get("SIGMA_STEP", 0.0),
+        )
         printStatus.updateDone(
             "Broadening the spectra to LIS resolution", progressbar=True
         )
@@ -538,11 +624,12 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
     ls_indices = np.zeros((nbins, len(names)))
     ls_errors = np.zeros((nbins, len(names)))
     if MCMC == True:
-        vals = np.zeros((nbins, len(labels) * 3 + 2))
+        vals = np.zeros((nbins, len(labels) * 3 + 6))
         percentile = np.zeros((nbins, 101, len(labels)))
 
     # Run LS Measurements
     start_time = time.time()
+    progress = _progress.Progress("Running lineStrengths", nbins)
     if config["GENERAL"]["PARALLEL"] == True:
         printStatus.running("Running lineStrengths in parallel mode")
         logging.info("Running lineStrengths in parallel mode")
@@ -557,9 +644,10 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
             for _ in range(config["GENERAL"]["NCPU"])
         ]
 
-        # Start worker processes
-        for p in ps:
-            p.start()
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
 
         # Fill the queue
         for i in range(nbins):
@@ -584,7 +672,10 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
             )
 
         # now get the results with indices
-        ls_tmp = [outQueue.get() for _ in range(nbins)]
+        ls_tmp = []
+        for _ in range(nbins):
+            ls_tmp.append(outQueue.get())
+            progress.update(failed=_progress.failedFit(ls_tmp[-1][1]))
 
         # send stop signal to stop iteration
         for _ in range(config["GENERAL"]["NCPU"]):
@@ -644,6 +735,7 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
                     i,
                     MCMC,
                 )
+                progress.update(failed=np.all(np.isnan(ls_indices[i, :])))
         elif MCMC == False:
             for i in range(nbins):
                 ls_indices[i, :], ls_errors[i, :] = run_ls(
@@ -663,8 +755,10 @@ def measureLineStrengths(config, RESOLUTION="ORIGINAL"):
                     i,
                     MCMC,
                 )
+                progress.update(failed=np.all(np.isnan(ls_indices[i, :])))
 
         printStatus.updateDone("Running lineStrengths in serial mode", progressbar=True)
+    progress.close()
 
     print(
         "             Running lineStrengths on %s spectra took %.2fs using %i cores"
@@ -9,8 +9,9 @@ import emcee
 import matplotlib.pyplot as plt
 # import h5py
 import numpy
-import scipy.spatial.qhull as qhull
 from astropy.io import fits
+from scipy.interpolate import LinearNDInterpolator, RegularGridInterpolator
+from scipy.spatial import Delaunay
 
 
 # ===============================================================================
@@ -71,19 +72,42 @@ def load_models(modelfile, index_names):
         tmp = model.field(index_names[i])
         model_indices[:, i] = tmp
 
-    ## Creating the triangulation array
+    ## Creating the interpolation structure over the model grid
     params = numpy.empty((nmodels, 3))
     #    params[:,0] = numpy.log10(model.field('AGE'))
     params[:, 0] = model.field("AGE")
     params[:, 1] = model.field("MET")
     params[:, 2] = model.field("ALPHA")
-    tri = qhull.Delaunay(params, qhull_options="QJ")
+    tri = build_interpolator(params, model_indices)
     #    labels = ['LOG_AGE','MET','ALPHA']
     labels = ["AGE", "METAL", "ALPHA"]
 
     return model_indices, params, tri, labels
 
 
+# ===============================================================================
+def build_interpolator(params, model_indices):
+    # Builds the interpolator that returns all model indices at a set of
+    # (Age, Met, Alpha) points in a single call. If the models sample a complete
+    # regular grid, a multilinear interpolator is used. Otherwise we fall back
+    # to a linear interpolation on the Delaunay triangulation of the models.
+    axes = [numpy.unique(params[:, i]) for i in range(params.shape[1])]
+    shape = tuple(len(ax) for ax in axes)
+    if numpy.prod(shape) == len(params):
+        idx = tuple(
+            numpy.searchsorted(axes[i], params[:, i]) for i in range(params.shape[1])
+        )
+        grid = numpy.full(shape + (model_indices.shape[1],), numpy.nan)
+        grid[idx] = model_indices
+        if numpy.all(numpy.isfinite(grid)):
+            return RegularGridInterpolator(
+                axes, grid, method="linear", bounds_error=False, fill_value=numpy.nan
+            )
+
+    tri = Delaunay(params, qhull_options="QJ")
+    return LinearNDInterpolator(tri, model_indices, fill_value=numpy.nan)
+
+
 # ==============================================================================
 def printProgress(
     iteration, total, prefix="", suffix="", decimals=2, barLength=80, color="g"
@@ -120,62 +144,47 @@ def printProgress(
 
 
 # ==============================================================================
-def interp_weights(xyz, uvw, tri):
-    # Creates a Delaunay triangulation and finds the vertices and weights of
-    # points around a given location in parameter space
-
-    d = len(uvw[0, :])
-    simplex = tri.find_simplex(uvw)
-    vertices = numpy.take(tri.simplices, simplex, axis=0)
-    temp = numpy.take(tri.transform, simplex, axis=0)
-    delta = uvw - temp[:, d]
-    bary = numpy.einsum("njk,nk->nj", temp[:, :d, :], delta)
-
-    return vertices, numpy.hstack((bary, 1 - bary.sum(axis=1, keepdims=True)))
+def prior_bounds(model_pars):
+    # Lower and upper limits of the model grid, computed once per fit
+    return numpy.amin(model_pars, axis=0), numpy.amax(model_pars, axis=0)
 
 
 # ==============================================================================
-def interpolate(values, vtx, wts):
-    return numpy.einsum("nj,nj->n", numpy.take(values, vtx), wts)
-
+def lnprior(par, bounds):
+    # par = [nwalkers, Age, Met, Alpha] in no particular order
+    # Rejecting solutions outside some boundary limits
+    par = numpy.atleast_2d(par)
+    inside = numpy.all((par >= bounds[0]) & (par <= bounds[1]), axis=1)
 
-# ==============================================================================
-def lnprior(par, model_pars):
-    # par = [Age, Met, Alpha] in no particular order
-    if (
-        # Rejecting solutions outside some boundary limits
-        (par[0] >= numpy.amin(model_pars[:, 0]))
-        and (par[0] <= numpy.amax(model_pars[:, 0]))
-        and (par[1] >= numpy.amin(model_pars[:, 1]))
-        and (par[1] <= numpy.amax(model_pars[:, 1]))
-        and (par[2] >= numpy.amin(model_pars[:, 2]))
-        and (par[2] <= numpy.amax(model_pars[:, 2]))
-    ):
-        return 0.0
-
-    return -numpy.inf
+    return numpy.where(inside, 0.0, -numpy.inf)
 
 
 # ==============================================================================
 def compute_indices(par, data, model_indices, params, tri):
-    input_pt = numpy.array(par, ndmin=2)
-    vtx, wts = interp_weights(params, input_pt, tri)
-    outindices = numpy.zeros(len(data))
-    for i in range(len(model_indices[0, :])):
-        outindices[i] = interpolate(model_indices[:, i], vtx, wts)
+    # Interpolates all model indices at all given points at once. For a single
+    # point a 1D array is returned, otherwise an array of shape [npoints, nindex].
+    input_pt = numpy.array(par, ndmin=2, dtype=float)
+    outindices = tri(input_pt)
+    if numpy.ndim(par) == 1:
+        return outindices[0, :]
 
     return outindices
 
 
 # ==============================================================================
-def lnprob(par, data, error, model_indices, params, tri):
+def lnprob(par, data, error, model_indices, params, tri, bounds):
+    # Vectorised over all walkers: par has the shape [nwalkers, ndim]
+    par = numpy.atleast_2d(par)
+    out = numpy.full(len(par), -numpy.inf)
+
     # Checking the priors
-    lp = lnprior(par, params)
-    if not numpy.isfinite(lp):
-        return -numpy.inf
+    lp = lnprior(par, bounds)
+    good = numpy.isfinite(lp)
+    if not numpy.any(good):
+        return out
 
-    # Interpolating the model grid indices at desired point
-    out_indices = compute_indices(par, data, model_indices, params, tri)
+    # Interpolating the model grid indices at desired points
+    out_indices = compute_indices(par[good, :], data, model_indices, params, tri)
 
     # Computing the likelyhood for a given set of params
     bad = error <= 0.0
@@ -183,14 +192,14 @@ def lnprob(par, data, error, model_indices, params, tri):
         error = error * 0.0 + 1e10
     inv_sigma2 = 1.0 / (error**2)
     lnlike = -0.5 * numpy.sum(
-        (data - out_indices) ** 2 * inv_sigma2 - numpy.log(inv_sigma2)
+        (data - out_indices) ** 2 * inv_sigma2 - numpy.log(inv_sigma2), axis=1
     )
 
     # Safety check. If lnlike is not finite then return -numpy.inf
-    if not numpy.isfinite(lnlike):
-        return -numpy.inf
+    lnlike[~numpy.isfinite(lnlike)] = -numpy.inf
+    out[good] = lp[good] + lnlike
 
-    return lp + lnlike
+    return out
 
 
 # ==============================================================================
@@ -208,7 +217,16 @@ def ssppop_fitting(
     progress,
     ncases,
     outdir,
+    adaptive=False,
+    ntau=50,
+    tau_tol=0.01,
+    tau_step=100,
 ):
+    # If adaptive is True, nchain is the maximum number of iterations. Every
+    # tau_step iterations the integrated autocorrelation time tau is estimated
+    # and the chain is stopped once it is longer than ntau*tau and tau changed
+    # by less than tau_tol (relative) since the last check.
+
     # Print progressbar
     # printProgress(progress, ncases, prefix = ' Progress:', suffix = 'Complete', barLength = 50)
 
@@ -220,14 +238,23 @@ def ssppop_fitting(
     kick = [0.05, 0.05, 0.05]
     p0 = [zpt + kick * numpy.random.randn(ndim) for i in range(nwalkers)]
 
-    # Setting up the sampler
+    # Prior bounds do not change during the fit
+    bounds = prior_bounds(params)
+
+    # Setting up the sampler, evaluating all walkers in one call
     sampler = emcee.EnsembleSampler(
-        nwalkers, ndim, lnprob, args=(data, error, model_indices, params, tri)
+        nwalkers,
+        ndim,
+        lnprob,
+        args=(data, error, model_indices, params, tri, bounds),
+        vectorize=True,
     )
 
-    # Running the Markov chain for NCHAIN iterations
+    # Running the Markov chain for (at most) NCHAIN iterations
     sampler.reset()
     #    print("")
+    converged = False
+    old_tau = numpy.inf
     for counter, result in enumerate(sampler.sample(p0, iterations=nchain)):
         if verbose == 1:
             printProgress(
@@ -238,6 +265,23 @@ def ssppop_fitting(
                 barLength=50,
             )
 
+        # Check convergence in blocks of tau_step iterations
+        if adaptive == True and (counter + 1) % tau_step == 0:
+            tau = sampler.get_autocorr_time(tol=0)
+            converged = numpy.all(ntau * tau < sampler.iteration) and numpy.all(
+                numpy.abs(old_tau - tau) / tau < tau_tol
+            )
+            if converged:
+                break
+            old_tau = tau
+
+    # Convergence diagnostics
+    nsteps = sampler.iteration
+    tau = numpy.nanmax(sampler.get_autocorr_time(tol=0))
+    if adaptive == False:
+        converged = ntau * tau < nsteps
+    acceptance = numpy.mean(sampler.acceptance_fraction)
+
     #    print("Mean acceptance fraction: {0:.3f}".format(numpy.mean(sampler.acceptance_fraction)))
     #    print("Autocorrelation time:", sampler.get_autocorr_time())
 
@@ -270,7 +314,9 @@ def ssppop_fitting(
         plt.savefig(outdir + "maps/MCMC/Corner_BINID" + str(progress) + ".pdf", dpi=30)
 
     # Storing results
-    outpars = numpy.zeros(3 * ndim + 2)  # Params (3*ndim), LnP, flag
+    outpars = numpy.zeros(
+        3 * ndim + 6
+    )  # Params (3*ndim), LnP, flag, nsteps, tau, acceptance, converged
     for i in range(ndim):
         outpars[3 * i] = numpy.percentile(good_samples[:, i], 50)
         outpars[3 * i + 1] = numpy.percentile(good_samples[:, i], 16) - outpars[3 * i]
@@ -291,11 +337,17 @@ def ssppop_fitting(
     # Flag cases where solution is close to a boundary of parameter space
     outpars[3 * ndim + 1] = 1
     for i in range(ndim - 1):
-        dlo = numpy.abs(outpars[3 * i] - numpy.amin(params[:, i]))
-        dhi = numpy.abs(outpars[3 * i] - numpy.amax(params[:, i]))
+        dlo = numpy.abs(outpars[3 * i] - bounds[0][i])
+        dhi = numpy.abs(outpars[3 * i] - bounds[1][i])
         if (dlo < 0.01) or (dhi < 0.01):
             outpars[3 * ndim + 1] = 0
 
+    # Storing the convergence diagnostics
+    outpars[3 * ndim + 2] = nsteps
+    outpars[3 * ndim + 3] = tau
+    outpars[3 * ndim + 4] = acceptance
+    outpars[3 * ndim + 5] = int(converged)
+
     return outpars, good_samples
 
 
@@ -450,8 +502,8 @@ if __name__ == "__main__":
                 name="D" + labels[i] + "_HI", format="D", array=vals[ispax, 3 * i + 2]
             )
         )
-    cols.append(fits.Column(name="lnP", format="D", array=vals[ispax, -2]))
-    cols.append(fits.Column(name="Flag", format="D", array=vals[ispax, -1]))
+    cols.append(fits.Column(name="lnP", format="D", array=vals[ispax, 3 * ndim]))
+    cols.append(fits.Column(name="Flag", format="D", array=vals[ispax, 3 * ndim + 1]))
     tbhdu = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
     tbhdu.writeto(outfits)
 
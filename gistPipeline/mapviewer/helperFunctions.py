@@ -19,20 +19,21 @@ def getVoronoiBin(self):
     """
     Identify the Voronoi-bin/spaxel closest to the clicked location on the map
     """
-    idx = np.where(
-        np.logical_and(
-            np.abs(self.table.X - self.mouse.xdata) < self.pixelsize,
-            np.abs(self.table.Y - self.mouse.ydata) < self.pixelsize,
-        )
-    )[0]
-
-    if len(idx) == 1:
-        final_idx = idx[0]
-    elif len(idx) == 4:
-        xmini = np.argsort(np.abs(self.table.X[idx] - self.mouse.xdata))[:2]
-        ymini = np.argmin(np.abs(self.table.Y[idx[xmini]] - self.mouse.ydata))
-        final_idx = idx[xmini[ymini]]
-    else:
+    if self.mouse.xdata is None or self.mouse.ydata is None:
+        return None
+
+    # Look up the nearest spaxel in the pixel grid built in loadData
+    i = int(np.round((self.mouse.xdata - self.gridOrigin[0]) / self.pixelsize))
+    j = int(np.round((self.mouse.ydata - self.gridOrigin[1]) / self.pixelsize))
+    if (
+        i < 0
+        or j < 0
+        or i >= self.spaxelGrid.shape[0]
+        or j >= self.spaxelGrid.shape[1]
+    ):
+        return None
+    final_idx = self.spaxelGrid[i, j]
+    if final_idx < 0:
         return None
 
     # Save index of chosen Voronoi-bin
@@ -1,11 +1,70 @@
 import os
+from collections import OrderedDict
 
 import numpy as np
 from astropy.io import fits
 
+# Number of recently viewed bins for which spectra and best fits are cached
+CACHESIZE = 32
+
+
+class LazyRows:
+    """
+    Row-wise access to a column of a FITS table, e.g. the spectra or best fits
+    of all bins. Rows are only read from the memory-mapped file when they are
+    requested, and the most recently used ones are kept in a small LRU cache.
+    """
+
+    def __init__(self, hdu, column, cachesize=CACHESIZE):
+        self.data = hdu.data
+        self.column = column
+        self.cachesize = cachesize
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def shape(self):
+        return (len(self),) + self.getRow(0).shape
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self.getRow(key[0])[key[1:]]
+        return self.getRow(key)
+
+    def getRow(self, idx):
+        idx = int(idx)
+        if idx in self.cache:
+            self.cache.move_to_end(idx)
+        else:
+            self.cache[idx] = np.array(self.data.field(self.column)[idx])
+            if len(self.cache) > self.cachesize:
+                self.cache.popitem(last=False)
+        return self.cache[idx]
+
+
+def openFits(self, suffix):
+    """Open an output file of the run only once, using memmap."""
+    if suffix not in self.fitsFiles:
+        self.fitsFiles[suffix] = fits.open(self.dirprefix + suffix, memmap=True)
+    return self.fitsFiles[suffix]
+
+
+def closeFits(self):
+    """Close all output files opened by a previous call of loadData."""
+    for hdul in getattr(self, "fitsFiles", {}).values():
+        hdul.close()
+    self.fitsFiles = {}
+
 
 def loadData(self):
-    """Load all available data to make it accessible for plotting."""
+    """
+    Load all available data to make it accessible for plotting. Result tables
+    are read immediately, while spectra and best fits are read bin by bin when
+    they are plotted.
+    """
+    closeFits(self)
 
     # Clean all figures
     try:
@@ -100,33 +159,44 @@ def loadData(self):
     # ======================================================== #
 
     # Read table and get transformation array
-    self.table = fits.open(self.dirprefix + "_table.fits")[1].data
-    self.pixelsize = fits.open(self.dirprefix + "_table.fits")[0].header["PIXSIZE"]
+    hdul = openFits(self, "_table.fits")
+    self.table = hdul[1].data
+    self.pixelsize = hdul[0].header["PIXSIZE"]
     _, idxConvertShortToLong = np.unique(np.abs(self.table.BIN_ID), return_inverse=True)
 
+    # Pixel-grid lookup of all spaxels, used to identify the clicked spaxel
+    X = np.array(self.table.X)
+    Y = np.array(self.table.Y)
+    idxGood = np.where(np.logical_and(np.isfinite(X), np.isfinite(Y)))[0]
+    self.gridOrigin = np.array([np.min(X[idxGood]), np.min(Y[idxGood])])
+    i = np.array(
+        np.round((X[idxGood] - self.gridOrigin[0]) / self.pixelsize), dtype=int
+    )
+    j = np.array(
+        np.round((Y[idxGood] - self.gridOrigin[1]) / self.pixelsize), dtype=int
+    )
+    self.spaxelGrid = np.full((np.max(i) + 1, np.max(j) + 1), -1, dtype=int)
+    self.spaxelGrid[i, j] = idxGood
+
     # Read spectra
-    self.Spectra = fits.open(self.dirprefix + "_BinSpectra.fits")[1].data.SPEC
-    self.Lambda = fits.open(self.dirprefix + "_BinSpectra.fits")[2].data.LOGLAM
-    nbins = self.Spectra.shape[0]
+    hdul = openFits(self, "_BinSpectra.fits")
+    self.Spectra = LazyRows(hdul[1], "SPEC")
+    self.Lambda = np.array(hdul[2].data.LOGLAM)
+    nbins = len(self.Spectra)
     if self.gasLevel == "SPAXEL":
-        self.AllSpectra = fits.open(self.dirprefix + "_AllSpectra.fits")[1].data.SPEC
+        self.AllSpectra = LazyRows(openFits(self, "_AllSpectra.fits")[1], "SPEC")
 
     # Read mask
     if self.MASK == True:
-        self.Mask = fits.open(self.dirprefix + "_mask.fits")[1].data
+        self.Mask = openFits(self, "_mask.fits")[1].data
 
     # Read stellar kinematics
     if self.KIN == True:
-        self.kinResults = fits.open(self.dirprefix + "_kin.fits")[1].data[
-            idxConvertShortToLong
-        ]
-        self.kinBestfit = fits.open(self.dirprefix + "_kin-bestfit.fits")[
-            1
-        ].data.BESTFIT
-        self.kinLambda = fits.open(self.dirprefix + "_kin-bestfit.fits")[2].data.LOGLAM
-        self.kinGoodpix = fits.open(self.dirprefix + "_kin-bestfit.fits")[
-            3
-        ].data.GOODPIX
+        self.kinResults = openFits(self, "_kin.fits")[1].data[idxConvertShortToLong]
+        hdul = openFits(self, "_kin-bestfit.fits")
+        self.kinBestfit = LazyRows(hdul[1], "BESTFIT")
+        self.kinLambda = np.array(hdul[2].data.LOGLAM)
+        self.kinGoodpix = np.array(hdul[3].data.GOODPIX)
 
         # following line does not work if your data is not symetric around centre
         #median_V_stellar = np.nanmedian(
@@ -142,24 +212,19 @@ def loadData(self):
     # Read emissionLines results
     if self.GAS == True:
         if os.path.isfile(self.dirprefix + "_gas-cleaned_BIN.fits") == True:
-            self.EmissionSubtractedSpectraBIN = np.array(
-                fits.open(self.dirprefix + "_gas-cleaned_BIN.fits")[1].data.SPEC
+            self.EmissionSubtractedSpectraBIN = LazyRows(
+                openFits(self, "_gas-cleaned_BIN.fits")[1], "SPEC"
             )
         if os.path.isfile(self.dirprefix + "_gas-cleaned_SPAXEL.fits") == True:
-            self.EmissionSubtractedSpectraSPAXEL = np.array(
-                fits.open(self.dirprefix + "_gas-cleaned_SPAXEL.fits")[1].data.SPEC
+            self.EmissionSubtractedSpectraSPAXEL = LazyRows(
+                openFits(self, "_gas-cleaned_SPAXEL.fits")[1], "SPEC"
             )
 
-        gas = fits.open(self.dirprefix + "_gas_" + self.gasLevel + ".fits")[1].data
-        self.gasBestfit = fits.open(
-            self.dirprefix + "_gas-bestfit_" + self.gasLevel + ".fits"
-        )[1].data.BESTFIT
-        self.gasLambda = fits.open(
-            self.dirprefix + "_gas-bestfit_" + self.gasLevel + ".fits"
-        )[2].data.LOGLAM
-        self.gasGoodpix = fits.open(
-            self.dirprefix + "_gas-bestfit_" + self.gasLevel + ".fits"
-        )[3].data.GOODPIX
+        gas = openFits(self, "_gas_" + self.gasLevel + ".fits")[1].data
+        hdul = openFits(self, "_gas-bestfit_" + self.gasLevel + ".fits")
+        self.gasBestfit = LazyRows(hdul[1], "BESTFIT")
+        self.gasLambda = np.array(hdul[2].data.LOGLAM)
+        self.gasGoodpix = np.array(hdul[3].data.GOODPIX)
 
         if self.gasLevel == "BIN":
             self.gasResults = gas[idxConvertShortToLong]
@@ -177,27 +242,22 @@ def loadData(self):
 
     # Read starFormatioHistories results
     if self.SFH == True:
-        self.sfhResults = fits.open(self.dirprefix + "_sfh.fits")[1].data[
-            idxConvertShortToLong
-        ]
-        self.sfhBestfit = fits.open(self.dirprefix + "_sfh-bestfit.fits")[
-            1
-        ].data.BESTFIT
-        self.sfhLambda = fits.open(self.dirprefix + "_sfh-bestfit.fits")[2].data.LOGLAM
-        self.sfhGoodpix = fits.open(self.dirprefix + "_sfh-bestfit.fits")[
-            3
-        ].data.GOODPIX
+        self.sfhResults = openFits(self, "_sfh.fits")[1].data[idxConvertShortToLong]
+        hdul = openFits(self, "_sfh-bestfit.fits")
+        self.sfhBestfit = LazyRows(hdul[1], "BESTFIT")
+        self.sfhLambda = np.array(hdul[2].data.LOGLAM)
+        self.sfhGoodpix = np.array(hdul[3].data.GOODPIX)
 
         if "V" in self.sfhResults.names:
             self.sfhResults.V = self.sfhResults.V - median_V_stellar
 
         # Read the age, metallicity and [Mg/Fe] grid
-        grid = fits.open(self.dirprefix + "_sfh-weights.fits")[2].data
+        hdu_weights = openFits(self, "_sfh-weights.fits")
+        grid = hdu_weights[2].data
         self.metals = np.unique(grid.METAL)
         self.age = np.power(10, np.unique(grid.LOGAGE))
 
         # Read weights
-        hdu_weights = fits.open(self.dirprefix + "_sfh-weights.fits")
         nAges = hdu_weights[0].header["NAGES"]
         nMetal = hdu_weights[0].header["NMETAL"]
         nAlpha = hdu_weights[0].header["NALPHA"]
@@ -217,9 +277,9 @@ def loadData(self):
     # Read lineStrengths results
     if self.LINE_STRENGTH == True:
         if self.LsLevel == "ORIGINAL":
-            ls = fits.open(self.dirprefix + "_ls_OrigRes.fits")[1].data
+            ls = openFits(self, "_ls_OrigRes.fits")[1].data
         elif self.LsLevel == "ADAPTED":
-            ls = fits.open(self.dirprefix + "_ls_AdapRes.fits")[1].data
+            ls = openFits(self, "_ls_AdapRes.fits")[1].data
         self.lsResults = ls[idxConvertShortToLong]
     else:
         self.lsResults = None
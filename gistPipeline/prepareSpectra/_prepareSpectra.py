@@ -2,8 +2,11 @@ import importlib.util
 import logging
 import os
 
+from astropy.io import fits
 from printStatus import printStatus
 
+from gistPipeline.auxiliary import _auxiliary
+
 
 def prepareSpectra_Module(config, cube):
     """
@@ -34,6 +37,26 @@ def prepareSpectra_Module(config, cube):
         printStatus.done("Results are already available. Module is skipped.")
         return None
 
+    # Check if the spectra of a previous run with identical spectra and bins
+    # can be reused
+    outputFiles = [
+        outputPrefix + "_AllSpectra.fits",
+        outputPrefix + "_BinSpectra.fits",
+        outputPrefix + "_BinSpectra_linear.fits",
+    ]
+    binningHash = _auxiliary.readHash(outputPrefix + "_table.fits", "BINHASH")
+    spectraHash = getSpectraHash(config, binningHash)
+    if binningHash != None and all(
+        _auxiliary.readHash(file, "SPECHASH") == spectraHash for file in outputFiles
+    ):
+        logging.info(
+            "The spectra of a previous run with identical input and spatial bins are reused. Module is skipped."
+        )
+        printStatus.done(
+            "Spectra of a previous run with identical input and spatial bins are reused. Module is skipped."
+        )
+        return None
+
     # Import the chosen prepareSpectra routine
     try:
         spec = importlib.util.spec_from_file_location(
@@ -60,6 +83,9 @@ def prepareSpectra_Module(config, cube):
     # Execute the chosen spatialBinning routine
     try:
         module.prepSpectra(config, cube)
+        if binningHash != None:
+            for file in outputFiles:
+                fits.setval(file, "SPECHASH", value=spectraHash)
     except Exception as e:
         logging.critical(e, exc_info=True)
         message = "Routine " + config["PREPARE_SPECTRA"]["METHOD"] + " failed."
@@ -69,3 +95,23 @@ def prepareSpectra_Module(config, cube):
 
     # Return
     return None
+
+
+def getSpectraHash(config, binningHash):
+    """
+    Returns a checksum of everything that determines the spectra: the input
+    file (path, size and modification time), the configuration of the
+    READ_DATA and PREPARE_SPECTRA modules, the redshift, and the checksum of
+    the spatial bins. The spectra themselves are not hashed, as this would
+    take several seconds for a large cube on every run.
+    """
+    stat = os.stat(config["GENERAL"]["INPUT"])
+    return _auxiliary.inputHash(
+        binningHash,
+        os.path.abspath(config["GENERAL"]["INPUT"]),
+        stat.st_size,
+        stat.st_mtime_ns,
+        config["GENERAL"]["REDSHIFT"],
+        sorted(config["READ_DATA"].items()),
+        sorted(config["PREPARE_SPECTRA"].items()),
+    )
@@ -4,13 +4,46 @@ import os
 
 from printStatus import printStatus
 
+from gistPipeline.auxiliary import _prefetch
+
+
+class QuietStatus:
+    """
+    Replaces printStatus (and print) in quiet mode, discarding all messages.
+    """
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return None
+
 
 def prepareTemplates_Module(
-    config, lmin, lmax, velscale, LSF_Data, LSF_Templates, module_used, sortInGrid=False
+    config,
+    lmin,
+    lmax,
+    velscale,
+    LSF_Data,
+    LSF_Templates,
+    module_used,
+    sortInGrid=False,
+    quiet=False,
 ):
     """
     This function calls the prepareTemplates routine specified by the user.
+    With quiet=True, no status messages are printed, e.g. when the templates
+    are prepared in the background.
     """
+    status = QuietStatus() if quiet else printStatus
+
+    # Use the templates which have already been prepared in the background
+    prefetched = _prefetch.takeTemplates(module_used, lmin, lmax, velscale, sortInGrid)
+    if prefetched is not None:
+        printStatus.done("Prepared the stellar population templates in the background")
+        logging.info("Using the stellar population templates prepared in the background")
+        return prefetched
+
     # Import the chosen prepareTemplates routine
     try:
         spec = importlib.util.spec_from_file_location(
@@ -25,6 +58,9 @@ def prepareTemplates_Module(
         )
         prepTemplatesModule = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(prepTemplatesModule)
+        if quiet:
+            prepTemplatesModule.printStatus = status
+            prepTemplatesModule.print = status
     except Exception as e:
         logging.critical(e, exc_info=True)
         message = (
@@ -32,7 +68,7 @@ def prepareTemplates_Module(
             + config[module_used]["TEMPLATE_SET"]
             + ".py'"
         )
-        printStatus.failed(message)
+        status.failed(message)
         logging.critical(message)
         return "SKIP"
 
@@ -63,7 +99,7 @@ def prepareTemplates_Module(
     except Exception as e:
         logging.critical(e, exc_info=True)
         message = "Routine '" + config[module_used]["TEMPLATE_SET"] + ".py' failed."
-        printStatus.failed(message)
+        status.failed(message)
         logging.critical(message)
         return "SKIP"
 
@@ -5,6 +5,8 @@ import numpy as np
 from astropy.io import fits
 from printStatus import printStatus
 
+from gistPipeline.readData.spectral_stats import spectralStatistics
+
 
 # ======================================
 # Routine to set DEBUG mode
@@ -18,6 +20,8 @@ def set_debug(cube, xext, yext):
     cube["snr"] = cube["snr"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["signal"] = cube["signal"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["noise"] = cube["noise"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
+    cube["nnan"] = cube["nnan"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
+    cube["median"] = cube["median"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
 
     cube["spec"] = cube["spec"][:, int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["error"] = cube["error"][:, int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
@@ -105,9 +109,10 @@ def readCube(config):
             wave <= config["READ_DATA"]["LMAX_SNR"],
         )
     )[0]
-    signal = np.nanmedian(spec[idx_snr, :], axis=0)
-    noise = np.abs(np.nanmedian(np.sqrt(espec[idx_snr, :]), axis=0))
-    snr = signal / noise
+    stats = spectralStatistics(spec, espec, idx_snr, noise_method="median_sqrt")
+    signal = stats["signal"]
+    noise = stats["noise"]
+    snr = stats["snr"]
     logging.info(
         "Computing the signal-to-noise ratio in the wavelength range from "
         + str(config["READ_DATA"]["LMIN_SNR"])
@@ -126,6 +131,8 @@ def readCube(config):
         "snr": snr,
         "signal": signal,
         "noise": noise,
+        "nnan": stats["nnan"],
+        "median": stats["median"],
         "pixelsize": pixelsize,
     }
 
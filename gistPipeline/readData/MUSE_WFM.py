@@ -8,6 +8,7 @@ from astropy.wcs import WCS
 from printStatus import printStatus
 
 from gistPipeline.readData import der_snr as der_snr
+from gistPipeline.readData.spectral_stats import spectralStatistics
 
 
 # ======================================
@@ -22,6 +23,8 @@ def set_debug(cube, xext, yext):
     cube["snr"] = cube["snr"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["signal"] = cube["signal"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["noise"] = cube["noise"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
+    cube["nnan"] = cube["nnan"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
+    cube["median"] = cube["median"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
 
     cube["spec"] = cube["spec"][:, int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["error"] = cube["error"][:, int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
@@ -151,9 +154,10 @@ def readCube(config):
             wave <= config["READ_DATA"]["LMAX_SNR"],
         )
     )[0]
-    signal = np.nanmedian(spec[idx_snr, :], axis=0)
-    noise = np.sqrt(np.nanmedian(espec[idx_snr, :], axis=0))
-    snr = np.nanmedian(spec[idx_snr, :] / np.sqrt(espec[idx_snr, :]), axis=0)
+    stats = spectralStatistics(spec, espec, idx_snr, noise_method="sqrt_median")
+    signal = stats["signal"]
+    noise = stats["noise"]
+    snr = stats["snr"]
     logging.info(
         "Computing the signal-to-noise ratio in the wavelength range from "
         + str(config["READ_DATA"]["LMIN_SNR"])
@@ -172,6 +176,8 @@ def readCube(config):
         "snr": snr,
         "signal": signal,
         "noise": noise,
+        "nnan": stats["nnan"],
+        "median": stats["median"],
         "pixelsize": pixelsize,
         "wcshdr": wcshdr,
     }
@@ -6,6 +6,7 @@ from astropy.io import fits
 from printStatus import printStatus
 
 from gistPipeline.readData import der_snr as der_snr
+from gistPipeline.readData.spectral_stats import spectralStatistics
 
 
 # ======================================
@@ -20,6 +21,8 @@ def set_debug(cube, xext, yext):
     cube["snr"] = cube["snr"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["signal"] = cube["signal"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["noise"] = cube["noise"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
+    cube["nnan"] = cube["nnan"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
+    cube["median"] = cube["median"][int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
 
     cube["spec"] = cube["spec"][:, int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
     cube["error"] = cube["error"][:, int(yext / 2) * xext : (int(yext / 2) + 1) * xext]
@@ -118,12 +121,24 @@ def readCube(config):
             ]
         )
     )[0]
-    signal = np.nanmedian(spec[idx_snr, :], axis=0)
+
+    # The np.nan in the laser region are replaced by the median of the spectrum
+    idx_laser = np.where(
+        np.logical_and(
+            wave > 5760 / (1 + config["GENERAL"]["REDSHIFT"]),
+            wave < 6010 / (1 + config["GENERAL"]["REDSHIFT"]),
+        )
+    )[0]
     if len(hdu) == 3:
-        noise = np.abs(np.nanmedian(np.sqrt(espec[idx_snr, :]), axis=0))
+        noise_method = "median_sqrt"
     elif len(hdu) == 2:
-        noise = espec[0, :]  # DER_SNR returns constant error spectra
-    snr = signal / noise
+        noise_method = "der_snr"  # DER_SNR returns constant error spectra
+    stats = spectralStatistics(
+        spec, espec, idx_snr, noise_method=noise_method, idx_fill=idx_laser
+    )
+    signal = stats["signal"]
+    noise = stats["noise"]
+    snr = stats["snr"]
     logging.info(
         "Computing the signal-to-noise ratio in the wavelength range from "
         + str(config["READ_DATA"]["LMIN_SNR"])
@@ -131,16 +146,6 @@ def readCube(config):
         + str(config["READ_DATA"]["LMAX_SNR"])
         + "A, while ignoring the wavelength range affected by the LGS."
     )
-
-    # Replacing the np.nan in the laser region by the median of the spectrum
-    idx_laser = np.where(
-        np.logical_and(
-            wave > 5760 / (1 + config["GENERAL"]["REDSHIFT"]),
-            wave < 6010 / (1 + config["GENERAL"]["REDSHIFT"]),
-        )
-    )[0]
-    spec[idx_laser, :] = signal
-    espec[idx_laser, :] = noise
     logging.info(
         "Replacing the spectral region affected by the LGS (5760A-6010A) with the median signal of the spectra."
     )
@@ -155,6 +160,8 @@ def readCube(config):
         "snr": snr,
         "signal": signal,
         "noise": noise,
+        "nnan": stats["nnan"],
+        "median": stats["median"],
         "pixelsize": pixelsize,
     }
 
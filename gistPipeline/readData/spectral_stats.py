@@ -0,0 +1,65 @@
+import numpy as np
+
+"""
+PURPOSE:
+  Computes all statistics of the spaxels which are required by the readData
+  and spatialMasking modules in a single pass over the spectra. The spectra are
+  processed in chunks of spaxels, so that each chunk is read from memory only
+  once and no temporary arrays of the size of the cube are created.
+"""
+
+# Number of spaxels processed at once
+CHUNKSIZE = 2048
+
+
+def spectralStatistics(
+    spec, espec, idx_snr, noise_method="median_sqrt", idx_fill=None, chunksize=CHUNKSIZE
+):
+    """
+    Returns the signal, noise and signal-to-noise ratio of every spaxel in the
+    spectral pixels idx_snr, together with the number of np.nan's (NNAN) and
+    the median (MEDIAN) of its full spectrum, as used for the masking of
+    defunct spaxels.
+
+    The noise is derived from the variance spectra espec according to
+    noise_method:
+     * 'median_sqrt': noise = |median(sqrt(espec))| and snr = signal / noise
+     * 'sqrt_median': noise = sqrt(median(espec)) and snr = median(spec / sqrt(espec))
+     * 'der_snr': espec are the constant error spectra returned by der_snr,
+       noise = espec[0] and snr = signal / noise
+
+    If idx_fill is given, these spectral pixels (e.g. the region affected by
+    the laser guide star) are replaced in spec and espec by the signal and
+    noise of the spaxel, before the np.nan's and the median are determined.
+    """
+    if noise_method not in ["median_sqrt", "sqrt_median", "der_snr"]:
+        raise ValueError("Unknown noise_method '" + str(noise_method) + "'")
+
+    stats = {"signal": [], "noise": [], "snr": [], "nnan": [], "median": []}
+    for start in range(0, spec.shape[1], chunksize):
+        chunk = slice(start, start + chunksize)
+
+        spec_snr = spec[idx_snr, chunk]
+        signal = np.nanmedian(spec_snr, axis=0)
+        if noise_method == "median_sqrt":
+            noise = np.abs(np.nanmedian(np.sqrt(espec[idx_snr, chunk]), axis=0))
+            snr = signal / noise
+        elif noise_method == "sqrt_median":
+            espec_snr = espec[idx_snr, chunk]
+            noise = np.sqrt(np.nanmedian(espec_snr, axis=0))
+            snr = np.nanmedian(spec_snr / np.sqrt(espec_snr), axis=0)
+        elif noise_method == "der_snr":
+            noise = espec[0, chunk].copy()
+            snr = signal / noise
+
+        if idx_fill is not None:
+            spec[idx_fill, chunk] = signal
+            espec[idx_fill, chunk] = noise
+
+        stats["signal"].append(signal)
+        stats["noise"].append(noise)
+        stats["snr"].append(snr)
+        stats["nnan"].append(np.sum(np.isnan(spec[:, chunk]), axis=0))
+        stats["median"].append(np.nanmedian(spec[:, chunk], axis=0))
+
+    return {key: np.concatenate(value) for key, value in stats.items()}
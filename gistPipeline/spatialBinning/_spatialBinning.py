@@ -2,8 +2,11 @@ import importlib.util
 import logging
 import os
 
+import numpy as np
+from astropy.io import fits
 from printStatus import printStatus
 
+from gistPipeline.auxiliary import _auxiliary
 from gistPipeline.writeFITS import _writeFITS
 
 
@@ -32,6 +35,17 @@ def spatialBinning_Module(config, cube):
         printStatus.done("Results are already available. Module is skipped.")
         return None
 
+    # Check if the bins of a previous run with identical input can be reused
+    binningHash = getBinningHash(config, cube)
+    if _auxiliary.readHash(outputFile, "BINHASH") == binningHash:
+        logging.info(
+            "The spatial bins of a previous run with identical input are reused. Module is skipped."
+        )
+        printStatus.done(
+            "Spatial bins of a previous run with identical input are reused. Module is skipped."
+        )
+        return None
+
     # Import the chosen spatialBinning routine
     try:
         spec = importlib.util.spec_from_file_location(
@@ -60,7 +74,8 @@ def spatialBinning_Module(config, cube):
 
     # Execute the chosen spatialBinning routine
     try:
-        module.generateSpatialBins(config, cube)
+        if module.generateSpatialBins(config, cube) != "SKIP":
+            fits.setval(outputFile, "BINHASH", value=binningHash)
         _writeFITS.generateFITS(config, "SPATIAL_BINNING")
     except Exception as e:
         logging.critical(e, exc_info=True)
@@ -75,3 +90,28 @@ def spatialBinning_Module(config, cube):
 
     # Return
     return None
+
+
+def getBinningHash(config, cube):
+    """
+    Returns a checksum of everything that determines the spatial bins: the
+    spaxel coordinates, signal, noise and mask, and the binning parameters.
+    """
+    maskfile = (
+        os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
+        + "_mask.fits"
+    )
+    mask = np.array(fits.open(maskfile)[1].data.MASK)
+
+    return _auxiliary.inputHash(
+        cube["x"],
+        cube["y"],
+        cube["signal"],
+        cube["noise"],
+        mask,
+        cube["pixelsize"],
+        config["SPATIAL_BINNING"]["METHOD"],
+        config["SPATIAL_BINNING"]["TARGET_SNR"],
+        config["SPATIAL_BINNING"]["COVARIANCE"],
+        config["SPATIAL_BINNING"].get("MAX_TILE_SPAXELS"),
+    )
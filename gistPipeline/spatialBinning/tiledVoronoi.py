@@ -0,0 +1,255 @@
+import functools
+import logging
+import os
+import time
+
+import numpy as np
+from astropy.io import fits
+from multiprocess import Process, Queue
+from printStatus import printStatus
+from vorbin.voronoi_2d_binning import voronoi_2d_binning
+
+from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.spatialBinning.voronoi import saveBinning, sn_func
+
+"""
+PURPOSE:
+  This file contains a scalable version of the Voronoi-binning for very large
+  fields. The field is divided into tiles, which are Voronoi-binned
+  independently (and in parallel) with the algorithm of Cappellari & Copin 2003
+  (ui.adsabs.harvard.edu/?#abs/2003MNRAS.342..345C). The cost of the bin
+  accretion and the CVT iterations grows much faster than linearly with the
+  number of spaxels, so that binning many small tiles is much faster than
+  binning the whole field at once. Bins do not extend across tiles.
+"""
+
+
+def splitTiles(x, y, signal, noise, snFunc, target_snr, max_spaxels):
+    """
+    Divides the spaxels into tiles of at most max_spaxels spaxels. Tiles are
+    recursively split in two at the median along the longer side of their
+    extent, but only if both halves still reach the target SNR, so that every
+    tile can be Voronoi-binned. Returns a list with the indices of the spaxels
+    in every tile.
+    """
+    tiles = []
+    stack = [np.arange(len(x))]
+    while len(stack) > 0:
+        idx = stack.pop()
+        if len(idx) > max_spaxels:
+            if np.ptp(x[idx]) >= np.ptp(y[idx]):
+                order = np.argsort(x[idx], kind="stable")
+            else:
+                order = np.argsort(y[idx], kind="stable")
+            halves = [idx[order[: len(idx) // 2]], idx[order[len(idx) // 2 :]]]
+            if all(snFunc(half, signal, noise) >= target_snr for half in halves):
+                stack.extend(halves[::-1])
+                continue
+        tiles.append(np.sort(idx))
+    return tiles
+
+
+def binTile(x, y, signal, noise, snr, target_snr, pixelsize, snFunc):
+    """
+    Voronoi-bins the spaxels of one tile. If all spaxels of the tile have
+    sufficient SNR, every spaxel is treated as a bin.
+    """
+    try:
+        binNum, xNode, yNode, _, _, sn, nPixels, _ = voronoi_2d_binning(
+            x,
+            y,
+            signal,
+            noise,
+            target_snr,
+            plot=False,
+            quiet=True,
+            pixelsize=pixelsize,
+            sn_func=snFunc,
+        )
+    except ValueError as e:
+        if str(e) != "All pixels have enough S/N and binning is not needed":
+            raise
+        binNum = np.arange(len(x))
+        xNode = x
+        yNode = y
+        sn = snr
+        nPixels = np.ones(len(x))
+
+    return (binNum, xNode, yNode, sn, nPixels)
+
+
+def workerTiles(inQueue, outQueue):
+    """
+    Defines the worker process of the parallelisation with multiprocessing.Queue
+    and multiprocessing.Process.
+    """
+    for (
+        x,
+        y,
+        signal,
+        noise,
+        snr,
+        target_snr,
+        pixelsize,
+        snFunc,
+        i,
+    ) in iter(inQueue.get, "STOP"):
+        try:
+            result = binTile(x, y, signal, noise, snr, target_snr, pixelsize, snFunc)
+        except Exception as e:
+            result = e
+
+        outQueue.put((i, result))
+
+
+def generateSpatialBins(config, cube):
+    """
+    This function applies the Voronoi-binning algorithm of Cappellari & Copin
+    2003 (ui.adsabs.harvard.edu/?#abs/2003MNRAS.342..345C) to tiles of at most
+    MAX_TILE_SPAXELS unmasked spaxels. Accounting for spatial correlations in
+    the noise, the treatment of masked spaxels and the bintable are the same as
+    in voronoi.generateSpatialBins.
+    """
+    # Pass a function for the SNR calculation to the Voronoi-binning algorithm,
+    # in order to account for spatial correlations in the noise
+    sn_func_covariances = functools.partial(
+        sn_func, covar_vor=config["SPATIAL_BINNING"]["COVARIANCE"]
+    )
+    target_snr = config["SPATIAL_BINNING"]["TARGET_SNR"]
+    max_spaxels = config["SPATIAL_BINNING"].get("MAX_TILE_SPAXELS", 5000)
+
+    # Read maskfile
+    maskfile = (
+        os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
+        + "_mask.fits"
+    )
+    mask = fits.open(maskfile)[1].data.MASK
+    idxUnmasked = np.where(mask == 0)[0]
+    idxMasked = np.where(mask == 1)[0]
+
+    x = cube["x"][idxUnmasked]
+    y = cube["y"][idxUnmasked]
+    signal = cube["signal"][idxUnmasked]
+    noise = cube["noise"][idxUnmasked]
+    snr = cube["snr"][idxUnmasked]
+
+    # Divide the field into tiles
+    tiles = splitTiles(x, y, signal, noise, sn_func_covariances, target_snr, max_spaxels)
+    ntiles = len(tiles)
+    logging.info(
+        "Dividing "
+        + str(len(idxUnmasked))
+        + " spaxels into "
+        + str(ntiles)
+        + " tiles of at most "
+        + str(max_spaxels)
+        + " spaxels"
+    )
+
+    # Generate the Voronoi bins
+    printStatus.running("Defining the Voronoi bins in " + str(ntiles) + " tiles")
+    logging.info("Defining the Voronoi bins in " + str(ntiles) + " tiles")
+    start_time = time.time()
+
+    if config["GENERAL"]["PARALLEL"] == True:
+        # Create Queues
+        inQueue = Queue()
+        outQueue = Queue()
+
+        # Create worker processes
+        ps = [
+            Process(target=workerTiles, args=(inQueue, outQueue))
+            for _ in range(min(config["GENERAL"]["NCPU"], ntiles))
+        ]
+
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
+
+        # Fill the queue
+        for i, idx in enumerate(tiles):
+            inQueue.put(
+                (
+                    x[idx],
+                    y[idx],
+                    signal[idx],
+                    noise[idx],
+                    snr[idx],
+                    target_snr,
+                    cube["pixelsize"],
+                    sn_func_covariances,
+                    i,
+                )
+            )
+
+        # now get the results with indices
+        results = [None] * ntiles
+        for _ in range(ntiles):
+            i, result = outQueue.get()
+            results[i] = result
+
+        # send stop signal to stop iteration
+        for _ in range(len(ps)):
+            inQueue.put("STOP")
+
+        # stop processes
+        for p in ps:
+            p.join()
+
+    elif config["GENERAL"]["PARALLEL"] == False:
+        results = []
+        for idx in tiles:
+            try:
+                results.append(
+                    binTile(
+                        x[idx],
+                        y[idx],
+                        signal[idx],
+                        noise[idx],
+                        snr[idx],
+                        target_snr,
+                        cube["pixelsize"],
+                        sn_func_covariances,
+                    )
+                )
+            except Exception as e:
+                results.append(e)
+
+    # Any uncaught exceptions, causing the galaxy to be skipped
+    for result in results:
+        if isinstance(result, Exception):
+            printStatus.updateFailed("Defining the Voronoi bins in " + str(ntiles) + " tiles")
+            print(
+                "The Voronoi-binning routine of Cappellari & Copin (2003) returned the following error: \n"
+                + str(result)
+            )
+            logging.error(
+                "Defining the Voronoi bins failed. The Voronoi-binning routine of Cappellari & Copin "
+                + "(2003) returned the following error: \n"
+                + str(result)
+            )
+            return "SKIP"
+
+    # Combine the bins of all tiles
+    binNum = np.zeros(len(idxUnmasked), dtype=int)
+    offset = 0
+    for idx, result in zip(tiles, results):
+        binNum[idx] = result[0] + offset
+        offset += len(result[1])
+    xNode = np.concatenate([result[1] for result in results])
+    yNode = np.concatenate([result[2] for result in results])
+    sn = np.concatenate([result[3] for result in results])
+    nPixels = np.concatenate([result[4] for result in results])
+
+    printStatus.updateDone("Defining the Voronoi bins in " + str(ntiles) + " tiles")
+    print("             " + str(np.max(binNum) + 1) + " voronoi bins generated!")
+    logging.info(
+        str(np.max(binNum) + 1)
+        + " Voronoi bins generated in %.2fs" % (time.time() - start_time)
+    )
+
+    # Assign all spaxels to bins and save the bintable
+    saveBinning(config, cube, idxUnmasked, idxMasked, binNum, xNode, yNode, sn, nPixels)
+
+    return None
@@ -4,6 +4,7 @@ import os
 
 import numpy as np
 import scipy.spatial.distance as dist
+from scipy.spatial import cKDTree
 from astropy.io import fits
 from printStatus import printStatus
 from vorbin.voronoi_2d_binning import voronoi_2d_binning
@@ -133,6 +134,17 @@ def generateSpatialBins(config, cube):
             )
             return "SKIP"
 
+    # Assign all spaxels to bins and save the bintable
+    saveBinning(config, cube, idxUnmasked, idxMasked, binNum, xNode, yNode, sn, nPixels)
+
+    return None
+
+
+def saveBinning(config, cube, idxUnmasked, idxMasked, binNum, xNode, yNode, sn, nPixels):
+    """
+    Assigns masked spaxels to the nearest bin and saves the bintable. binNum
+    holds the bins of the unmasked spaxels.
+    """
     # Find the nearest Voronoi bin for the pixels outside the Voronoi region
     binNum_outside = find_nearest_voronoibin(
         cube["x"], cube["y"], idxMasked, xNode, yNode
@@ -165,8 +177,6 @@ def generateSpatialBins(config, cube):
         cube["wcshdr"],
     )
 
-    return None
-
 
 def noBinning(x, y, snr, idx_inside):
     """
@@ -182,22 +192,38 @@ def noBinning(x, y, snr, idx_inside):
     return (binNum, xNode, yNode, sn, nPixels)
 
 
-def find_nearest_voronoibin(x, y, idx_outside, xNode, yNode):
+def find_nearest_voronoibin(x, y, idx_outside, xNode, yNode, chunksize=65536):
     """
     This function determines the nearest Voronoi-bin for all spaxels which do
-    not satisfy the minimum SNR threshold.
+    not satisfy the minimum SNR threshold. The bin nodes are searched with a
+    KD-tree in chunks of spaxels, so that the memory use scales linearly with
+    the number of spaxels. As for a full distance matrix, ties are resolved in
+    favour of the bin with the lowest index.
     """
-    x = x[idx_outside]
-    y = y[idx_outside]
-    pix_coords = np.concatenate(
-        (x.reshape((len(x), 1)), y.reshape((len(y), 1))), axis=1
-    )
-    bin_coords = np.concatenate(
-        (xNode.reshape((len(xNode), 1)), yNode.reshape((len(yNode), 1))), axis=1
-    )
-
-    dists = dist.cdist(pix_coords, bin_coords, "euclidean")
-    closest = np.argmin(dists, axis=1)
+    pix_coords = np.column_stack((x[idx_outside], y[idx_outside]))
+    bin_coords = np.column_stack((xNode, yNode))
+
+    tree = cKDTree(bin_coords)
+    ncand = min(4, len(bin_coords))
+    closest = np.zeros(len(pix_coords), dtype=np.int64)
+    for start in range(0, len(pix_coords), chunksize):
+        pix = pix_coords[start : start + chunksize]
+
+        # Candidate bins, sorted by index, and their exact distances
+        _, cand = tree.query(pix, k=ncand)
+        cand = np.sort(cand.reshape(len(pix), ncand), axis=1)
+        dists = np.sqrt(np.sum((pix[:, np.newaxis, :] - bin_coords[cand]) ** 2, axis=2))
+        nearest = np.argmin(dists, axis=1)
+        closest[start : start + chunksize] = cand[np.arange(len(pix)), nearest]
+
+        # If all candidates are equally distant, further bins might tie as well
+        if ncand < len(bin_coords):
+            dmin = dists[np.arange(len(pix)), nearest]
+            ties = np.where(np.max(dists, axis=1) <= dmin * (1 + 1e-12))[0]
+            if len(ties) > 0:
+                closest[start + ties] = np.argmin(
+                    dist.cdist(pix[ties], bin_coords, "euclidean"), axis=1
+                )
 
     return closest
 
@@ -234,12 +260,12 @@ def save_table(
     yNode_new = np.zeros(len(x))
     sn_new = np.zeros(len(x))
     nPixels_new = np.zeros(len(x))
-    for i in range(len(ubins)):
-        idx = np.where(ubins[i] == np.abs(binNum_new))[0]
-        xNode_new[idx] = xNode[i]
-        yNode_new[idx] = yNode[i]
-        sn_new[idx] = sn[i]
-        nPixels_new[idx] = nPixels[i]
+    ibin = np.clip(np.searchsorted(ubins, np.abs(binNum_new)), 0, len(ubins) - 1)
+    idx = np.where(ubins[ibin] == np.abs(binNum_new))[0]
+    xNode_new[idx] = xNode[ibin[idx]]
+    yNode_new[idx] = yNode[ibin[idx]]
+    sn_new[idx] = sn[ibin[idx]]
+    nPixels_new[idx] = nPixels[ibin[idx]]
 
     # Primary HDU
     priHDU = fits.PrimaryHDU()
@@ -47,21 +47,19 @@ def generateSpatialMask(config, cube):
 def maskDefunctSpaxels(cube):
     """
     Mask defunct spaxels, in particular those containing np.nan's or have a
-    negative median.
+    negative median. The number of np.nan's and the median of the spectra are
+    taken from the cube, if they were determined by the readData module.
     """
+    if "nnan" in cube and "median" in cube:
+        nnan = cube["nnan"]
+        median = cube["median"]
+    else:
+        nnan = np.sum(np.isnan(cube["spec"]), axis=0)
+        median = np.nanmedian(cube["spec"], axis=0)
+
     # Select defunct spaxels
-    idx_good = np.where(
-        np.logical_and(
-            np.all(np.isnan(cube["spec"]) == False, axis=0),
-            np.nanmedian(cube["spec"], axis=0) > 0.0,
-        )
-    )[0]
-    idx_bad = np.where(
-        np.logical_or(
-            np.any(np.isnan(cube["spec"]) == True, axis=0),
-            np.nanmedian(cube["spec"], axis=0) <= 0.0,
-        )
-    )[0]
+    idx_good = np.where(np.logical_and(nnan == 0, median > 0.0))[0]
+    idx_bad = np.where(np.logical_or(nnan > 0, median <= 0.0))[0]
 
     logging.info(
         "Masking defunct spaxels: " + str(len(idx_bad)) + " spaxels are rejected."
@@ -11,7 +11,7 @@ from multiprocess import Process, Queue
 from ppxf.ppxf import ppxf
 from printStatus import printStatus
 
-from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.auxiliary import _auxiliary, _prefetch, _progress
 from gistPipeline.prepareTemplates import _prepareTemplates
 
 # Physical constants
@@ -202,7 +202,6 @@ def run_ppxf(
     ui.adsabs.harvard.edu/?#abs/2017MNRAS.466..798C), in order to determine the
     non-parametric star-formation histories.
     """
-    printStatus.progressBar(i, nbins, barLength=50)
 
     try:
 
@@ -646,7 +645,7 @@ def extractStarFormationHistories(config):
         )
         printStatus.done("Using emission-subtracted spectra")
 
-        hdu = fits.open(
+        hdu = _prefetch.openFits(
             os.path.join(config['GENERAL']['OUTPUT'],
             config['GENERAL']['RUN_ID'])+'_gas-cleaned_'+config['GAS']['LEVEL']+'.fits'
         )
@@ -661,7 +660,7 @@ def extractStarFormationHistories(config):
             + "_BinSpectra.fits"
         )
         printStatus.done("Using regular spectra without any emission-correction")
-        hdu = fits.open(
+        hdu = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_BinSpectra.fits"
         )
@@ -696,7 +695,7 @@ def extractStarFormationHistories(config):
         fixed = [True] * config["KIN"]["MOM"]
 
         # Read PPXF results
-        ppxf_data = fits.open(
+        ppxf_data = _prefetch.openFits(
             os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
             + "_kin.fits"
         )[1].data
@@ -766,6 +765,7 @@ def extractStarFormationHistories(config):
     # ====================
     # Run PPXF
     start_time = time.time()
+    progress = _progress.Progress("Running PPXF", nbins)
     if config["GENERAL"]["PARALLEL"] == True:
         printStatus.running("Running PPXF in parallel mode")
         logging.info("Running PPXF in parallel mode")
@@ -780,9 +780,10 @@ def extractStarFormationHistories(config):
             for _ in range(config["GENERAL"]["NCPU"])
         ]
 
-        # Start worker processes
-        for p in ps:
-            p.start()
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
 
         # Fill the queue
         for i in range(nbins):
@@ -812,7 +813,10 @@ def extractStarFormationHistories(config):
 
 
         # now get the results with indices
-        ppxf_tmp = [outQueue.get() for _ in range(nbins)]
+        ppxf_tmp = []
+        for _ in range(nbins):
+            ppxf_tmp.append(outQueue.get())
+            progress.update(failed=_progress.failedFit(ppxf_tmp[-1][1]))
 
         # send stop signal to stop iteration
         for _ in range(config["GENERAL"]["NCPU"]):
@@ -880,7 +884,9 @@ def extractStarFormationHistories(config):
                 i,
                 optimal_template_in,
             )
+            progress.update(failed=_progress.failedFit(kin[i, 0]))
         printStatus.updateDone("Running PPXF in serial mode", progressbar=True)
+    progress.close()
 
     print(
         "             Running PPXF on %s spectra took %.2fs using %i cores"
@@ -10,8 +10,9 @@ from multiprocess import Process, Queue
 from ppxf.ppxf import ppxf
 from printStatus import printStatus
 
-from gistPipeline.auxiliary import _auxiliary
+from gistPipeline.auxiliary import _auxiliary, _progress
 from gistPipeline.prepareTemplates import _prepareTemplates
+from gistPipeline.writeFITS import stream_fits
 
 # PHYSICAL CONSTANTS
 C = 299792.458  # km/s
@@ -147,8 +148,6 @@ def run_ppxf(
     ui.adsabs.harvard.edu/?#abs/2017MNRAS.466..798C), in order to determine the
     stellar kinematics.
     """
-    printStatus.progressBar(i, nbins, barLength=50)
-
     try:
         # Call PPXF for first time to get optimal template
         if len(optimal_template_in) == 1:
@@ -342,18 +341,12 @@ def save_ppxf(
     ppxf_reddening,
     mc_results,
     formal_error,
-    ppxf_bestfit,
-    logLam,
-    goodPixels,
-    optimal_template,
-    logLam_template,
-    npix,
-    spectral_mask,
-    optimal_template_comb,
-    bin_data,
     snr_postfit,
 ):
-    """Saves all results to disk."""
+    """
+    Saves the kinematics to disk. The best fits, optimal templates and spectral
+    masks are written while pPXF is running (see createOutputFiles).
+    """
     # ========================
     # SAVE RESULTS
     outfits_ppxf = (
@@ -432,22 +425,37 @@ def save_ppxf(
     printStatus.updateDone("Writing: " + config["GENERAL"]["RUN_ID"] + "_kin.fits")
     logging.info("Wrote: " + outfits_ppxf)
 
-    # ========================
-    # SAVE BESTFIT
-    outfits_ppxf = (
-        os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
-        + "_kin-bestfit.fits"
-    )
-    printStatus.running("Writing: " + config["GENERAL"]["RUN_ID"] + "_kin-bestfit.fits")
 
-    # Primary HDU
-    priHDU = fits.PrimaryHDU()
+def createOutputFiles(
+    config,
+    nbins,
+    npix,
+    logLam,
+    goodPixels,
+    bin_data,
+    ntemplate_pix,
+    logLam_template,
+    optimal_template_comb,
+):
+    """
+    Creates _kin-bestfit.fits, _kin-optimalTemplates.fits and
+    _kin-SpectralMask.fits. Their rows are written by a
+    stream_fits.BackgroundWriter as soon as a bin is fitted, so that the
+    output is written while pPXF is running. The files are created under
+    temporary names and only moved to their final names with
+    stream_fits.finishFits once all rows have been written, so that an
+    interrupted run does not leave incomplete outputs behind. Returns the
+    tables of the best fits, optimal templates and spectral masks.
+    """
+    outdir = os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
 
+    def saveConfig(hdu):
+        return _auxiliary.saveConfigToHeader(hdu, config["KIN"])
+
+    # ========================
+    # BESTFIT
     # Table HDU with PPXF bestfit
-    cols = []
-    cols.append(fits.Column(name="BESTFIT", format=str(npix) + "D", array=ppxf_bestfit))
-    dataHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
-    dataHDU.name = "BESTFIT"
+    dataHDU = stream_fits.StreamedTable([("BESTFIT", str(npix) + "D")], nbins, "BESTFIT")
 
     # Table HDU with PPXF logLam
     cols = []
@@ -467,45 +475,22 @@ def save_ppxf(
     specHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
     specHDU.name = "SPEC"
 
-    # Create HDU list and write to file
-    priHDU = _auxiliary.saveConfigToHeader(priHDU, config["KIN"])
-    dataHDU = _auxiliary.saveConfigToHeader(dataHDU, config["KIN"])
-    logLamHDU = _auxiliary.saveConfigToHeader(logLamHDU, config["KIN"])
-    goodpixHDU = _auxiliary.saveConfigToHeader(goodpixHDU, config["KIN"])
-    specHDU = _auxiliary.saveConfigToHeader(specHDU, config["KIN"])
-
-    HDUList = fits.HDUList([priHDU, dataHDU, logLamHDU, goodpixHDU, specHDU])
-    HDUList.writeto(outfits_ppxf, overwrite=True)
-
-    printStatus.updateDone(
-        "Writing: " + config["GENERAL"]["RUN_ID"] + "_kin-bestfit.fits"
+    (bestfitTable,) = stream_fits.createFits(
+        stream_fits.partName(outdir + "_kin-bestfit.fits"),
+        [
+            saveConfig(hdu)
+            for hdu in [fits.PrimaryHDU(), dataHDU, logLamHDU, goodpixHDU, specHDU]
+        ],
     )
-    logging.info("Wrote: " + outfits_ppxf)
 
     # ============================
-    # SAVE OPTIMAL TEMPLATE RESULT
-    outfits = (
-        os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
-        + "_kin-optimalTemplates.fits"
-    )
-    printStatus.running(
-        "Writing: " + config["GENERAL"]["RUN_ID"] + "_kin-optimalTemplates.fits"
-    )
-
-    # Primary HDU
-    priHDU = fits.PrimaryHDU()
-
+    # OPTIMAL TEMPLATES
     # Extension 1: Table HDU with optimal templates
-    cols = []
-    cols.append(
-        fits.Column(
-            name="OPTIMAL_TEMPLATES",
-            format=str(optimal_template.shape[1]) + "D",
-            array=optimal_template,
-        )
+    dataHDU = stream_fits.StreamedTable(
+        [("OPTIMAL_TEMPLATES", str(ntemplate_pix) + "D")],
+        nbins,
+        "OPTIMAL_TEMPLATES",
     )
-    dataHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
-    dataHDU.name = "OPTIMAL_TEMPLATES"
 
     # Extension 2: Table HDU with logLam_templates
     cols = []
@@ -513,7 +498,7 @@ def save_ppxf(
     logLamHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
     logLamHDU.name = "LOGLAM_TEMPLATE"
 
-    # Extension 2: Table HDU with logLam_templates
+    # Extension 3: Table HDU with the optimal template of the combined spectrum
     cols = []
     cols.append(
         fits.Column(
@@ -523,54 +508,36 @@ def save_ppxf(
     combHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
     combHDU.name = "OPTIMAL_TEMPLATE_ALL"
 
-    # Create HDU list and write to file
-    priHDU = _auxiliary.saveConfigToHeader(priHDU, config["KIN"])
-    dataHDU = _auxiliary.saveConfigToHeader(dataHDU, config["KIN"])
-    logLamHDU = _auxiliary.saveConfigToHeader(logLamHDU, config["KIN"])
-    combHDU = _auxiliary.saveConfigToHeader(combHDU, config["KIN"])
-    HDUList = fits.HDUList([priHDU, dataHDU, logLamHDU, combHDU])
-    HDUList.writeto(outfits, overwrite=True)
-
-    printStatus.updateDone(
-        "Writing: " + config["GENERAL"]["RUN_ID"] + "_kin-optimalTemplates.fits"
+    (templateTable,) = stream_fits.createFits(
+        stream_fits.partName(outdir + "_kin-optimalTemplates.fits"),
+        [saveConfig(hdu) for hdu in [fits.PrimaryHDU(), dataHDU, logLamHDU, combHDU]],
     )
-    logging.info("Wrote: " + outfits)
 
     # ============================
-    # SAVE SPECTRAL MASK RESULT
-    outfits = (
-        os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
-        + "_kin-SpectralMask.fits"
-    )
-    printStatus.running(
-        "Writing: " + config["GENERAL"]["RUN_ID"] + "_kin-SpectralMask.fits"
+    # SPECTRAL MASK
+    # Extension 1: Table HDU with spectral masks
+    dataHDU = stream_fits.StreamedTable(
+        [("SPECTRAL_MASK", str(npix) + "D")], nbins, "SPECTRAL_MASK"
     )
 
-    # Primary HDU
-    priHDU = fits.PrimaryHDU()
-
-    # Extension 1: Table HDU with optimal templates
-    cols = []
-    cols.append(
-        fits.Column(
-            name="SPECTRAL_MASK",
-            format=str(spectral_mask.shape[1]) + "D",
-            array=spectral_mask,
-        )
+    (maskTable,) = stream_fits.createFits(
+        stream_fits.partName(outdir + "_kin-SpectralMask.fits"),
+        [saveConfig(hdu) for hdu in [fits.PrimaryHDU(), dataHDU]],
     )
-    dataHDU = fits.BinTableHDU.from_columns(fits.ColDefs(cols))
-    dataHDU.name = "SPECTRAL_MASK"
 
-    # Create HDU list and write to file
-    priHDU = _auxiliary.saveConfigToHeader(priHDU, config["KIN"])
-    dataHDU = _auxiliary.saveConfigToHeader(dataHDU, config["KIN"])
-    HDUList = fits.HDUList([priHDU, dataHDU])
-    HDUList.writeto(outfits, overwrite=True)
+    return bestfitTable, templateTable, maskTable
 
-    printStatus.updateDone(
-        "Writing: " + config["GENERAL"]["RUN_ID"] + "_kin-SpectralMask.fits"
-    )
-    logging.info("Wrote: " + outfits)
+
+def writeRows(writer, tables, i, bestfit, optimal_template, spectral_mask):
+    """
+    Queues the best fit, optimal template and spectral mask of bin i for
+    writing by the BackgroundWriter writer.
+    """
+    bestfitTable, templateTable, maskTable = tables
+    row = slice(i, i + 1)
+    writer.write(bestfitTable, row, BESTFIT=bestfit)
+    writer.write(templateTable, row, OPTIMAL_TEMPLATES=optimal_template)
+    writer.write(maskTable, row, SPECTRAL_MASK=spectral_mask)
 
 
 def extractStellarKinematics(config):
@@ -676,14 +643,12 @@ def extractStellarKinematics(config):
         config, config["KIN"]["SPEC_MASK"], logLam
     )
 
-    # Array to store results of ppxf
+    # Array to store results of ppxf. Best fits, optimal templates and
+    # spectral masks are directly written to disk.
     ppxf_result = np.zeros((nbins, 6))
     ppxf_reddening = np.zeros(nbins)
-    ppxf_bestfit = np.zeros((nbins, npix))
-    optimal_template = np.zeros((nbins, templates.shape[0]))
     mc_results = np.zeros((nbins, 6))
     formal_error = np.zeros((nbins, 6))
-    spectral_mask = np.zeros((nbins, bin_data.shape[0]))
     snr_postfit = np.zeros(nbins)
 
     # ====================
@@ -725,9 +690,34 @@ def extractStellarKinematics(config):
     # now define the optimal template that we'll use throughout
     optimal_template_comb = optimal_template_out
 
+    # Remove the stellar kinematics of a previous run, so that an interrupted
+    # run does not leave them next to the new outputs
+    kinFile = (
+        os.path.join(config["GENERAL"]["OUTPUT"], config["GENERAL"]["RUN_ID"])
+        + "_kin.fits"
+    )
+    if os.path.isfile(kinFile):
+        os.remove(kinFile)
+
+    # Create the output files, which are written in the background while
+    # pPXF is running
+    tables = createOutputFiles(
+        config,
+        nbins,
+        npix,
+        logLam,
+        goodPixels_ppxf,
+        bin_data,
+        templates.shape[0],
+        logLam_template,
+        optimal_template_comb,
+    )
+    writer = stream_fits.BackgroundWriter()
+
     # ====================
     # Run PPXF
     start_time = time.time()
+    progress = _progress.Progress("Running PPXF", nbins)
     if config["GENERAL"]["PARALLEL"] == True:
         printStatus.running("Running PPXF in parallel mode")
         logging.info("Running PPXF in parallel mode")
@@ -742,9 +732,10 @@ def extractStellarKinematics(config):
             for _ in range(config["GENERAL"]["NCPU"])
         ]
 
-        # Start worker processes
-        for p in ps:
-            p.start()
+        # Start worker processes, with a single BLAS thread each
+        with _auxiliary.workerThreads():
+            for p in ps:
+                p.start()
 
         # Fill the queue
         for i in range(nbins):
@@ -772,8 +763,17 @@ def extractStellarKinematics(config):
                 )
             )
 
-        # now get the results with indices
-        ppxf_tmp = [outQueue.get() for _ in range(nbins)]
+        # Get the results as they come in, with indices
+        for _ in range(nbins):
+            ppxf_tmp = outQueue.get()
+            i = ppxf_tmp[0]
+            ppxf_result[i, : config["KIN"]["MOM"]] = ppxf_tmp[1]
+            ppxf_reddening[i] = ppxf_tmp[2]
+            mc_results[i, : config["KIN"]["MOM"]] = ppxf_tmp[5]
+            formal_error[i, : config["KIN"]["MOM"]] = ppxf_tmp[6]
+            snr_postfit[i] = ppxf_tmp[8]
+            writeRows(writer, tables, i, ppxf_tmp[3], ppxf_tmp[4], ppxf_tmp[7])
+            progress.update(failed=_progress.failedFit(ppxf_tmp[1]))
 
         # send stop signal to stop iteration
         for _ in range(config["GENERAL"]["NCPU"]):
@@ -783,30 +783,6 @@ def extractStellarKinematics(config):
         for p in ps:
             p.join()
 
-        # Get output
-        index = np.zeros(nbins)
-        for i in range(0, nbins):
-            index[i] = ppxf_tmp[i][0]
-            ppxf_result[i, : config["KIN"]["MOM"]] = ppxf_tmp[i][1]
-            ppxf_reddening[i] = ppxf_tmp[i][2]
-            ppxf_bestfit[i, :] = ppxf_tmp[i][3]
-            optimal_template[i, :] = ppxf_tmp[i][4]
-            mc_results[i, : config["KIN"]["MOM"]] = ppxf_tmp[i][5]
-            formal_error[i, : config["KIN"]["MOM"]] = ppxf_tmp[i][6]
-            spectral_mask[i, :] = ppxf_tmp[i][7]
-            snr_postfit[i] = ppxf_tmp[i][8]
-
-        # Sort output
-        argidx = np.argsort(index)
-        ppxf_result = ppxf_result[argidx, :]
-        ppxf_reddening = ppxf_reddening[argidx]
-        ppxf_bestfit = ppxf_bestfit[argidx, :]
-        optimal_template = optimal_template[argidx, :]
-        mc_results = mc_results[argidx, :]
-        formal_error = formal_error[argidx, :]
-        spectral_mask = spectral_mask[argidx, :]
-        snr_postfit = snr_postfit[argidx]
-
         printStatus.updateDone("Running PPXF in parallel mode", progressbar=True)
 
     elif config["GENERAL"]["PARALLEL"] == False:
@@ -817,11 +793,11 @@ def extractStellarKinematics(config):
             (
                 ppxf_result[i, : config["KIN"]["MOM"]],
                 ppxf_reddening[i],
-                ppxf_bestfit[i, :],
-                optimal_template[i, :],
+                bestfit,
+                optimal_template,
                 mc_results[i, : config["KIN"]["MOM"]],
                 formal_error[i, : config["KIN"]["MOM"]],
-                spectral_mask[i, :],
+                spectral_mask,
                 snr_postfit[i],
             ) = run_ppxf(
                 templates,
@@ -844,7 +820,10 @@ def extractStellarKinematics(config):
                 i,
                 optimal_template_comb,
             )
+            writeRows(writer, tables, i, bestfit, optimal_template, spectral_mask)
+            progress.update(failed=_progress.failedFit(ppxf_result[i, 0]))
         printStatus.updateDone("Running PPXF in serial mode", progressbar=True)
+    progress.close()
 
     print(
         "             Running PPXF on %s spectra took %.2fs using %i cores"
@@ -855,6 +834,13 @@ def extractStellarKinematics(config):
         % (nbins, time.time() - start_time, config["GENERAL"]["NCPU"])
     )
 
+    # Wait until all best fits, optimal templates and spectral masks are written
+    writer.close()
+    stream_fits.finishFits(tables)
+    for table in tables:
+        printStatus.done("Writing: " + os.path.basename(table.filename))
+        logging.info("Wrote: " + table.filename)
+
     # Check for exceptions which occurred during the analysis
     idx_error = np.where(np.isnan(ppxf_result[:, 0]) == True)[0]
     if len(idx_error) != 0:
@@ -878,15 +864,6 @@ def extractStellarKinematics(config):
         ppxf_reddening,
         mc_results,
         formal_error,
-        ppxf_bestfit,
-        logLam,
-        goodPixels_ppxf,
-        optimal_template,
-        logLam_template,
-        npix,
-        spectral_mask,
-        optimal_template_comb,
-        bin_data,
         snr_postfit,
     )
 
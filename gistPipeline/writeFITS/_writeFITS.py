@@ -1,5 +1,6 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from printStatus import printStatus
 
@@ -89,22 +90,22 @@ def generateFITS(config, module):
                     )
             if os.path.isfile(outputPrefix + "_gas_BIN.fits") == True and os.path.isfile(outputPrefix + "_gas_SPAXEL.fits") == True:
                 if config["GAS"]["LEVEL"] == 'BOTH': # Special case for running in BOTH mode
-                    # Run first to create the _BIN maps
-                    print('First run-through to save bin results')
-                    save_maps_fits.savefitsmaps_GASmodule(
-                        "gas",
-                        config["GENERAL"]["OUTPUT"],
-                        LEVEL='BIN',
-                        AoNThreshold=4,
-                    )
-                    # Then run to create the SPAXEL maps
-                    print('second run through to save SPAXEL results')
-                    save_maps_fits.savefitsmaps_GASmodule(
-                        "gas",
-                        config["GENERAL"]["OUTPUT"],
-                        LEVEL='SPAXEL',
-                        AoNThreshold=4,
-                    )
+                    # Create the _BIN and _SPAXEL maps concurrently, sharing
+                    # the spaxel geometry of the run
+                    save_maps_fits.readMapGeometry(config["GENERAL"]["OUTPUT"])
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        futures = [
+                            executor.submit(
+                                save_maps_fits.savefitsmaps_GASmodule,
+                                "gas",
+                                config["GENERAL"]["OUTPUT"],
+                                LEVEL=level,
+                                AoNThreshold=4,
+                            )
+                            for level in ["BIN", "SPAXEL"]
+                        ]
+                        for future in futures:
+                            future.result()
 
             printStatus.updateDone(
                 "Producing FITS maps from the emission-line analysis"
@@ -6,6 +6,7 @@ import os
 import warnings
 
 import datetime
+import hashlib
 import numpy as np
 from astropy.io import fits
 from astropy.wcs import WCS
@@ -35,33 +36,53 @@ def write_fits_cube(hdulist, filename, overwrite=False,
     except TypeError:
         fits.HDUList(hdulist).writeto(filename, clobber=overwrite)
 
-def savefitsmaps(module_id, outdir=""):
+# Spatial information of the runs, keyed by the path of their _table.fits
+_geometryCache = {}
+
+
+def readMapGeometry(outdir):
     """
-    savefitsmaps _summary_
+    Read the spatial information needed to create the maps of a run from its
+    _table.fits: the index of every spaxel into the results of the bins, the
+    pixel of every spaxel in the images and the WCS header of the images,
+    together with the defunct spaxels from its _mask.fits. This is done only
+    once per table and then reused by all modules. The returned dict is
+    shared and must not be modified.
 
     Parameters
     ----------
-    module_id : _type_
-        _description_
-    outdir : str, optional
-        _description_, by default ""
-    """
+    outdir : str
+        Output directory of the run
 
-    runname = outdir
+    Returns
+    -------
+    dict
+        Table columns, bin and pixel indices and the WCS header of the maps
+    """
     rootname = outdir.rstrip("/").split("/")[-1]
+    tablefile = os.path.join(outdir, rootname) + "_table.fits"
+    key = (os.path.abspath(tablefile), os.path.getmtime(tablefile))
+    if key in _geometryCache:
+        return _geometryCache[key]
 
     # Read bintable
-    table_hdu = fits.open(os.path.join(outdir, rootname) + "_table.fits")
-    idx_inside = np.where(table_hdu[1].data.BIN_ID >= 0)[0]
-    X = np.array(table_hdu[1].data.X) * -1
-    Y = np.array(table_hdu[1].data.Y)
-    FLUX = np.array(table_hdu[1].data.FLUX)
-    XBIN = np.array(table_hdu[1].data.XBIN)
-    YBIN = np.array(table_hdu[1].data.YBIN)
-    binNum_long = np.array(table_hdu[1].data.BIN_ID)
-    ubins = np.unique(np.abs(np.array(table_hdu[1].data.BIN_ID)))
+    table_hdu = fits.open(tablefile)
+    columns = {name: np.array(table_hdu[1].data[name]) for name in table_hdu[1].data.names}
+    binNum_long = columns["BIN_ID"]
+    idx_inside = np.where(binNum_long >= 0)[0]
+    X = columns["X"] * -1
+    Y = columns["Y"]
     pixelsize = table_hdu[0].header["PIXSIZE"]
     oldwcshdr = table_hdu[2].header.copy()
+    table_hdu.close()
+
+    # Defunct spaxels inside the binned region
+    maskfile = os.path.join(outdir, rootname) + "_mask.fits"
+    maskedSpaxel = None
+    if os.path.isfile(maskfile):
+        with fits.open(maskfile) as hdu:
+            mask = np.array(hdu[1].data.MASK_DEFUNCT, dtype=bool)
+        maskedSpaxel = mask[idx_inside]
 
     # update WCS
     wcs = WCS(oldwcshdr).celestial
@@ -78,85 +99,209 @@ def savefitsmaps(module_id, outdir=""):
             "All Y-coordinates are 0.0 or np.nan. Plotting maps will not work without reasonable spatial information!\n"
         )
 
+    # Row of the results of the bins (one per unique bin ID) for every spaxel
+    ubins, binIndex = np.unique(np.abs(binNum_long), return_inverse=True)
+
+    # Checksum of everything that determines where a value ends up in the maps
+    checksum = hashlib.sha1()
+    for array in [binNum_long, X, Y]:
+        checksum.update(np.ascontiguousarray(array).tobytes())
+    checksum.update(repr(pixelsize).encode())
+    checksum.update(newwcshdr.tostring().encode())
+
+    # Pixel of every spaxel in the image
+    xmin = np.min(X)
+    xmax = np.max(X)
+    ymin = np.min(Y)
+    ymax = np.max(Y)
+    npixels_x = int(np.round((xmax - xmin) / pixelsize) + 1)
+    npixels_y = int(np.round((ymax - ymin) / pixelsize) + 1)
+    i = np.array(np.round((X - xmin) / pixelsize), dtype=np.int32)
+    j = np.array(np.round((Y - ymin) / pixelsize), dtype=np.int32)
+
+    geometry = {
+        "columns": columns,
+        "binNum_long": binNum_long,
+        "ubins": ubins,
+        "binIndex": binIndex.ravel(),
+        "idx_inside": idx_inside,
+        # Reverse the i index to each row of the image
+        # because ra increases West-East (right-left in image plane)
+        "pix_i": i[::-1][idx_inside],
+        "pix_j": j[idx_inside],
+        "shape": (npixels_x, npixels_y),
+        "header": newwcshdr,
+        "checksum": checksum.hexdigest(),
+        "maskedSpaxel": maskedSpaxel,
+    }
+    _geometryCache.clear()
+    _geometryCache[key] = geometry
+    return geometry
+
+
+def binsToSpaxels(result, geometry):
+    """
+    Expand results with one row per bin to one row per spaxel.
+    """
+    return np.asarray(result)[geometry["binIndex"]]
+
+
+def spaxelsToImages(values, geometry, select=None):
+    """
+    Create the images of all columns of values (one row per spaxel) at once.
+    Only spaxels inside the binned region are shown; select optionally
+    restricts these further. Returns an array of shape (ncolumns, npixels_y,
+    npixels_x).
+    """
+    idx = geometry["idx_inside"]
+    pix_i = geometry["pix_i"]
+    pix_j = geometry["pix_j"]
+    if select is not None:
+        idx = idx[select]
+        pix_i = pix_i[select]
+        pix_j = pix_j[select]
+
+    images = np.full((values.shape[1],) + geometry["shape"], np.nan)
+    images[:, pix_i, pix_j] = values[idx].T
+    # Transpose x and y because numpy uses arr[row, col] and FITS uses
+    # im[ra, dec] = arr[col, row]
+    return images.transpose(0, 2, 1)
+
+
+def readMaskedSpaxels(outdir, geometry):
+    """
+    Return the defunct spaxels inside the binned region, which are read from
+    the _mask.fits of the run by readMapGeometry.
+    """
+    if geometry["maskedSpaxel"] is None:
+        rootname = outdir.rstrip("/").split("/")[-1]
+        raise FileNotFoundError(os.path.join(outdir, rootname) + "_mask.fits")
+    return geometry["maskedSpaxel"]
+
+
+def columnChecksums(values, geometry, select=None):
+    """
+    Checksum of the source column of every map, including the spaxel
+    geometry and the selection of the shown spaxels.
+    """
+    base = hashlib.sha1(geometry["checksum"].encode())
+    if select is not None:
+        base.update(np.ascontiguousarray(select).tobytes())
+    checksums = []
+    for k in range(values.shape[1]):
+        checksum = base.copy()
+        checksum.update(np.ascontiguousarray(values[:, k]).tobytes())
+        checksums.append(checksum.hexdigest())
+    return checksums
+
+
+def writeMaps(filename, names, values, geometry, expand=False, select=None):
+    """
+    Write one image extension per column of values to filename. The checksum
+    of the source column is stored in the header of every extension
+    (SRCHASH); maps whose source column did not change since filename was
+    last written are copied from it, and only the others are rebuilt. If
+    expand is set, values has one row per bin instead of one per spaxel.
+    """
+    checksums = columnChecksums(values, geometry, select)
+
+    # Maps of the previous run that are still valid
+    previous = {}
+    if os.path.isfile(filename):
+        with fits.open(filename) as hdul:
+            existing = [hdu.name for hdu in hdul[1:]]
+            for hdu in hdul[1:]:
+                if hdu.header.get("SRCHASH") in checksums:
+                    previous[hdu.header["SRCHASH"]] = np.array(hdu.data)
+        if existing == [name.upper() for name in names] and all(
+            checksum in previous for checksum in checksums
+        ):
+            logging.info("Maps in " + filename + " are up to date")
+            return
+
+    rebuild = [k for k in range(len(names)) if checksums[k] not in previous]
+    images = {}
+    if len(rebuild) > 0:
+        columns = values[:, rebuild]
+        if expand:
+            columns = binsToSpaxels(columns, geometry)
+        images = dict(zip(rebuild, spaxelsToImages(columns, geometry, select)))
+
+    primary_hdu = fits.PrimaryHDU()
+    hdu1 = fits.HDUList([primary_hdu])
+    for k, name in enumerate(names):
+        image = images[k] if k in images else previous[checksums[k]]
+        image_hdu = fits.ImageHDU(image, header=geometry["header"], name=name)
+        image_hdu.header["SRCHASH"] = (checksums[k], "Checksum of the source column")
+        hdu1.append(image_hdu)
+    hdu1.writeto(filename, overwrite=True)
+    hdu1.close()
+    logging.info(
+        "Regenerated {} of {} maps in {}".format(len(rebuild), len(names), filename)
+    )
+
+
+def readResults(filename):
+    """
+    Read all columns of the results table of a module as a float array.
+    """
+    with fits.open(filename) as hdu:
+        data = hdu[1].data
+        names = list(data.dtype.names)
+        result = np.zeros((len(data), len(names)))
+        for i, name in enumerate(names):
+            result[:, i] = np.array(data[name])
+    return names, result
+
+
+def savefitsmaps(module_id, outdir=""):
+    """
+    savefitsmaps _summary_
+
+    Parameters
+    ----------
+    module_id : _type_
+        _description_
+    outdir : str, optional
+        _description_, by default ""
+    """
+
+    rootname = outdir.rstrip("/").split("/")[-1]
+    geometry = readMapGeometry(outdir)
+
     # Read Results
     if module_id == "SPATIAL_BINNING":
         # Most table results are already read in; add SN
-        SNR          = np.array(table_hdu[1].data.SNR)
-        SNRBIN       = np.array(table_hdu[1].data.SNRBIN)
+        columns = geometry["columns"]
 
         #define names
         names = ["BINID","FLUX","SNR","SNRBIN","XBIN","YBIN"]
 
-        result = np.zeros((len(binNum_long), len(names)))
-        result[:,0] = binNum_long
-        result[:,1] = FLUX
-        result[:,2] = SNR
-        result[:,3] = SNRBIN
-        result[:,4] = XBIN # Units are arcseconds, and (0,0) is the centre spaxel
-        result[:,5] = YBIN
+        result = np.zeros((len(geometry["binNum_long"]), len(names)))
+        result[:,0] = geometry["binNum_long"]
+        result[:,1] = columns["FLUX"]
+        result[:,2] = columns["SNR"]
+        result[:,3] = columns["SNRBIN"]
+        result[:,4] = columns["XBIN"] # Units are arcseconds, and (0,0) is the centre spaxel
+        result[:,5] = columns["YBIN"]
 
     elif module_id == "KIN":
-        # read results
-        hdu = fits.open(os.path.join(outdir, rootname) + "_kin.fits")
-        names = list(hdu[1].data.dtype.names)
-
-        result = np.zeros((len(ubins), len(names)))
-        for i, name in enumerate(names):
-            result[:, i] = np.array(hdu[1].data[name])
+        names, result = readResults(os.path.join(outdir, rootname) + "_kin.fits")
 
     elif module_id == "SFH":
-        # Read results
-        sfh_hdu = fits.open(os.path.join(outdir, rootname) + "_sfh.fits")
-        names = list(sfh_hdu[1].data.dtype.names)
-
-        result = np.zeros((len(ubins), len(names)))
-        for i, name in enumerate(names):
-            result[:, i] = np.array(sfh_hdu[1].data[name])
-
-    if (module_id == 'KIN') | (module_id == "SFH"):
-        # Convert results to long version
-        result_long = np.zeros((len(binNum_long), result.shape[1]))
-        result_long[:, :] = np.nan
-        for i in range(len(ubins)):
-            idx = np.where(ubins[i] == np.abs(binNum_long))[0]
-            result_long[idx, :] = result[i, :]
-        result = result_long
+        names, result = readResults(os.path.join(outdir, rootname) + "_sfh.fits")
 
     # result[:, 0] = result[:, 0] - np.nanmedian(result[:, 0]) [median subtraction on products]
 
     ####### Adding the ability to output maps as fits files
-    primary_hdu = fits.PrimaryHDU()
-    hdu1 = fits.HDUList([primary_hdu])
-
-    for iterate in range(0, len(names)):
-        # Prepare main plot
-        val = result[:, iterate]
-
-        # Create image in pixels
-        xmin = np.min(X)
-        xmax = np.max(X)
-        ymin = np.min(Y)
-        ymax = np.max(Y)
-        npixels_x = int(np.round((xmax - xmin) / pixelsize) + 1)
-        npixels_y = int(np.round((ymax - ymin) / pixelsize) + 1)
-        i = np.array(np.round((X - xmin) / pixelsize), dtype=np.int32)
-        j = np.array(np.round((Y - ymin) / pixelsize), dtype=np.int32)
-        image = np.full((npixels_x, npixels_y), np.nan)
-        # Reverse the i index to each row of the image
-        # because ra increases West-East (right-left in image plane)
-        image[i[::-1][idx_inside], j[idx_inside]] = val[idx_inside]
-        # Transpose x and y because numpy uses arr[row, col] and FITS uses
-        # im[ra, dec] = arr[col, row]
-        image = image.T
-
-        # make HDU
-        image_hdu = fits.ImageHDU(image, header=newwcshdr, name=names[iterate])
-        # Append fits image
-        hdu1.append(image_hdu)
-    hdu1.writeto(
-        os.path.join(outdir, rootname) + "_" + module_id + "_maps.fits", overwrite=True
+    # Results of KIN and SFH are converted to the long version
+    writeMaps(
+        os.path.join(outdir, rootname) + "_" + module_id + "_maps.fits",
+        names,
+        result,
+        geometry,
+        expand=(module_id == "KIN") | (module_id == "SFH"),
     )
-    hdu1.close()
 
 
 def savefitsmaps_GASmodule(module_id="GAS", outdir="", LEVEL="", AoNThreshold=4):
@@ -175,40 +320,11 @@ def savefitsmaps_GASmodule(module_id="GAS", outdir="", LEVEL="", AoNThreshold=4)
         _description_, by default 4
     """
 
-    runname = outdir
     rootname = outdir.rstrip("/").split("/")[-1]
+    geometry = readMapGeometry(outdir)
 
     # Construct a mask for defunct spaxels
-    mask = fits.open(os.path.join(outdir, rootname) + "_mask.fits")[1].data.MASK_DEFUNCT
-    maskedSpaxel = np.array(mask, dtype=bool)
-
-    # Read bintable
-    table_hdu = fits.open(os.path.join(outdir, rootname) + "_table.fits")
-    idx_inside = np.where(table_hdu[1].data.BIN_ID >= 0)[0]
-    X = np.array(table_hdu[1].data.X) * -1
-    Y = np.array(table_hdu[1].data.Y)
-    FLUX = np.array(table_hdu[1].data.FLUX)
-    binNum_long = np.array(table_hdu[1].data.BIN_ID)
-    ubins = np.unique(np.abs(binNum_long))
-    pixelsize = table_hdu[0].header["PIXSIZE"]
-    oldwcshdr = table_hdu[2].header.copy()
-
-    # update WCS
-    wcs = WCS(oldwcshdr).celestial
-    newwcshdr = strip_wcs_from_header(oldwcshdr)
-    newwcshdr.update(diagonal_wcs_to_cdelt(wcs).to_header())
-
-    maskedSpaxel = maskedSpaxel[idx_inside]
-
-    # Check spatial coordinates
-    if len(np.where(np.logical_or(X == 0.0, np.isnan(X) == True))[0]) == len(X):
-        print(
-            "All X-coordinates are 0.0 or np.nan. Plotting maps will not work without reasonable spatial information!"
-        )
-    if len(np.where(np.logical_or(Y == 0.0, np.isnan(Y) == True))[0]) == len(Y):
-        print(
-            "All Y-coordinates are 0.0 or np.nan. Plotting maps will not work without reasonable spatial information!\n"
-        )
+    maskedSpaxel = readMaskedSpaxels(outdir, geometry)
 
     if LEVEL == "SPAXEL":
         results = fits.open(os.path.join(outdir, rootname) + "_gas_SPAXEL.fits")[
@@ -219,63 +335,33 @@ def savefitsmaps_GASmodule(module_id="GAS", outdir="", LEVEL="", AoNThreshold=4)
     elif LEVEL == None:
         print("LEVEL keyword not set!")
 
-    # Convert results to long version
-    if LEVEL == "BIN":
-        _, idxConvert = np.unique(np.abs(binNum_long), return_inverse=True)
-        results = results[idxConvert]
-
-    primary_hdu = fits.PrimaryHDU()
-    hdu1 = fits.HDUList([primary_hdu])
-
-    # Iterate over all lines
-    for line in results.names:
-        if line[-3:] == "AON":
-            continue
-        if line in ["EBmV_0", "EBmV_1"]:
-            continue
-
-        data = results[line]
-
-        # GANDALF returns the amplitude-over-noise (AON) (PPXF doesn't)
-        #try:
-          #  data_aon = results[line[:-2] + "_AON"]
-         #   data[np.where(data_aon < AoNThreshold)[0]] = np.nan
-        #except:
-            # print("amplitude-over-noise (AON) information does not exist for {line}".format(line=line))
-
-        # we don't need to mask bin IDs
-        if isinstance(data.dtype, int):
-            data[np.where(data == -1)[0]] = np.nan
-
-        # Create image in pixels
-        xmin = np.min(X)
-        xmax = np.max(X)
-        ymin = np.min(Y)
-        ymax = np.max(Y)
-        npixels_x = int(np.round((xmax - xmin) / pixelsize) + 1)
-        npixels_y = int(np.round((ymax - ymin) / pixelsize) + 1)
-        col = np.array(np.round((X - xmin) / pixelsize), dtype=np.int32)
-        row = np.array(np.round((Y - ymin) / pixelsize), dtype=np.int32)
-        image = np.full((npixels_x, npixels_y), np.nan)
-
-        # reverse the index to flip vertically
-        # since WCS transformations - like FITS files - assume
-        # that the origin is the lower left pixel of the image
-        # (origin is in top left for numpy arrays)
-        image[col[::-1][idx_inside][~maskedSpaxel], row[idx_inside][~maskedSpaxel]] = data[idx_inside][~maskedSpaxel]
-
-        # Transpose x and y because numpy uses arr[row, col] and FITS uses im[ra, dec] = arr[col, row]
-        image = image.T
-
-        image_hdu = fits.ImageHDU(image, header=newwcshdr, name=line)
-        # Append fits image
-        hdu1.append(image_hdu)
-
-    hdu1.writeto(
+    # Select all lines; the amplitude-over-noise (AON) and reddening are not mapped
+    names = [
+        line
+        for line in results.names
+        if line[-3:] != "AON" and line not in ["EBmV_0", "EBmV_1"]
+    ]
+    values = np.zeros((len(results), len(names)))
+    for i, line in enumerate(names):
+        values[:, i] = results[line]
+
+    # GANDALF returns the amplitude-over-noise (AON) (PPXF doesn't)
+    #try:
+      #  data_aon = results[line[:-2] + "_AON"]
+     #   data[np.where(data_aon < AoNThreshold)[0]] = np.nan
+    #except:
+        # print("amplitude-over-noise (AON) information does not exist for {line}".format(line=line))
+
+    # Results of the bins are converted to the long version; defunct spaxels
+    # are not shown
+    writeMaps(
         os.path.join(outdir, rootname) + "_" + module_id + "_" + LEVEL + "_maps.fits",
-        overwrite=True,
+        names,
+        values,
+        geometry,
+        expand=(LEVEL == "BIN"),
+        select=~maskedSpaxel,
     )
-    hdu1.close()
 
 
 def savefitsmaps_LSmodule(module_id="LS", outdir="", RESOLUTION=""):
@@ -291,98 +377,31 @@ def savefitsmaps_LSmodule(module_id="LS", outdir="", RESOLUTION=""):
     RESOLUTION : str, optional
         _description_, by default ""
     """
-    runname = outdir
     rootname = outdir.rstrip("/").split("/")[-1]
-
-    # Read bintable
-    table_hdu = fits.open(os.path.join(outdir, rootname) + "_table.fits")
-    idx_inside = np.where(table_hdu[1].data.BIN_ID >= 0)[0]
-    X = np.array(table_hdu[1].data.X) * -1
-    Y = np.array(table_hdu[1].data.Y)
-    FLUX = np.array(table_hdu[1].data.FLUX)
-    binNum_long = np.array(table_hdu[1].data.BIN_ID)
-    ubins = np.unique(np.abs(np.array(table_hdu[1].data.BIN_ID)))
-    pixelsize = table_hdu[0].header["PIXSIZE"]
-    oldwcshdr = table_hdu[2].header.copy()
-
-    # update WCS
-    wcs = WCS(oldwcshdr).celestial
-    newwcshdr = strip_wcs_from_header(oldwcshdr)
-    newwcshdr.update(diagonal_wcs_to_cdelt(wcs).to_header())
-
-    # Check spatial coordinates
-    if len(np.where(np.logical_or(X == 0.0, np.isnan(X) == True))[0]) == len(X):
-        print(
-            "All X-coordinates are 0.0 or np.nan. Plotting maps will not work without reasonable spatial information!"
-        )
-    if len(np.where(np.logical_or(Y == 0.0, np.isnan(Y) == True))[0]) == len(Y):
-        print(
-            "All Y-coordinates are 0.0 or np.nan. Plotting maps will not work without reasonable spatial information!\n"
-        )
+    geometry = readMapGeometry(outdir)
 
     # Read results
     if RESOLUTION == "ORIGINAL":
-        hdu = fits.open(os.path.join(outdir, rootname) + "_ls_OrigRes.fits")
+        names, result = readResults(os.path.join(outdir, rootname) + "_ls_OrigRes.fits")
     elif RESOLUTION == "ADAPTED":
-        hdu = fits.open(os.path.join(outdir, rootname) + "_ls_AdapRes.fits")
-
-    names = list(hdu[1].data.dtype.names)
-
-    result = np.zeros((len(ubins), len(names)))
-    for i, name in enumerate(names):
-        result[:, i] = np.array(hdu[1].data[name])
-
-    # Convert results to long version
-    result_long = np.zeros((len(binNum_long), result.shape[1]))
-    result_long[:, :] = np.nan
-    for i in range(len(ubins)):
-        idx = np.where(ubins[i] == np.abs(binNum_long))[0]
-        result_long[idx, :] = result[i, :]
-    result = result_long
+        names, result = readResults(os.path.join(outdir, rootname) + "_ls_AdapRes.fits")
 
     # result[:, 0] = result[:, 0] - np.nanmedian(result[:, 0]) [median subtraction on products]
 
     ####### Adding the ability to output maps as fits files
-    primary_hdu = fits.PrimaryHDU()
-    hdu1 = fits.HDUList([primary_hdu])
-
-    for iterate in range(0, len(names)):
-        # Prepare main plot
-        val = result[:, iterate]
-
-        # Create image in pixels
-        xmin = np.min(X)
-        xmax = np.max(X)
-        ymin = np.min(Y)
-        ymax = np.max(Y)
-        npixels_x = int(np.round((xmax - xmin) / pixelsize) + 1)
-        npixels_y = int(np.round((ymax - ymin) / pixelsize) + 1)
-        i = np.array(np.round((X - xmin) / pixelsize), dtype=np.int32)
-        j = np.array(np.round((Y - ymin) / pixelsize), dtype=np.int32)
-        image = np.full((npixels_x, npixels_y), np.nan)
-
-        # Reverse the i index to each row of the image
-        # because ra increases West-East (right-left in image plane)
-        image[i[::-1][idx_inside], j[idx_inside]] = val[idx_inside]
-
-        # Transpose x and y to reorient the image correctly
-        # im[ra, dec] = arr[col, row]
-        image = image.T
-
-        # make HDU
-        image_hdu = fits.ImageHDU(image, header=newwcshdr, name=names[iterate])
-        # Append fits image
-        hdu1.append(image_hdu)
-    hdu1.writeto(
+    # Results are converted to the long version
+    writeMaps(
         os.path.join(outdir, rootname)
         + "_"
         + module_id
         + "_"
         + RESOLUTION
         + "_maps.fits",
-        overwrite=True,
+        names,
+        result,
+        geometry,
+        expand=True,
     )
-    hdu1.close()
 
 
 def saveContLineCube(config):
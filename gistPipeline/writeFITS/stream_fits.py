@@ -0,0 +1,197 @@
+import io
+import os
+import queue
+import re
+import threading
+
+import numpy as np
+from astropy.io import fits
+
+"""
+PURPOSE:
+  Reading and writing of FITS binary tables that are too large to be held in
+  memory. When the file is created, the space of the rows of these tables is
+  reserved on disk. The rows are then written, and read, block by block at
+  their position in the file, so that the memory required does not depend on
+  the size of the table. Rows can also be written by a BackgroundWriter, so
+  that writing the output overlaps with the analysis. Files which are only
+  complete once all rows have been written can be created under a temporary
+  name (partName) and moved to their final name with finishFits.
+"""
+
+# Numpy types of the FITS binary table formats
+FORMATS = {"D": ">f8", "E": ">f4", "K": ">i8", "J": ">i4", "I": ">i2"}
+
+
+def rowType(columns):
+    """
+    Returns the numpy type of the rows of a binary table with the given list
+    of (name, format) columns, as they are stored in the file.
+    """
+    dtype = []
+    for name, format in columns:
+        repeat, code = re.match(r"^(\d*)([A-Z])$", format).groups()
+        if repeat == "":
+            dtype.append((name, FORMATS[code]))
+        else:
+            dtype.append((name, FORMATS[code], (int(repeat),)))
+    return np.dtype(dtype)
+
+
+class StreamedTable:
+    """
+    Binary table extension with nrows rows, which are written block by block
+    after the file has been created with createFits. columns is a list of
+    (name, format) tuples, e.g. ("BESTFIT", "3000D"). Additional header
+    keywords can be set in header.
+    """
+
+    def __init__(self, columns, nrows, name=None):
+        self.columns = columns
+        self.nrows = nrows
+        self.name = name
+        self.header = fits.Header()
+        self.dtype = rowType(columns)
+        self.filename = None
+        self.offset = None
+
+    def tableHeader(self):
+        cols = [fits.Column(name=name, format=format) for name, format in self.columns]
+        hdu = fits.BinTableHDU.from_columns(fits.ColDefs(cols), nrows=0)
+        if self.name is not None:
+            hdu.name = self.name
+        hdu.header.update(self.header)
+        hdu.header["NAXIS2"] = self.nrows
+        return hdu.header
+
+    def encode(self, block, **columns):
+        """
+        Returns the position in the file and the bytes of the rows block (a
+        slice). The values of every column of the table are passed as keyword
+        arguments.
+        """
+        start, stop, _ = block.indices(self.nrows)
+        rows = np.zeros(stop - start, dtype=self.dtype)
+        for name, values in columns.items():
+            rows[name] = values
+        return self.offset + start * self.dtype.itemsize, rows.tobytes()
+
+    def write(self, block, **columns):
+        """
+        Writes the rows block (a slice). The values of every column of the
+        table are passed as keyword arguments.
+        """
+        position, data = self.encode(block, **columns)
+        with open(self.filename, "r+b") as f:
+            f.seek(position)
+            f.write(data)
+
+
+class BackgroundWriter:
+    """
+    Writes rows of StreamedTable's in a background thread, so that the output
+    is written while the analysis continues. write() only queues the rows, at
+    most maxsize blocks at once. close() waits until all queued rows have been
+    written and raises any error that occurred while writing.
+    """
+
+    def __init__(self, maxsize=256):
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        files = {}
+        for table, block, columns in iter(self.queue.get, "STOP"):
+            if self.error is not None:
+                continue
+            try:
+                position, data = table.encode(block, **columns)
+                if table.filename not in files:
+                    files[table.filename] = open(table.filename, "r+b")
+                files[table.filename].seek(position)
+                files[table.filename].write(data)
+            except Exception as e:
+                self.error = e
+        for f in files.values():
+            f.close()
+
+    def write(self, table, block, **columns):
+        self.queue.put((table, block, columns))
+
+    def close(self):
+        self.queue.put("STOP")
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def hduBytes(hdu):
+    """
+    Returns an extension HDU as it is written to a FITS file.
+    """
+    buffer = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(buffer)
+    return buffer.getvalue()[len(fits.PrimaryHDU().header.tostring()) :]
+
+
+def createFits(filename, hdus):
+    """
+    Writes filename with the given HDUs, the first of which is the primary
+    HDU. The rows of all StreamedTable's are not written, but only reserved on
+    disk. Returns the list of StreamedTable's, which are now ready to write.
+    """
+    tables = []
+    with open(filename, "wb") as f:
+        f.write(hdus[0].header.tostring().encode("ascii"))
+        for hdu in hdus[1:]:
+            if isinstance(hdu, StreamedTable):
+                f.write(hdu.tableHeader().tostring().encode("ascii"))
+                hdu.filename = filename
+                hdu.offset = f.tell()
+                tables.append(hdu)
+                size = hdu.nrows * hdu.dtype.itemsize
+                f.seek(hdu.offset + int(np.ceil(size / 2880)) * 2880)
+                f.truncate()
+            else:
+                f.write(hduBytes(hdu))
+    return tables
+
+
+def partName(filename):
+    """
+    Returns the temporary name under which filename is written until all of
+    its rows are complete.
+    """
+    return filename + ".part"
+
+
+def finishFits(tables):
+    """
+    Moves the files of the given StreamedTable's, created under their
+    temporary names (see partName), to their final names once all rows have
+    been written.
+    """
+    for table in tables:
+        if table.filename.endswith(".part"):
+            filename = table.filename[: -len(".part")]
+            if os.path.isfile(table.filename):
+                os.replace(table.filename, filename)
+            table.filename = filename
+
+
+def readRows(hdu, block):
+    """
+    Reads the rows block (a slice) of the binary table hdu of a file opened
+    with fits.open, without reading or mapping the rest of the table.
+    """
+    dtype = rowType([(column.name, column.format) for column in hdu.columns])
+    start, stop, _ = block.indices(hdu.header["NAXIS2"])
+    fileinfo = hdu.fileinfo()
+    return np.fromfile(
+        fileinfo["file"].name,
+        dtype=dtype,
+        count=max(stop - start, 0),
+        offset=fileinfo["datLoc"] + start * dtype.itemsize,
+    )
@@ -29,7 +29,7 @@ setup(name='gistPipeline',
       packages=find_packages(),
       install_requires=[
         'astropy>=3.1',
-        'emcee>=2.2',
+        'emcee>=3.0',
         'matplotlib>=3.1',
         'numpy>=1.17',
 #        'PyQt6>=5.10',
@@ -39,7 +39,8 @@ setup(name='gistPipeline',
         'ppxf>=6.7',
         'plotbin>=3.1',
         'printStatus>=1.0',
-        'multiprocess>=0.5'
+        'multiprocess>=0.5',
+        'threadpoolctl>=3.0'
       ],
       python_requires='>=3.6',
       entry_points={
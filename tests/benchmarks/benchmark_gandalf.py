@@ -0,0 +1,87 @@
+"""
+Performance regression benchmark of the shared pyGandALF core.
+
+Synthetic spectra (see benchmark_gandalf_jacobian.syntheticProblem) are fitted
+with both flavours of the emission-line fit, the default 'gandalf' one and the
+'MAGPI_gandalf' one (gandalf_util.MAGPI_OPTIONS), with and without
+multiplicative polynomials and with the Monte Carlo error estimation. The time
+per spectrum and the number of MPFIT function evaluations are reported.
+
+The results can be saved to a JSON file and compared against a previous run,
+so that speedups (or slowdowns) of the solver are measured once for all
+flavours.
+
+Usage:
+    python tests/benchmarks/benchmark_gandalf.py [--nspec N] [--save FILE] [--compare FILE]
+"""
+import argparse
+import copy
+import json
+import time
+
+from benchmark_gandalf_jacobian import countEvaluations, syntheticProblem
+
+from gistPipeline.emissionLines.pyGandalf import gandalf_util
+
+FLAVOURS = {"gandalf": {}, "MAGPI_gandalf": gandalf_util.MAGPI_OPTIONS}
+CASES = {
+    "mdegree0": dict(mdegree=0),
+    "mdegree4": dict(mdegree=4),
+    "errors": dict(mdegree=0, for_errors=1),
+}
+
+
+def runBenchmark(nspec=10):
+    """Return the time per spectrum and the MPFIT evaluations of all cases."""
+    nfev = countEvaluations()
+    results = {}
+    for flavour, options in FLAVOURS.items():
+        for case, kwargs in CASES.items():
+            kwargs = dict(kwargs)
+            for_errors = kwargs.pop("for_errors", 0)
+            nspec_case = max(1, nspec // 5) if for_errors else nspec
+            problems = [syntheticProblem(i, **kwargs) for i in range(nspec_case)]
+            del nfev[:]
+            t0 = time.time()
+            for problem in problems:
+                problem["for_errors"] = for_errors
+                gandalf_util.gandalf(**copy.deepcopy(problem), **options)
+            results[flavour + "/" + case] = {
+                "time_per_spectrum": (time.time() - t0) / nspec_case,
+                "nfev_per_spectrum": sum(nfev) / nspec_case,
+            }
+    return results
+
+
+def printResults(results, reference=None):
+    header = "{:<26} {:>12} {:>12}".format("case", "t/spec [s]", "nfev/spec")
+    if reference is not None:
+        header += " {:>10}".format("speedup")
+    print(header)
+    for name, res in results.items():
+        line = "{:<26} {:>12.4f} {:>12.1f}".format(
+            name, res["time_per_spectrum"], res["nfev_per_spectrum"]
+        )
+        if reference is not None and name in reference:
+            line += " {:>10.2f}".format(
+                reference[name]["time_per_spectrum"] / res["time_per_spectrum"]
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--nspec", type=int, default=10, help="Number of spectra.")
+    parser.add_argument("--save", help="Save the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare to the results in this JSON file.")
+    args = parser.parse_args()
+
+    results = runBenchmark(args.nspec)
+    reference = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            reference = json.load(f)
+    printResults(results, reference)
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,145 @@
+"""
+Benchmark of the GandALF emission-line fit with numerical and analytic
+derivatives in MPFIT.
+
+A set of synthetic spectra (a mix of simple stellar templates plus H-beta,
+the [OIII] doublet and the [NI] doublet) is fitted twice with pyGandALF, once
+with the finite-difference Jacobian of MPFIT and once with the analytic
+Jacobian of fitfunc_gas. For each configuration the number of function
+evaluations, the wall-clock time and the largest difference between the
+solutions are reported.
+
+Usage:
+    python tests/benchmarks/benchmark_gandalf_jacobian.py [nspec]
+"""
+import copy
+import sys
+import time
+
+import numpy as np
+
+from gistPipeline.emissionLines.pyGandalf import cap_mpfit
+from gistPipeline.emissionLines.pyGandalf import gandalf_util
+
+C = 299792.458
+
+
+def syntheticProblem(seed, npix=1200, ntemp=4, mdegree=0, noise_level=0.02):
+    """Set up the input of gandalf_util.gandalf for one synthetic spectrum."""
+    rng = np.random.default_rng(seed)
+    velscale = 60.0
+    ratio = 2
+    lstep = velscale / C
+    logLam_gal = np.log(4800.0) + lstep * np.arange(npix)
+    ntpl = (npix + 200) * ratio
+    logLam_tpl = np.log(4800.0) - 100 * lstep + lstep / ratio * np.arange(ntpl)
+    lam_tpl = np.exp(logLam_tpl)
+
+    # Stellar templates with a few absorption features
+    templates = np.empty((ntpl, ntemp))
+    absorption = [(4861, 3), (5175, 5), (5270, 2), (5335, 2), (4920, 1.5), (5015, 1)]
+    for k in range(ntemp):
+        templates[:, k] = 1 + 0.2 * k * (lam_tpl - 5000) / 1000
+        for centre, width in absorption:
+            templates[:, k] -= (0.3 - 0.03 * k) * np.exp(
+                -0.5 * ((lam_tpl - centre) / (width + k)) ** 2
+            )
+
+    # Galaxy spectrum: stars plus emission lines plus noise
+    vel = rng.uniform(50.0, 200.0)
+    kinstars = np.array([vel, rng.uniform(80.0, 200.0), 0, 0, 0, 0])
+    vsyst = (logLam_tpl[0] - logLam_gal[0]) * C
+    cstar = gandalf_util.convolve_templates_new(
+        templates.T.copy(), kinstars.copy(), velscale, npix, ratio, vsyst
+    )
+    galaxy = cstar @ rng.dirichlet(np.ones(ntemp))
+    lam = np.exp(logLam_gal)
+    sig_gas = rng.uniform(1.0, 3.0)
+    for centre, ampl in [(4861.32, 0.3), (5006.77, 0.6), (4958.83, 0.2), (5197.9, 0.05)]:
+        centre = centre * np.exp(vel / C)
+        galaxy += ampl * np.exp(-0.5 * ((lam - centre) / sig_gas) ** 2)
+    galaxy += rng.normal(0, noise_level, npix)
+
+    emission_setup = [
+        gandalf_util.EmissionSetup(15, "Hb", 4861.32, "f", "l", 0.35, vel, 10, "f", 4),
+        gandalf_util.EmissionSetup(16, "[OIII]", 4958.83, "f", "d17", 0.35, vel, 10, "t17", 4),
+        gandalf_util.EmissionSetup(17, "[OIII]", 5006.77, "f", "l", 1.0, vel, 10, "f", 4),
+        gandalf_util.EmissionSetup(18, "[NI]", 5197.90, "f", "l", 1.0, vel, 10, "t17", 4),
+        gandalf_util.EmissionSetup(19, "[NI]", 5200.39, "f", "l", 1.0, vel, 10, "t17", 4),
+    ]
+    int_disp = np.zeros((2, npix))
+    int_disp[0] = lam
+    int_disp[1] = C * 2.65 / 2.355 / lam
+
+    return dict(
+        templates=templates,
+        galaxy=galaxy,
+        noise=np.full(npix, noise_level),
+        velscale=velscale,
+        sol=kinstars,
+        emission_setup=emission_setup,
+        l0_gal=logLam_gal[0],
+        lstep_gal=lstep,
+        goodpixels=np.arange(20, npix - 20),
+        degree=-1,
+        mdegree=mdegree,
+        int_disp=int_disp,
+        plot=False,
+        quiet=True,
+        log10=False,
+        reddening=None,
+        l0_templ=logLam_tpl[0],
+        for_errors=0,
+        velscale_ratio=ratio,
+        vsyst=vsyst,
+    )
+
+
+def countEvaluations():
+    """Record the number of function evaluations of every MPFIT call."""
+    nfev = []
+    init = cap_mpfit.mpfit.__init__
+
+    def __init__(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        nfev.append(self.nfev)
+
+    cap_mpfit.mpfit.__init__ = __init__
+    return nfev
+
+
+def runBenchmark(nspec=20):
+    nfev = countEvaluations()
+    print(
+        "{:>8} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+            "mdegree", "nfev_num", "nfev_ana", "t_num[s]", "t_ana[s]", "max|dsol|"
+        )
+    )
+    for mdegree in [0, 4]:
+        problems = [syntheticProblem(i, mdegree=mdegree) for i in range(nspec)]
+        results = {}
+        for analytic in [False, True]:
+            del nfev[:]
+            sols = []
+            t0 = time.time()
+            for problem in problems:
+                out = gandalf_util.gandalf(
+                    **copy.deepcopy(problem), analytic_jacobian=analytic
+                )
+                sols.append(out[3])
+            results[analytic] = (sum(nfev), time.time() - t0, np.array(sols))
+        dsol = np.max(np.abs(results[True][2] - results[False][2]))
+        print(
+            "{:>8d} {:>10d} {:>10d} {:>10.3f} {:>10.3f} {:>12.2e}".format(
+                mdegree,
+                results[False][0],
+                results[True][0],
+                results[False][1],
+                results[True][1],
+                dsol,
+            )
+        )
+
+
+if __name__ == "__main__":
+    runBenchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,84 @@
+"""
+Benchmark of the solvers for the bounded linear least-squares problem that is
+solved by pyGandALF at every MPFIT function evaluation (BVLSN_Solve_pxf).
+
+For realistic sizes of the design matrix (number of good pixels times number
+of stellar templates plus emission lines) the time per call of each solver in
+gandalf_util.LINEAR_SOLVERS is measured, together with the largest difference
+of its solution from the one of the default 'nnls' solver. As during the fit,
+only the emission-line columns change between calls.
+
+Usage:
+    python tests/benchmarks/benchmark_gandalf_solver.py [ncalls]
+"""
+import sys
+import time
+
+import numpy as np
+
+from gistPipeline.emissionLines.pyGandalf import gandalf_util
+
+SIZES = [(1500, 1, 8), (1500, 30, 8), (3000, 150, 10), (3000, 300, 10)]
+
+
+def syntheticContext(npix, ntemp, nlines, rng):
+    """Set up a FitContext with smooth stellar templates and a noisy galaxy."""
+    x = np.linspace(0.0, 1.0, npix)
+    cstar = np.array(
+        [
+            1 + 0.3 * np.sin(2 * np.pi * (k + 1) * x / 7) + 0.05 * rng.random(npix)
+            for k in range(ntemp)
+        ]
+    ).T
+    noise = np.full(npix, 0.01)
+    weights = rng.dirichlet(np.ones(ntemp)) * (rng.random(ntemp) < 0.3)
+    galaxy = np.dot(cstar, weights) + rng.normal(0.0, 0.01, npix)
+    goodpixels = np.arange(npix)
+    context = gandalf_util.FitContext(
+        cstar, noise, -1, 0, goodpixels, nlines, None
+    )
+    return context, galaxy / noise
+
+
+def emissionLines(npix, nlines, rng):
+    pix = np.arange(npix)
+    return [
+        rng.random() * np.exp(-0.5 * ((pix - rng.uniform(0, npix)) / 3.0) ** 2)
+        for _ in range(nlines)
+    ]
+
+
+def runBenchmark(ncalls=20):
+    rng = np.random.default_rng(1)
+    header = "{:>6} {:>6} {:>6}".format("npix", "ntemp", "nlines")
+    for solver in gandalf_util.LINEAR_SOLVERS:
+        header += " {:>14}".format(solver + " [ms]")
+    header += " {:>12}".format("max|dx|")
+    print(header)
+    for npix, ntemp, nlines in SIZES:
+        context, bb = syntheticContext(npix, ntemp, nlines, rng)
+        lines = [emissionLines(npix, nlines, rng) for _ in range(ncalls)]
+        line = "{:>6d} {:>6d} {:>6d}".format(npix, ntemp, nlines)
+        solutions = {}
+        for solver in gandalf_util.LINEAR_SOLVERS:
+            context._qr_fixed = None
+            solutions[solver] = []
+            t0 = time.perf_counter()
+            for gaus in lines:
+                context.update(None, gaus)
+                solutions[solver].append(
+                    gandalf_util.BVLSN_Solve_pxf(
+                        context.aaa, bb, -1, nlines, solver=solver, context=context
+                    )
+                )
+            line += " {:>14.3f}".format((time.perf_counter() - t0) / ncalls * 1e3)
+        reference = np.array(solutions["nnls"])
+        dx = max(
+            np.max(np.abs(np.array(sol) - reference)) / np.max(np.abs(reference))
+            for sol in solutions.values()
+        )
+        print(line + " {:>12.2e}".format(dx))
+
+
+if __name__ == "__main__":
+    runBenchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
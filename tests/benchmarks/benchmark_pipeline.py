@@ -0,0 +1,262 @@
+"""
+End-to-end benchmark of the pipeline on synthetic cubes of increasing size.
+
+For every spatial size, a synthetic MUSE-like cube (see synthetic_cube.py) is
+analysed with the configuration of the test workflow
+(.github/workflows/tests/gistTutorial/configFiles/MasterConfig.yaml) and the
+tutorial templates, and the wall-clock time of every stage is measured:
+readData, spatialMasking, spatialBinning, prepareSpectra, KIN, CONT, GAS with
+both GandALF and pPXF, SFH and LS. The GandALF run comes first, so that SFH
+and LS use the emission-line results of pPXF, as in the test workflow.
+
+The report is saved to a JSON file together with the git commit, the sizes of
+the cubes and the number of bins, and can be compared against the report of a
+previous run (e.g. of another commit).
+
+Usage:
+    python tests/benchmarks/benchmark_pipeline.py [--sizes 16,32] [--nwave N] [--target-snr SNR]
+        [--ncpu N] [--serial] [--prefetch] [--workdir DIR] [--save FILE] [--compare FILE]
+"""
+import os
+
+# Worker processes use a single thread each, as in MainPipeline
+os.environ["MKL_NUM_THREADS"] = "1"
+os.environ["NUMEXPR_NUM_THREADS"] = "1"
+os.environ["OMP_NUM_THREADS"] = "1"
+
+import argparse
+import copy
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+
+warnings.filterwarnings("ignore")
+
+import matplotlib
+
+matplotlib.use("pdf")
+
+from astropy.io import fits
+from synthetic_cube import makeCube
+
+from gistPipeline._version import __version__
+from gistPipeline.auxiliary import _auxiliary, _prefetch
+from gistPipeline.continuumCube import _continuumCube
+from gistPipeline.emissionLines import _emissionLines
+from gistPipeline.initialise import _initialise
+from gistPipeline.lineStrengths import _lineStrengths
+from gistPipeline.prepareSpectra import _prepareSpectra
+from gistPipeline.readData import _readData
+from gistPipeline.spatialBinning import _spatialBinning
+from gistPipeline.spatialMasking import _spatialMasking
+from gistPipeline.starFormationHistories import _starFormationHistories
+from gistPipeline.stellarKinematics import _stellarKinematics
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+CONFIG_FILE = os.path.join(
+    REPO_DIR, ".github", "workflows", "tests", "gistTutorial", "configFiles", "MasterConfig.yaml"
+)
+TEMPLATE_DIR = os.path.join(REPO_DIR, "tests", "gistTutorial", "spectralTemplates")
+
+STAGES = [
+    "readData",
+    "spatialMasking",
+    "spatialBinning",
+    "prepareSpectra",
+    "KIN",
+    "CONT",
+    "GAS_gandalf",
+    "GAS_ppxf",
+    "SFH",
+    "LS",
+]
+
+
+def benchmarkConfig(cubeFile, outputDir, runId, targetSNR, ncpu, parallel, prefetch):
+    """
+    The configuration of the test workflow, applied to the synthetic cube. Only
+    the MILES templates are bundled, so all modules use them.
+    """
+    config = _initialise.readMasterConfig(CONFIG_FILE, 0)
+    config["GENERAL"]["RUN_ID"] = runId
+    config["GENERAL"]["INPUT"] = cubeFile
+    config["GENERAL"]["OUTPUT"] = os.path.join(outputDir, runId)
+    config["GENERAL"]["CONFIG_DIR"] = os.path.dirname(CONFIG_FILE)
+    config["GENERAL"]["TEMPLATE_DIR"] = TEMPLATE_DIR
+    config["GENERAL"]["PARALLEL"] = parallel
+    config["GENERAL"]["NCPU"] = ncpu
+    config["GENERAL"]["NTHREADS"] = ncpu
+    config["GENERAL"]["PREFETCH"] = prefetch
+    config["GENERAL"]["OW_CONFIG"] = True
+    config["GENERAL"]["OW_OUTPUT"] = True
+
+    nx = fits.getval(cubeFile, "NX")
+    ny = fits.getval(cubeFile, "NY")
+    config["READ_DATA"]["ORIGIN"] = "{},{}".format((nx - 1) // 2, (ny - 1) // 2)
+    config["SPATIAL_MASKING"]["MIN_SNR"] = 3.0
+    config["SPATIAL_MASKING"]["MASK"] = False
+    config["SPATIAL_BINNING"]["TARGET_SNR"] = targetSNR
+    config["KIN"].setdefault("BIAS", "Auto")
+    config["GAS"]["LIBRARY"] = "MILES/"
+    return config
+
+
+def gandalfConfig(config):
+    """The GAS section of config, changed to a fit with GandALF on BIN level."""
+    gas = copy.deepcopy(config["GAS"])
+    gas["METHOD"] = "gandalf"
+    gas["LEVEL"] = "BIN"
+    gas["EMI_FILE"] = "emissionLines.config"
+    gas["BLOCKSIZE"] = 0
+    return gas
+
+
+def runStage(stage, config, cube):
+    """Run a single stage of the pipeline, as in MainPipeline.runGIST."""
+    module = stage.split("_")[0]
+    if module in ["KIN", "CONT", "GAS", "SFH", "LS"]:
+        _prefetch.startModule(config, module)
+    with _auxiliary.serialThreads(config):
+        if stage == "readData":
+            return _readData.readData_Module(config)
+        elif stage == "spatialMasking":
+            return _spatialMasking.spatialMasking_Module(config, cube)
+        elif stage == "spatialBinning":
+            return _spatialBinning.spatialBinning_Module(config, cube)
+        elif stage == "prepareSpectra":
+            return _prepareSpectra.prepareSpectra_Module(config, cube)
+        elif stage == "KIN":
+            return _stellarKinematics.stellarKinematics_Module(config)
+        elif stage == "CONT":
+            return _continuumCube.continuumCube_Module(config)
+        elif module == "GAS":
+            return _emissionLines.emissionLines_Module(config)
+        elif stage == "SFH":
+            return _starFormationHistories.starFormationHistories_Module(config)
+        elif stage == "LS":
+            return _lineStrengths.lineStrengths_Module(config)
+
+
+def runPipeline(config):
+    """Return the wall-clock time of every stage of the pipeline."""
+    os.makedirs(config["GENERAL"]["OUTPUT"], exist_ok=True)
+    _initialise.checkOutputDirectory(config)
+    _initialise.setupLogfile(config)
+
+    gasConfigs = {"GAS_gandalf": gandalfConfig(config), "GAS_ppxf": config["GAS"]}
+    times = {}
+    cube = None
+    for stage in STAGES:
+        if stage in gasConfigs:
+            config["GAS"] = gasConfigs[stage]
+        t0 = time.time()
+        result = runStage(stage, config, cube)
+        times[stage] = time.time() - t0
+        if stage == "readData":
+            cube = result
+        if isinstance(result, str) and result == "SKIP":
+            raise RuntimeError("Stage " + stage + " failed, see the LOGFILE.")
+    return times
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmark(sizes, nwave, targetSNR, ncpu, parallel, prefetch, workdir):
+    """Run the pipeline on a synthetic cube of every size and return the report."""
+    report = {
+        "commit": gitCommit(),
+        "version": __version__,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "settings": {
+            "nwave": nwave,
+            "target_snr": targetSNR,
+            "ncpu": ncpu,
+            "parallel": parallel,
+            "prefetch": prefetch,
+        },
+        "runs": {},
+    }
+    for size in sizes:
+        runId = "Synthetic{}x{}".format(size, size)
+        cubeFile = makeCube(os.path.join(workdir, runId + ".fits"), size, size, nwave)
+        config = benchmarkConfig(cubeFile, workdir, runId, targetSNR, ncpu, parallel, prefetch)
+        times = runPipeline(config)
+        nbins = len(
+            fits.getdata(os.path.join(config["GENERAL"]["OUTPUT"], runId + "_kin.fits"), 1)
+        )
+        report["runs"][runId] = {
+            "nspaxels": size * size,
+            "nbins": nbins,
+            "stages": times,
+            "total": sum(times.values()),
+        }
+    return report
+
+
+def printReport(report, reference=None):
+    for runId, run in report["runs"].items():
+        print(
+            "\n{}: {} spaxels, {} bins, commit {}".format(
+                runId, run["nspaxels"], run["nbins"], report["commit"]
+            )
+        )
+        ref = None
+        if reference is not None:
+            ref = reference["runs"].get(runId)
+        header = "{:<16} {:>10}".format("stage", "time [s]")
+        if ref is not None:
+            header += " {:>10} {:>10}".format("ref [s]", "speedup")
+        print(header)
+        for stage in STAGES + ["total"]:
+            t = run["total"] if stage == "total" else run["stages"][stage]
+            line = "{:<16} {:>10.2f}".format(stage, t)
+            if ref is not None:
+                tref = ref["total"] if stage == "total" else ref["stages"].get(stage)
+                if tref is not None:
+                    line += " {:>10.2f} {:>10.2f}".format(tref, tref / t if t > 0 else float("nan"))
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="16,32", help="Comma-separated numbers of spaxels along x and y.")
+    parser.add_argument("--nwave", type=int, default=1921, help="Number of wavelength channels.")
+    parser.add_argument("--target-snr", type=float, default=50.0, help="Target signal-to-noise ratio of the Voronoi bins.")
+    parser.add_argument("--ncpu", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--serial", action="store_true", help="Run the modules without multiprocessing.")
+    parser.add_argument("--prefetch", action="store_true", help="Prefetch the inputs of the next module in the background.")
+    parser.add_argument("--workdir", help="Directory of the cubes and outputs (default: a temporary directory).")
+    parser.add_argument("--save", help="Save the report to this JSON file.")
+    parser.add_argument("--compare", help="Compare to the report in this JSON file.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if args.workdir is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        workdir = tmpdir.name
+    else:
+        workdir = args.workdir
+        os.makedirs(workdir, exist_ok=True)
+
+    report = runBenchmark(
+        sizes, args.nwave, args.target_snr, args.ncpu, not args.serial, args.prefetch, workdir
+    )
+    reference = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            reference = json.load(f)
+    printReport(report, reference)
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
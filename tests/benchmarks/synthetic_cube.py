@@ -0,0 +1,227 @@
+"""
+Deterministic synthetic IFU cube in the format of a MUSE-WFM cube.
+
+The stellar continuum is a radially varying mixture of an old and a young MILES
+template of the tutorial template library, shifted and broadened according to
+the velocity and velocity dispersion fields of an inclined, rotating disc. The
+gas follows a faster, colder rotation curve and adds the strongest optical
+emission lines, with an H-alpha equivalent width that peaks in a star-forming
+ring. The surface brightness decreases exponentially with radius, and noise
+with the variance stored in the STAT extension is added.
+
+The cube has a MUSE-like WCS (0.2 arcsec spaxels, a linear wavelength axis
+starting at 4750 Angst.) and can be read with readData/MUSE_WFM.py. The
+kinematic fields are scaled to the spatial size of the cube, and the spectral
+size is set by the number of wavelength channels in the range covered by the
+templates. For a given seed, the cube is identical on every run.
+
+Usage:
+    python tests/benchmarks/synthetic_cube.py FILE [--nx NX] [--ny NY] [--nwave NWAVE] [--seed SEED]
+"""
+import argparse
+import os
+
+import numpy as np
+from astropy.io import fits
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "gistTutorial",
+    "spectralTemplates",
+    "MILES",
+)
+OLD_TEMPLATE = "Mkb1.30Zp0.06T10.0000_iTp0.00_Ep0.00.fits"
+YOUNG_TEMPLATE = "Mkb1.30Zp0.06T01.0000_iTp0.00_Ep0.00.fits"
+
+C = 299792.458  # Speed of light [km/s]
+REDSHIFT = 0.008764  # Systemic redshift, as in the tutorial MasterConfig
+LMIN_OBS = 4750.0  # Observed wavelength range of the cube [Angst.]
+LMAX_OBS = 7150.0
+PIXELSIZE = 0.2  # Spaxel size [arcsec]
+SIGMA_MUSE = 2.6 / 2.355  # Instrumental dispersion of the emission lines [Angst.]
+VELSCALE = 10.0  # Sampling of the spectra before the binning to the cube [km/s]
+
+# Emission lines: rest-frame wavelength [Angst.] and flux relative to H-alpha
+EMISSION_LINES = [
+    (4861.35, 1 / 2.86),
+    (4958.91, 0.35 * 0.5 / 2.86),
+    (5006.84, 0.5 / 2.86),
+    (6300.30, 0.05),
+    (6548.05, 0.34 * 0.4),
+    (6562.80, 1.0),
+    (6583.45, 0.4),
+    (6716.44, 0.15),
+    (6730.82, 0.11),
+]
+
+# Size of the blocks of spaxels which are synthesised at once
+BLOCKSIZE = 64
+
+
+def readTemplate(filename):
+    """Return the wavelength and the flux of a MILES template."""
+    hdu = fits.open(filename)
+    hdr = hdu[0].header
+    flux = np.array(hdu[0].data, dtype=float)
+    wave = hdr["CRVAL1"] + (np.arange(hdr["NAXIS1"]) - hdr["CRPIX1"] + 1) * hdr["CDELT1"]
+    hdu.close()
+    return wave, flux
+
+
+def kinematicFields(nx, ny):
+    """
+    Radius and kinematic fields of an inclined disc (60 deg, position angle 30
+    deg), in units of the half size of the cube.
+    """
+    scale = 0.5 * min(nx, ny)
+    y, x = np.indices((ny, nx), dtype=float)
+    x = (x - (nx - 1) / 2.0) / scale
+    y = (y - (ny - 1) / 2.0) / scale
+    pa, inc = np.radians(30.0), np.radians(60.0)
+    xmaj = x * np.cos(pa) + y * np.sin(pa)
+    ymin = (-x * np.sin(pa) + y * np.cos(pa)) / np.cos(inc)
+    radius = np.hypot(xmaj, ymin)
+    cosphi = np.divide(xmaj, radius, out=np.zeros_like(radius), where=radius > 0)
+
+    fields = {
+        "radius": radius,
+        "v_star": 150.0 * np.tanh(radius / 0.3) * cosphi * np.sin(inc),
+        "sigma_star": 60.0 + 120.0 * np.exp(-radius / 0.3),
+        "v_gas": 200.0 * np.tanh(radius / 0.2) * cosphi * np.sin(inc),
+        "sigma_gas": 30.0 + 20.0 * np.exp(-radius / 0.3),
+        "young": 0.1 + 0.4 * np.minimum(radius, 1.0),
+        "continuum": np.exp(-radius / 0.5),
+        "ew_ha": 2.0 + 10.0 * np.exp(-0.5 * ((radius - 0.6) / 0.15) ** 2),
+    }
+    return {key: value.ravel() for key, value in fields.items()}
+
+
+def broadenedSpectra(ftemplates, weights, velocity, sigma, nfft):
+    """
+    Mix the Fourier transforms of the log-rebinned templates and shift and
+    broaden them with a Gaussian line-of-sight velocity distribution.
+    """
+    freq = np.fft.rfftfreq(nfft)
+    shift = (velocity / VELSCALE)[:, None]
+    width = (sigma / VELSCALE)[:, None]
+    kernel = np.exp(-2j * np.pi * freq * shift - 2.0 * (np.pi * freq * width) ** 2)
+    return np.fft.irfft(np.dot(weights, ftemplates) * kernel, nfft)
+
+
+def makeCube(filename, nx=30, ny=30, nwave=1921, seed=1, snr=50.0):
+    """
+    Write a synthetic cube of nx times ny spaxels and nwave wavelength channels
+    to filename. snr is the signal-to-noise ratio per channel in the centre.
+    """
+    rng = np.random.default_rng(seed)
+    fields = kinematicFields(nx, ny)
+    nspax = nx * ny
+
+    # Logarithmically sampled templates, normalised in the V band
+    wave_old, flux_old = readTemplate(os.path.join(TEMPLATE_DIR, OLD_TEMPLATE))
+    wave_young, flux_young = readTemplate(os.path.join(TEMPLATE_DIR, YOUNG_TEMPLATE))
+    if LMIN_OBS / (1 + REDSHIFT) < wave_old[0] + 50 or LMAX_OBS / (1 + REDSHIFT) > wave_old[-1] - 50:
+        raise ValueError("The wavelength range of the cube is not covered by the templates.")
+    logLam = np.arange(
+        np.log(wave_old[0] + 20), np.log(wave_old[-1] - 20), VELSCALE / C
+    )
+    templates = np.array(
+        [
+            np.interp(np.exp(logLam), wave_old, flux_old),
+            np.interp(np.exp(logLam), wave_young, flux_young),
+        ]
+    )
+    vband = (np.exp(logLam) > 5000) & (np.exp(logLam) < 5500)
+    templates /= np.median(templates[:, vband], axis=1)[:, None]
+    nfft = 2 ** int(np.ceil(np.log2(2 * logLam.size)))
+    ftemplates = np.fft.rfft(templates, nfft)
+
+    # Linear wavelength axis of the cube and its position on the rest-frame log grid
+    cdelt = (LMAX_OBS - LMIN_OBS) / (nwave - 1)
+    wave = LMIN_OBS + np.arange(nwave) * cdelt
+    pos = (np.log(wave / (1 + REDSHIFT)) - logLam[0]) / (VELSCALE / C)
+    ipos = np.floor(pos).astype(int)
+    frac = pos - ipos
+
+    amplitude = 100.0
+    data = np.zeros((nwave, nspax), dtype=np.float32)
+    stat = np.zeros((nwave, nspax), dtype=np.float32)
+    for start in range(0, nspax, BLOCKSIZE):
+        idx = np.arange(start, min(start + BLOCKSIZE, nspax))
+
+        # Stellar continuum
+        weights = np.column_stack([1 - fields["young"][idx], fields["young"][idx]])
+        spectra = broadenedSpectra(
+            ftemplates, weights, fields["v_star"][idx], fields["sigma_star"][idx], nfft
+        )
+        model = spectra[:, ipos] * (1 - frac) + spectra[:, ipos + 1] * frac
+        model *= amplitude * fields["continuum"][idx, None]
+
+        # Emission lines
+        flux_ha = amplitude * fields["continuum"][idx] * fields["ew_ha"][idx]
+        for lam, ratio in EMISSION_LINES:
+            centre = lam * (1 + REDSHIFT) * (1 + fields["v_gas"][idx] / C)
+            width = np.hypot(centre * fields["sigma_gas"][idx] / C, SIGMA_MUSE)
+            profile = np.exp(-0.5 * ((wave[None, :] - centre[:, None]) / width[:, None]) ** 2)
+            model += (ratio * flux_ha / (np.sqrt(2 * np.pi) * width))[:, None] * profile
+
+        # Photon and sky noise
+        variance = (model + 0.05 * amplitude) * amplitude / snr**2
+        data[:, idx] = (model + rng.normal(0.0, np.sqrt(variance))).T
+        stat[:, idx] = variance.T
+
+    # MUSE-like header
+    header = fits.Header()
+    header["CTYPE1"] = "RA---TAN"
+    header["CTYPE2"] = "DEC--TAN"
+    header["CTYPE3"] = "AWAV"
+    header["CUNIT1"] = "deg"
+    header["CUNIT2"] = "deg"
+    header["CUNIT3"] = "Angstrom"
+    header["CRPIX1"] = (nx + 1) / 2.0
+    header["CRPIX2"] = (ny + 1) / 2.0
+    header["CRPIX3"] = 1.0
+    header["CRVAL1"] = 150.0
+    header["CRVAL2"] = 2.0
+    header["CRVAL3"] = LMIN_OBS
+    header["CD1_1"] = -PIXELSIZE / 3600.0
+    header["CD1_2"] = 0.0
+    header["CD2_1"] = 0.0
+    header["CD2_2"] = PIXELSIZE / 3600.0
+    header["CD3_3"] = cdelt
+    header["CD1_3"] = 0.0
+    header["CD2_3"] = 0.0
+    header["CD3_1"] = 0.0
+    header["CD3_2"] = 0.0
+    header["BUNIT"] = "10**(-20)*erg/s/cm**2/Angstrom"
+
+    priHDU = fits.PrimaryHDU()
+    priHDU.header["OBJECT"] = "SYNTHETIC"
+    priHDU.header["NX"] = (nx, "Number of spaxels along x")
+    priHDU.header["NY"] = (ny, "Number of spaxels along y")
+    priHDU.header["SEED"] = (seed, "Seed of the noise")
+    dataHDU = fits.ImageHDU(data.reshape(nwave, ny, nx), header=header, name="DATA")
+    statHDU = fits.ImageHDU(stat.reshape(nwave, ny, nx), header=header, name="STAT")
+
+    # True kinematics and emission-line fluxes of the spaxels
+    cols = [
+        fits.Column(name=key.upper(), format="D", array=fields[key])
+        for key in ["v_star", "sigma_star", "v_gas", "sigma_gas", "young", "ew_ha"]
+    ]
+    truthHDU = fits.BinTableHDU.from_columns(cols, name="TRUTH")
+
+    fits.HDUList([priHDU, dataHDU, statHDU, truthHDU]).writeto(filename, overwrite=True)
+    return filename
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("filename", help="Output FITS file.")
+    parser.add_argument("--nx", type=int, default=30, help="Number of spaxels along x.")
+    parser.add_argument("--ny", type=int, default=30, help="Number of spaxels along y.")
+    parser.add_argument("--nwave", type=int, default=1921, help="Number of wavelength channels.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the noise.")
+    args = parser.parse_args()
+
+    makeCube(args.filename, args.nx, args.ny, args.nwave, args.seed)